@@ -1,54 +1,100 @@
+import os
+
 from flask import Flask
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_restful import Api
 
-from modelos import db
+from modelos import db, perfil_sqlite
 
 from vistas import (
     VistaIngrediente,
     VistaIngredientes,
+    VistaIngredientesLote,
+    VistaBusquedaIngredientes,
     VistaReceta,
     VistaRecetas,
+    VistaRecetasLote,
+    VistaBusquedaRecetas,
     VistaSignIn,
     VistaLogIn,
     VistaRestaurantes,
     VistaDetalleRestaurante,
     VistaMenuSemana,
+    VistaListaCompras,
     VistaChef,
     VistaDetalleChef,
     VistaChefs,
+    VistaMetricas,
+    VistaReporteMenu,
+    VistaReporteRestaurante,
+    VistaTrabajo,
+    VistaTrabajos,
+    cache_autorizacion,
+    cache_respuestas,
+    catalogo_ingredientes,
+    cola_trabajos,
+    instrumentacion,
 )
 
-app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///dbapp.sqlite"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["JWT_SECRET_KEY"] = "frase-secreta"
-app.config["PROPAGATE_EXCEPTIONS"] = True
+RUTAS = [
+    (VistaSignIn, "/signin"),
+    (VistaLogIn, "/login"),
+    (VistaIngredientes, "/ingredientes"),
+    (VistaIngredientesLote, "/ingredientes/lote"),
+    (VistaBusquedaIngredientes, "/ingredientes/buscar"),
+    (VistaIngrediente, "/ingrediente/<int:id_ingrediente>"),
+    (VistaRecetas, "/recetas/<int:id_usuario>"),
+    (VistaRecetasLote, "/recetas/<int:id_usuario>/lote"),
+    (VistaBusquedaRecetas, "/recetas/<int:id_usuario>/buscar"),
+    (VistaReceta, "/receta/<int:id_receta>"),
+    (VistaRestaurantes, "/restaurantes/<int:id_usuario>"),
+    (VistaDetalleRestaurante, "/restaurantes/<int:id_usuario>/<int:id_restaurante>"),
+    (VistaMenuSemana, "/menu-semana/<int:id_usuario>"),
+    (VistaListaCompras, "/menu-semana/<int:id_usuario>/lista-compras"),
+    (VistaDetalleChef, "/chef/<int:id_usuario>/<int:id_chef>"),
+    (VistaChef, "/chef/<int:id_usuario>"),
+    (VistaChefs, "/chefs/<int:id_usuario>"),
+    (
+        VistaReporteRestaurante,
+        "/reportes/<int:id_usuario>/restaurantes/<int:id_restaurante>",
+    ),
+    (VistaReporteMenu, "/reportes/<int:id_usuario>/menu-semana/<int:id_menu>"),
+    (VistaTrabajos, "/trabajos/<int:id_usuario>"),
+    (VistaTrabajo, "/trabajos/<int:id_usuario>/<int:id_trabajo>"),
+    (VistaMetricas, "/metricas"),
+]
 
-app_context = app.app_context()
-app_context.push()
 
-db.init_app(app)
-db.create_all()
+def crear_app(configuracion=None):
+    # Construir la aplicación no abre conexiones ni revisa el esquema: las
+    # tablas y migraciones se aplican una vez por despliegue con
+    # python -m modelos.migraciones
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+        "SQLALCHEMY_DATABASE_URI", "sqlite:///dbapp.sqlite"
+    )
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["JWT_SECRET_KEY"] = "frase-secreta"
+    app.config["PROPAGATE_EXCEPTIONS"] = True
+    app.config.update(configuracion or {})
 
-cors = CORS(app, resources={r"/*": {"origins": "*"}})
+    db.init_app(app)
+    perfil_sqlite.init_app(app, db)
+    cache_respuestas.init_app(app)
+    cache_autorizacion.init_app(app)
+    catalogo_ingredientes.init_app(app)
+    instrumentacion.init_app(app, db)
+    cola_trabajos.init_app(app)
 
-api = Api(app)
+    CORS(app, resources={r"/*": {"origins": "*"}})
+
+    api = Api(app)
+    for vista, ruta in RUTAS:
+        api.add_resource(vista, ruta)
+
+    JWTManager(app)
+    return app
 
-api.add_resource(VistaSignIn, "/signin")
-api.add_resource(VistaLogIn, "/login")
-api.add_resource(VistaIngredientes, "/ingredientes")
-api.add_resource(VistaIngrediente, "/ingrediente/<int:id_ingrediente>")
-api.add_resource(VistaRecetas, "/recetas/<int:id_usuario>")
-api.add_resource(VistaReceta, "/receta/<int:id_receta>")
-api.add_resource(VistaRestaurantes, "/restaurantes/<int:id_usuario>")
-api.add_resource(
-    VistaDetalleRestaurante, "/restaurantes/<int:id_usuario>/<int:id_restaurante>"
-)
-api.add_resource(VistaMenuSemana, "/menu-semana/<int:id_usuario>")
-api.add_resource(VistaDetalleChef, "/chef/<int:id_usuario>/<int:id_chef>")
-api.add_resource(VistaChef, "/chef/<int:id_usuario>")
-api.add_resource(VistaChefs, "/chefs/<int:id_usuario>")
 
-jwt = JWTManager(app)
+app = crear_app()
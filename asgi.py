@@ -0,0 +1,174 @@
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Response
+from flask_jwt_extended import verify_jwt_in_request
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+
+from app import app
+from modelos import db
+from vistas.asincronas import VISTAS_ASINCRONAS, sesiones_asincronas
+from vistas.flujos import solicita_ndjson_util
+
+
+class AplicacionASGI:
+    # Modo ASGI opcional sobre la misma tabla de rutas de app.py. Las lecturas
+    # que tienen vista asíncrona se atienden en el event loop con la sesión de
+    # aiosqlite; el resto de rutas ejecuta la aplicación WSGI en un pool de
+    # hilos. Se sirve con: uvicorn asgi:aplicacion
+    def __init__(self, app_flask, hilos=8):
+        self.app = app_flask
+        self.ejecutor = ThreadPoolExecutor(max_workers=hilos)
+        sesiones_asincronas.init_app(app_flask, db)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.ciclo_de_vida_util(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        cuerpo = b""
+        while True:
+            mensaje = await receive()
+            cuerpo += mensaje.get("body", b"")
+            if not mensaje.get("more_body"):
+                break
+        environ = environ_util(scope, cuerpo)
+
+        respuesta = await self.ejecutar_asincrona_util(environ)
+        if respuesta is None:
+            (
+                estado,
+                encabezados,
+                contenido,
+            ) = await asyncio.get_running_loop().run_in_executor(
+                self.ejecutor, self.ejecutar_wsgi_util, environ
+            )
+        else:
+            estado = respuesta.status_code
+            encabezados = list(respuesta.headers.items())
+            contenido = respuesta.get_data()
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": estado,
+                "headers": [
+                    (nombre.lower().encode("latin-1"), valor.encode("latin-1"))
+                    for nombre, valor in encabezados
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": contenido})
+
+    async def ejecutar_asincrona_util(self, environ):
+        adaptador = self.app.url_map.bind_to_environ(environ)
+        try:
+            endpoint, argumentos = adaptador.match()
+        except (HTTPException, RequestRedirect):
+            return None
+        vista = VISTAS_ASINCRONAS.get((endpoint, environ["REQUEST_METHOD"]))
+        if vista is None:
+            return None
+
+        with self.app.request_context(environ):
+            # Los errores de autenticación y las respuestas en streaming
+            # (NDJSON) los atiende la vista síncrona
+            if solicita_ndjson_util():
+                return None
+            try:
+                verify_jwt_in_request()
+            except Exception:
+                return None
+            respuesta = self.app.preprocess_request()
+            if respuesta is None:
+                async with sesiones_asincronas.sesion() as sesion:
+                    resultado = await vista(sesion, **argumentos)
+                if resultado is None:
+                    return None
+                respuesta = respuesta_util(resultado)
+            return self.app.process_response(respuesta)
+
+    def ejecutar_wsgi_util(self, environ):
+        # Se consume toda la respuesta en el mismo hilo, porque las respuestas
+        # en streaming usan el contexto y la sesión de ese hilo
+        estado_encabezados = []
+
+        def start_response(estado, encabezados, exc_info=None):
+            estado_encabezados[:] = [estado, encabezados]
+            return partes.append
+
+        partes = []
+        resultado = self.app(environ, start_response)
+        try:
+            for parte in resultado:
+                partes.append(parte)
+        finally:
+            if hasattr(resultado, "close"):
+                resultado.close()
+        estado, encabezados = estado_encabezados
+        return int(estado.split(" ", 1)[0]), encabezados, b"".join(partes)
+
+    async def ciclo_de_vida_util(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif mensaje["type"] == "lifespan.shutdown":
+                await sesiones_asincronas.cerrar()
+                self.ejecutor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def respuesta_util(resultado):
+    # Misma representación JSON que flask_restful para (datos, estado) o datos
+    if isinstance(resultado, Response):
+        return resultado
+    datos, estado = resultado, 200
+    if isinstance(resultado, tuple):
+        datos, estado = resultado[0], resultado[1]
+    return Response(
+        json.dumps(datos) + "\n", status=estado, mimetype="application/json"
+    )
+
+
+def environ_util(scope, cuerpo):
+    servidor = scope.get("server") or ("localhost", 80)
+    cliente = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": servidor[0],
+        "SERVER_PORT": str(servidor[1]),
+        "SERVER_PROTOCOL": "HTTP/{}".format(scope.get("http_version", "1.1")),
+        "REMOTE_ADDR": cliente[0],
+        "CONTENT_LENGTH": str(len(cuerpo)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(cuerpo),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for nombre, valor in scope.get("headers", []):
+        nombre = nombre.decode("latin-1").upper().replace("-", "_")
+        valor = valor.decode("latin-1")
+        if nombre in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[nombre] = valor
+            continue
+        llave = "HTTP_" + nombre
+        environ[llave] = environ[llave] + "," + valor if llave in environ else valor
+    return environ
+
+
+aplicacion = AplicacionASGI(app, hilos=int(os.environ.get("ASGI_HILOS", 8)))
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def hijo(modo):
+    # Corre en un proceso nuevo, como un worker de gunicorn al arrancar: mide
+    # la importación de la aplicación, la inicialización del esquema (solo en
+    # el modo "esquema", que reproduce el arranque anterior) y la primera
+    # solicitud, que paga las importaciones diferidas
+    inicio = time.perf_counter()
+    from app import app
+
+    importada = time.perf_counter()
+    marshmallow_al_importar = "marshmallow" in sys.modules
+    if modo == "esquema":
+        from modelos import db, inicializar_esquema
+
+        with app.app_context():
+            inicializar_esquema(db.engine)
+    esquema = time.perf_counter()
+
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        token = create_access_token(identity=1)
+    respuesta = app.test_client().get(
+        "/ingredientes?limit=20", headers={"Authorization": "Bearer " + token}
+    )
+    fin = time.perf_counter()
+
+    print(
+        json.dumps(
+            {
+                "importacion_ms": (importada - inicio) * 1000,
+                "esquema_ms": (esquema - importada) * 1000,
+                "primera_solicitud_ms": (fin - esquema) * 1000,
+                "total_ms": (fin - inicio) * 1000,
+                "estado": respuesta.status_code,
+                "marshmallow_al_importar": marshmallow_al_importar,
+            }
+        )
+    )
+
+
+def arrancar_util(modo, uri, trabajadores):
+    # Arranca varios procesos a la vez sobre la misma base, como gunicorn -w
+    entorno = dict(os.environ, SQLALCHEMY_DATABASE_URI=uri)
+    procesos = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.arranque", "--hijo", modo],
+            cwd=RAIZ,
+            env=entorno,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        for _ in range(trabajadores)
+    ]
+    mediciones = []
+    for proceso in procesos:
+        salida, _ = proceso.communicate()
+        mediciones.append(json.loads(salida.decode("utf-8").strip().splitlines()[-1]))
+    return mediciones
+
+
+def resumir_util(mediciones):
+    resumen = {}
+    for llave in ("importacion_ms", "esquema_ms", "primera_solicitud_ms", "total_ms"):
+        valores = sorted(medicion[llave] for medicion in mediciones)
+        resumen[llave] = {
+            "mediana": round(statistics.median(valores), 3),
+            "max": round(valores[-1], 3),
+        }
+    resumen["errores"] = sum(1 for medicion in mediciones if medicion["estado"] != 200)
+    resumen["marshmallow_al_importar"] = any(
+        medicion["marshmallow_al_importar"] for medicion in mediciones
+    )
+    return resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.arranque",
+        description=(
+            "Mide el arranque en frío de la aplicación: importación, esquema y "
+            "primera solicitud, con varios workers arrancando a la vez"
+        ),
+    )
+    parser.add_argument("--hijo", help=argparse.SUPPRESS)
+    parser.add_argument("--modos", default="esquema,perezoso")
+    parser.add_argument("--trabajadores", type=int, default=4)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="Archivo JSON para los resultados")
+    argumentos = parser.parse_args(argv)
+    if argumentos.hijo:
+        hijo(argumentos.hijo)
+        return 0
+
+    from sqlalchemy import create_engine
+
+    from .datos import ESCALAS, sembrar
+
+    uri = "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(prefix="arranque-"), "benchmark.sqlite"
+    )
+    motor = create_engine(uri)
+    sembrar(motor, ESCALAS["humo"], argumentos.semilla)
+    motor.dispose()
+
+    # Los modos se alternan en cada repetición para repartir el ruido de la
+    # máquina entre ambos
+    mediciones = {modo: [] for modo in argumentos.modos.split(",")}
+    for _ in range(argumentos.repeticiones):
+        for modo in mediciones:
+            mediciones[modo] += arrancar_util(modo, uri, argumentos.trabajadores)
+
+    resultados = {
+        "trabajadores": argumentos.trabajadores,
+        "repeticiones": argumentos.repeticiones,
+        "modos": {modo: resumir_util(valores) for modo, valores in mediciones.items()},
+    }
+    contenido = json.dumps(resultados, indent=2, ensure_ascii=False)
+    if argumentos.salida:
+        with open(argumentos.salida, "w") as archivo:
+            archivo.write(contenido + "\n")
+    else:
+        print(contenido)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
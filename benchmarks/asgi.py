@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine
+
+from .datos import ESCALAS, sembrar
+from .ejecutar import escenarios_util, resumir_util, solicitud_http_util
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Lecturas de E/S frecuentes; las cuatro primeras tienen vista asíncrona
+LECTURAS = [
+    "GET ingredientes pagina",
+    "GET ingrediente",
+    "GET recetas",
+    "GET receta",
+    "GET menu semana",
+]
+
+
+def comando_util(modo, puerto, trabajadores):
+    if modo == "wsgi":
+        # Igual que el Procfile
+        return [
+            "gunicorn",
+            "-w",
+            str(trabajadores),
+            "-b",
+            "127.0.0.1:{}".format(puerto),
+            "app:app",
+        ]
+    return [
+        "uvicorn",
+        "asgi:aplicacion",
+        "--workers",
+        str(trabajadores),
+        "--port",
+        str(puerto),
+        "--no-access-log",
+    ]
+
+
+def puerto_libre_util():
+    with socket.socket() as conexion:
+        conexion.bind(("127.0.0.1", 0))
+        return conexion.getsockname()[1]
+
+
+def esperar_servidor_util(url_base, proceso, segundos=30):
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        if proceso.poll() is not None:
+            raise RuntimeError("El servidor terminó al iniciar")
+        try:
+            urllib.request.urlopen(url_base + "/metricas").read()
+            return
+        except urllib.error.HTTPError:
+            # Cualquier respuesta HTTP indica que el servidor ya atiende
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("El servidor no respondió en {} s".format(segundos))
+
+
+def medir_modo(modo, uri, muestra, argumentos):
+    puerto = puerto_libre_util()
+    url_base = "http://127.0.0.1:{}".format(puerto)
+    entorno = dict(os.environ, SQLALCHEMY_DATABASE_URI=uri)
+    proceso = subprocess.Popen(
+        comando_util(modo, puerto, argumentos.trabajadores),
+        cwd=RAIZ,
+        env=entorno,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        esperar_servidor_util(url_base, proceso)
+        escenarios, contador = escenarios_util(muestra)
+        solicitud = urllib.request.Request(
+            url_base + "/login",
+            data=json.dumps(escenarios[0]["cuerpo"](None)).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(solicitud) as respuesta:
+            token = json.load(respuesta)["token"]
+        encabezados = {"Authorization": "Bearer {}".format(token)}
+
+        resultados = {}
+        with ThreadPoolExecutor(max_workers=argumentos.clientes) as ejecutor:
+            for escenario in escenarios:
+                if escenario["nombre"] not in LECTURAS:
+                    continue
+                inicio = time.perf_counter()
+                mediciones = list(
+                    ejecutor.map(
+                        lambda _: solicitud_http_util(
+                            url_base, escenario, encabezados, contador
+                        ),
+                        range(argumentos.iteraciones),
+                    )
+                )
+                resultados[escenario["nombre"]] = resumir_util(
+                    [latencia for latencia, _, _ in mediciones],
+                    [cantidad for _, _, cantidad in mediciones if cantidad is not None],
+                    sum(1 for _, estado, _ in mediciones if estado >= 400),
+                    time.perf_counter() - inicio,
+                )
+        return resultados
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.asgi",
+        description=(
+            "Compara las lecturas más frecuentes servidas con gunicorn (WSGI) "
+            "y con uvicorn (ASGI) bajo muchos clientes concurrentes"
+        ),
+    )
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--modos", default="wsgi,asgi")
+    parser.add_argument("--trabajadores", type=int, default=2)
+    parser.add_argument("--clientes", type=int, default=64)
+    parser.add_argument("--iteraciones", type=int, default=500)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="Archivo JSON para los resultados")
+    argumentos = parser.parse_args(argv)
+
+    uri = "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(prefix="asgi-"), "benchmark.sqlite"
+    )
+    motor = create_engine(uri)
+    muestra = sembrar(motor, ESCALAS[argumentos.escala], argumentos.semilla)
+    motor.dispose()
+
+    resultados = {
+        "escala": argumentos.escala,
+        "trabajadores": argumentos.trabajadores,
+        "clientes": argumentos.clientes,
+        "iteraciones": argumentos.iteraciones,
+        "modos": {
+            modo: medir_modo(modo, uri, muestra, argumentos)
+            for modo in argumentos.modos.split(",")
+        },
+    }
+
+    contenido = json.dumps(resultados, indent=2, ensure_ascii=False)
+    if argumentos.salida:
+        with open(argumentos.salida, "w") as archivo:
+            archivo.write(contenido + "\n")
+    else:
+        print(contenido)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import argparse
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+from .datos import ESCALAS, sembrar
+from .ejecutar import resumir_util
+
+INGREDIENTES_ESCRITOS = 50
+
+
+def trabajador(tipo, muestra, segundos, barrera, cola):
+    # Cada proceso importa su propia aplicación, como un worker de gunicorn, y
+    # espera en la barrera para que todos midan durante la misma ventana
+    from flask_jwt_extended import create_access_token
+
+    from app import app
+
+    logging.getLogger("restaurantes.instrumentacion").setLevel(logging.ERROR)
+    with app.app_context():
+        token = create_access_token(identity=muestra["administrador"]["id"])
+    encabezados = {"Authorization": "Bearer {}".format(token)}
+    cliente = app.test_client()
+
+    id_administrador = muestra["administrador"]["id"]
+    lecturas = [
+        "/recetas/{}".format(muestra["chef"]),
+        "/receta/{}".format(muestra["receta"]),
+        "/menu-semana/{}/lista-compras?menus={}".format(
+            id_administrador, ",".join(str(menu) for menu in muestra["menus"][:4])
+        ),
+    ]
+
+    latencias = []
+    errores = 0
+    bloqueos = 0
+    barrera.wait()
+    inicio = time.perf_counter()
+    fin = inicio + segundos
+    iteracion = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        while time.perf_counter() < fin:
+            iteracion += 1
+            inicio_solicitud = time.perf_counter()
+            try:
+                if tipo == "lectura":
+                    respuesta = cliente.get(
+                        lecturas[iteracion % len(lecturas)], headers=encabezados
+                    )
+                else:
+                    respuesta = cliente.put(
+                        "/ingrediente/{}".format(iteracion % INGREDIENTES_ESCRITOS + 1),
+                        json={
+                            "nombre": "Ingrediente {}".format(iteracion),
+                            "unidad": "gramo",
+                            "costo": 100 + iteracion % 1000,
+                            "calorias": 10,
+                            "sitio": "Mayorista",
+                        },
+                        headers=encabezados,
+                    )
+                respuesta.get_data()
+                if respuesta.status_code >= 400:
+                    errores += 1
+            except Exception as e:
+                # Con PROPAGATE_EXCEPTIONS el error de SQLite llega hasta aquí
+                errores += 1
+                if "locked" in str(e):
+                    bloqueos += 1
+            latencias.append((time.perf_counter() - inicio_solicitud) * 1000)
+
+    cola.put((tipo, latencias, errores, bloqueos, time.perf_counter() - inicio))
+
+
+def medir_perfil(perfil, escala, argumentos):
+    directorio = tempfile.mkdtemp(prefix="concurrencia-")
+    uri = "sqlite:///" + os.path.join(directorio, "benchmark.sqlite")
+    motor = create_engine(uri)
+    muestra = sembrar(motor, escala, argumentos.semilla)
+    motor.dispose()
+
+    # Los procesos hijos leen la configuración del entorno al importar app
+    os.environ["SQLALCHEMY_DATABASE_URI"] = uri
+    os.environ["DB_PERFIL"] = perfil
+
+    contexto = multiprocessing.get_context("spawn")
+    cola = contexto.Queue()
+    tipos = ["lectura"] * argumentos.lectores + ["escritura"] * argumentos.escritores
+    barrera = contexto.Barrier(len(tipos))
+    procesos = [
+        contexto.Process(
+            target=trabajador,
+            args=(tipo, muestra, argumentos.segundos, barrera, cola),
+        )
+        for tipo in tipos
+    ]
+    for proceso in procesos:
+        proceso.start()
+    mediciones = [cola.get() for _ in procesos]
+    for proceso in procesos:
+        proceso.join()
+
+    resultado = {}
+    for tipo in ("lectura", "escritura"):
+        del_tipo = [medicion for medicion in mediciones if medicion[0] == tipo]
+        resumen = resumir_util(
+            [latencia for medicion in del_tipo for latencia in medicion[1]],
+            [],
+            sum(medicion[2] for medicion in del_tipo),
+            max(medicion[4] for medicion in del_tipo),
+        )
+        resumen["bloqueos"] = sum(medicion[3] for medicion in del_tipo)
+        del resumen["consultas_promedio"], resumen["consultas_max"]
+        resultado[tipo] = resumen
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.concurrencia",
+        description=(
+            "Mide el rendimiento de lectura mientras otros procesos editan "
+            "ingredientes, para cada perfil de base de datos"
+        ),
+    )
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--perfiles", default="basico,produccion")
+    parser.add_argument("--lectores", type=int, default=4)
+    parser.add_argument("--escritores", type=int, default=1)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="Archivo JSON para los resultados")
+    argumentos = parser.parse_args(argv)
+    if argumentos.lectores < 1 or argumentos.escritores < 1:
+        parser.error("Se necesita al menos un lector y un escritor")
+
+    resultados = {
+        "escala": argumentos.escala,
+        "lectores": argumentos.lectores,
+        "escritores": argumentos.escritores,
+        "segundos": argumentos.segundos,
+        "perfiles": {
+            perfil: medir_perfil(perfil, ESCALAS[argumentos.escala], argumentos)
+            for perfil in argumentos.perfiles.split(",")
+        },
+    }
+
+    contenido = json.dumps(resultados, indent=2, ensure_ascii=False)
+    if argumentos.salida:
+        with open(argumentos.salida, "w") as archivo:
+            archivo.write(contenido + "\n")
+    else:
+        print(contenido)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+import hashlib
+import random
+from datetime import date, timedelta
+
+from modelos import (
+    EstadoTrabajo,
+    Ingrediente,
+    MenuReceta,
+    MenuSemana,
+    Receta,
+    RecetaIngrediente,
+    Restaurante,
+    Rol,
+    Trabajo,
+    Usuario,
+    inicializar_esquema,
+)
+from modelos.reportes import reconstruir_resumenes
+
+CONTRASENA = "benchmark"
+TAMANO_LOTE = 5000
+FECHA_INICIO = date(2018, 1, 1)
+
+UNIDADES = ["gramo", "kilogramo", "litro", "mililitro", "unidad", "taza"]
+SITIOS = ["Plaza central", "Supermercado", "Mayorista", "Tienda de barrio"]
+TIPOS_COMIDA = ["Italiana", "Mexicana", "Colombiana", "Vegetariana", "Asiática"]
+
+# Cantidades por administrador (restaurantes), por restaurante (chefs) y por
+# chef (recetas). Las semanas de menú son por restaurante
+ESCALAS = {
+    "humo": {
+        "administradores": 1,
+        "restaurantes": 2,
+        "chefs": 2,
+        "ingredientes": 300,
+        "recetas": 5,
+        "min_lineas": 5,
+        "max_lineas": 40,
+        "semanas": 8,
+        "recetas_menu": 5,
+    },
+    "pequena": {
+        "administradores": 3,
+        "restaurantes": 3,
+        "chefs": 3,
+        "ingredientes": 10000,
+        "recetas": 20,
+        "min_lineas": 5,
+        "max_lineas": 40,
+        "semanas": 104,
+        "recetas_menu": 7,
+    },
+    "grande": {
+        "administradores": 10,
+        "restaurantes": 5,
+        "chefs": 5,
+        "ingredientes": 100000,
+        "recetas": 40,
+        "min_lineas": 5,
+        "max_lineas": 40,
+        "semanas": 260,
+        "recetas_menu": 10,
+    },
+}
+
+
+def contrasena_util(contrasena):
+    return hashlib.md5(contrasena.encode("utf-8")).hexdigest()
+
+
+def insertar_util(conexion, tabla, filas):
+    for inicio in range(0, len(filas), TAMANO_LOTE):
+        conexion.execute(tabla.insert(), filas[inicio : inicio + TAMANO_LOTE])
+
+
+def sembrar(motor, escala, semilla=0):
+    # Crea el esquema y llena una base vacía con datos sintéticos. Los ids se
+    # asignan aquí para enlazar las tablas sin consultar, y con la misma semilla
+    # se generan siempre los mismos datos. Retorna ids de muestra para el driver
+    aleatorio = random.Random(semilla)
+    inicializar_esquema(motor)
+    contrasena = contrasena_util(CONTRASENA)
+
+    ingredientes = []
+    for id_ingrediente in range(1, escala["ingredientes"] + 1):
+        ingredientes.append(
+            {
+                "id": id_ingrediente,
+                "nombre": "Ingrediente {}".format(id_ingrediente),
+                "unidad": aleatorio.choice(UNIDADES),
+                "costo": aleatorio.randint(100, 50000),
+                "calorias": aleatorio.randint(0, 900),
+                "sitio": aleatorio.choice(SITIOS),
+            }
+        )
+
+    usuarios = []
+    restaurantes = []
+    recetas = []
+    lineas = []
+    menus = []
+    menus_recetas = []
+    chefs_por_restaurante = {}
+    recetas_por_restaurante = {}
+
+    for _ in range(escala["administradores"]):
+        id_administrador = len(usuarios) + 1
+        usuarios.append(
+            {
+                "id": id_administrador,
+                "usuario": "admin{}@benchmark.com".format(id_administrador),
+                "contrasena": contrasena,
+                "rol": Rol.ADMINISTRADOR,
+                "nombre": "Administrador {}".format(id_administrador),
+                "restaurante_id": None,
+            }
+        )
+        for _ in range(escala["restaurantes"]):
+            id_restaurante = len(restaurantes) + 1
+            restaurantes.append(
+                {
+                    "id": id_restaurante,
+                    "nombre": "Restaurante {}".format(id_restaurante),
+                    "direccion": "Calle {} # {}".format(
+                        aleatorio.randint(1, 200), aleatorio.randint(1, 99)
+                    ),
+                    "telefono": str(aleatorio.randint(3000000000, 3999999999)),
+                    "facebook": "",
+                    "twitter": "",
+                    "instagram": "",
+                    "hora_atencion": "8:00 - 22:00",
+                    "is_en_lugar": True,
+                    "is_domicilios": aleatorio.random() < 0.5,
+                    "tipo_comida": aleatorio.choice(TIPOS_COMIDA),
+                    "is_rappi": aleatorio.random() < 0.5,
+                    "is_didi": aleatorio.random() < 0.5,
+                    "administrador_id": id_administrador,
+                }
+            )
+            chefs_por_restaurante[id_restaurante] = []
+            recetas_por_restaurante[id_restaurante] = []
+            for _ in range(escala["chefs"]):
+                id_chef = len(usuarios) + 1
+                usuarios.append(
+                    {
+                        "id": id_chef,
+                        "usuario": "chef{}@benchmark.com".format(id_chef),
+                        "contrasena": contrasena,
+                        "rol": Rol.CHEF,
+                        "nombre": "Chef {}".format(id_chef),
+                        "restaurante_id": id_restaurante,
+                    }
+                )
+                chefs_por_restaurante[id_restaurante].append(id_chef)
+                for _ in range(escala["recetas"]):
+                    id_receta = len(recetas) + 1
+                    costo_total = 0
+                    calorias_total = 0
+                    cantidad_lineas = aleatorio.randint(
+                        escala["min_lineas"], escala["max_lineas"]
+                    )
+                    for ingrediente in aleatorio.sample(
+                        ingredientes, min(cantidad_lineas, len(ingredientes))
+                    ):
+                        cantidad = aleatorio.randint(1, 20)
+                        costo_total += cantidad * ingrediente["costo"]
+                        calorias_total += cantidad * ingrediente["calorias"]
+                        lineas.append(
+                            {
+                                "id": len(lineas) + 1,
+                                "cantidad": cantidad,
+                                "ingrediente": ingrediente["id"],
+                                "receta": id_receta,
+                            }
+                        )
+                    porcion = aleatorio.randint(1, 8)
+                    recetas.append(
+                        {
+                            "id": id_receta,
+                            "nombre": "Receta {}".format(id_receta),
+                            "duracion": aleatorio.randint(1, 6),
+                            "porcion": porcion,
+                            "preparacion": "Preparación de la receta {}".format(
+                                id_receta
+                            ),
+                            "costo_total": costo_total,
+                            "calorias_total": calorias_total,
+                            "costo_porcion": costo_total / porcion,
+                            "usuario": id_chef,
+                        }
+                    )
+                    recetas_por_restaurante[id_restaurante].append(id_receta)
+
+    # Semanas consecutivas y sin traslapes para cada restaurante
+    for id_restaurante, ids_recetas in recetas_por_restaurante.items():
+        for semana in range(escala["semanas"]):
+            id_menu = len(menus) + 1
+            fecha_inicial = FECHA_INICIO + timedelta(weeks=semana)
+            menus.append(
+                {
+                    "id": id_menu,
+                    "nombre": "Menu {} semana {}".format(id_restaurante, semana + 1),
+                    "fecha_inicial": fecha_inicial,
+                    "fecha_final": fecha_inicial + timedelta(days=6),
+                    "id_restaurante": id_restaurante,
+                    "id_usuario": aleatorio.choice(
+                        chefs_por_restaurante[id_restaurante]
+                    ),
+                }
+            )
+            for id_receta in aleatorio.sample(
+                ids_recetas, min(escala["recetas_menu"], len(ids_recetas))
+            ):
+                menus_recetas.append(
+                    {"id": len(menus_recetas) + 1, "menu": id_menu, "receta": id_receta}
+                )
+
+    with motor.begin() as conexion:
+        insertar_util(conexion, Ingrediente.__table__, ingredientes)
+        insertar_util(conexion, Usuario.__table__, usuarios)
+        insertar_util(conexion, Restaurante.__table__, restaurantes)
+        insertar_util(conexion, Receta.__table__, recetas)
+        insertar_util(conexion, RecetaIngrediente.__table__, lineas)
+        insertar_util(conexion, MenuSemana.__table__, menus)
+        insertar_util(conexion, MenuReceta.__table__, menus_recetas)
+        # Un trabajo terminado para los escenarios de consulta de estado
+        insertar_util(
+            conexion,
+            Trabajo.__table__,
+            [
+                {
+                    "id": 1,
+                    "tipo": "recalcular_totales_ingredientes",
+                    "parametros": "{}",
+                    "estado": EstadoTrabajo.COMPLETADO,
+                    "intentos": 1,
+                    "resultado": "{}",
+                    "id_usuario": usuarios[0]["id"],
+                }
+            ],
+        )
+        # Las inserciones directas no pasan por la sesión que mantiene los
+        # resúmenes de los reportes
+        reconstruir_resumenes(conexion)
+
+    primer_restaurante = restaurantes[0]["id"]
+    return {
+        "conteos": {
+            "usuario": len(usuarios),
+            "restaurante": len(restaurantes),
+            "ingrediente": len(ingredientes),
+            "receta": len(recetas),
+            "receta_ingrediente": len(lineas),
+            "menu_semana": len(menus),
+            "menu_receta": len(menus_recetas),
+        },
+        "administrador": usuarios[0],
+        "restaurante": primer_restaurante,
+        "chef": chefs_por_restaurante[primer_restaurante][0],
+        "ingrediente": ingredientes[len(ingredientes) // 2],
+        "receta": recetas_por_restaurante[primer_restaurante][0],
+        "recetas_restaurante": recetas_por_restaurante[primer_restaurante],
+        "menus": [
+            menu["id"] for menu in menus if menu["id_restaurante"] == primer_restaurante
+        ],
+        "trabajo": 1,
+        "fecha_libre": FECHA_INICIO + timedelta(weeks=escala["semanas"]),
+    }
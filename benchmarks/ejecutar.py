@@ -0,0 +1,523 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from sqlalchemy import create_engine
+
+from .datos import CONTRASENA, ESCALAS, sembrar
+
+PATRON_CONSULTAS = re.compile(r'desc="(\d+) consultas"')
+
+
+def escenarios_util(muestra):
+    # Un escenario por método y ruta. Los de lectura también se ejecutan en el
+    # driver HTTP concurrente; los de escritura solo en el cliente de pruebas,
+    # con un contador para que cada iteración cree registros distintos
+    id_administrador = muestra["administrador"]["id"]
+    ingrediente = muestra["ingrediente"]
+    contador = itertools.count(1)
+    menus = ",".join(str(id_menu) for id_menu in muestra["menus"][:4])
+
+    def cuerpo_ingrediente(_):
+        return {
+            "nombre": ingrediente["nombre"],
+            "unidad": ingrediente["unidad"],
+            "costo": ingrediente["costo"],
+            "calorias": ingrediente["calorias"],
+            "sitio": ingrediente["sitio"],
+        }
+
+    def cuerpo_nuevo_ingrediente(i):
+        return dict(cuerpo_ingrediente(i), nombre="Nuevo ingrediente {}".format(i))
+
+    def cuerpo_receta(i):
+        return {
+            "nombre": "Receta benchmark {}".format(i),
+            "preparacion": "Mezclar",
+            "duracion": 1,
+            "porcion": 2,
+            "ingredientes": [
+                {"id": "", "cantidad": 3, "idIngrediente": ingrediente["id"]},
+                {"id": "", "cantidad": 1, "idIngrediente": 1},
+            ],
+        }
+
+    def cuerpo_recetas_lote(i):
+        return {
+            "recetas": [cuerpo_receta("{}-{}".format(i, j)) for j in range(5)],
+            "clonar": muestra["recetas_restaurante"][:5],
+        }
+
+    def cuerpo_restaurante(i):
+        return {
+            "nombre": "Restaurante benchmark {}".format(i),
+            "direccion": "Calle 1",
+            "telefono": "3000000000",
+            "hora_atencion": "8:00 - 22:00",
+            "facebook": "",
+            "instagram": "",
+            "twitter": "",
+            "tipo_comida": "Italiana",
+            "is_en_lugar": True,
+            "is_rappi": False,
+            "is_didi": False,
+            "is_domicilios": False,
+        }
+
+    def cuerpo_menu(i):
+        fecha_inicial = muestra["fecha_libre"] + timedelta(weeks=i)
+        return {
+            "nombre": "Menu benchmark {}".format(i),
+            "id_restaurante": muestra["restaurante"],
+            "fechaInicial": fecha_inicial.isoformat(),
+            "fechaFinal": (fecha_inicial + timedelta(days=6)).isoformat(),
+            "recetas": [
+                {"id": id_receta} for id_receta in muestra["recetas_restaurante"][:5]
+            ],
+        }
+
+    def cuerpo_usuario(i):
+        return {
+            "usuario": "nuevo{}@benchmark.com".format(i),
+            "contrasena": CONTRASENA,
+            "confirmacion": CONTRASENA,
+            "nombre": "Chef benchmark {}".format(i),
+            "restaurante_id": muestra["restaurante"],
+        }
+
+    def cuerpo_login(_):
+        return {
+            "usuario": muestra["administrador"]["usuario"],
+            "contrasena": CONTRASENA,
+        }
+
+    lecturas = [
+        ("POST login", "POST", "/login", cuerpo_login),
+        ("GET ingredientes", "GET", "/ingredientes", None),
+        ("GET ingredientes pagina", "GET", "/ingredientes?limit=100", None),
+        ("GET ingrediente", "GET", "/ingrediente/{}".format(ingrediente["id"]), None),
+        (
+            "GET buscar ingredientes",
+            "GET",
+            "/ingredientes/buscar?q={}".format(ingrediente["nombre"].split()[-1]),
+            None,
+        ),
+        ("GET ingredientes lote", "GET", "/ingredientes/lote?formato=ndjson", None),
+        ("GET recetas", "GET", "/recetas/{}".format(muestra["chef"]), None),
+        ("GET receta", "GET", "/receta/{}".format(muestra["receta"]), None),
+        (
+            "GET buscar recetas",
+            "GET",
+            "/recetas/{}/buscar?q=prepar".format(muestra["chef"]),
+            None,
+        ),
+        ("GET restaurantes", "GET", "/restaurantes/{}".format(id_administrador), None),
+        (
+            "GET restaurante",
+            "GET",
+            "/restaurantes/{}/{}".format(id_administrador, muestra["restaurante"]),
+            None,
+        ),
+        ("GET menu semana", "GET", "/menu-semana/{}".format(id_administrador), None),
+        (
+            "GET lista compras",
+            "GET",
+            "/menu-semana/{}/lista-compras?menus={}".format(id_administrador, menus),
+            None,
+        ),
+        (
+            "GET reporte restaurante",
+            "GET",
+            "/reportes/{}/restaurantes/{}".format(
+                id_administrador, muestra["restaurante"]
+            ),
+            None,
+        ),
+        (
+            "GET reporte menu",
+            "GET",
+            "/reportes/{}/menu-semana/{}".format(id_administrador, muestra["menus"][0]),
+            None,
+        ),
+        ("GET chefs", "GET", "/chefs/{}".format(id_administrador), None),
+        (
+            "GET chef",
+            "GET",
+            "/chef/{}/{}".format(id_administrador, muestra["chef"]),
+            None,
+        ),
+        ("GET trabajos", "GET", "/trabajos/{}".format(id_administrador), None),
+        (
+            "GET trabajo",
+            "GET",
+            "/trabajos/{}/{}".format(id_administrador, muestra["trabajo"]),
+            None,
+        ),
+        ("GET metricas", "GET", "/metricas", None),
+    ]
+    escrituras = [
+        ("POST signin", "POST", "/signin", cuerpo_usuario),
+        ("POST ingredientes", "POST", "/ingredientes", cuerpo_nuevo_ingrediente),
+        (
+            "PUT ingrediente",
+            "PUT",
+            "/ingrediente/{}".format(ingrediente["id"]),
+            cuerpo_ingrediente,
+        ),
+        ("POST recetas", "POST", "/recetas/{}".format(muestra["chef"]), cuerpo_receta),
+        (
+            "POST recetas lote",
+            "POST",
+            "/recetas/{}/lote".format(muestra["chef"]),
+            cuerpo_recetas_lote,
+        ),
+        (
+            "PUT receta",
+            "PUT",
+            "/receta/{}".format(muestra["recetas_restaurante"][-1]),
+            cuerpo_receta,
+        ),
+        (
+            "POST restaurantes",
+            "POST",
+            "/restaurantes/{}".format(id_administrador),
+            cuerpo_restaurante,
+        ),
+        (
+            "POST menu semana",
+            "POST",
+            "/menu-semana/{}".format(id_administrador),
+            cuerpo_menu,
+        ),
+        ("POST chef", "POST", "/chef/{}".format(id_administrador), cuerpo_usuario),
+    ]
+
+    escenarios = []
+    for lectura, lista in ((True, lecturas), (False, escrituras)):
+        for nombre, metodo, ruta, cuerpo in lista:
+            escenarios.append(
+                {
+                    "nombre": nombre,
+                    "metodo": metodo,
+                    "ruta": ruta,
+                    "cuerpo": cuerpo,
+                    "lectura": lectura,
+                }
+            )
+    return escenarios, contador
+
+
+def endpoints_sin_escenario_util(app, escenarios):
+    adaptador = app.url_map.bind("localhost")
+    cubiertos = set()
+    for escenario in escenarios:
+        endpoint, _ = adaptador.match(
+            escenario["ruta"].split("?")[0], method=escenario["metodo"]
+        )
+        cubiertos.add(endpoint)
+    registrados = {regla.endpoint for regla in app.url_map.iter_rules()}
+    return sorted(registrados - cubiertos - {"static"})
+
+
+def percentil_util(valores_ordenados, percentil):
+    # Percentil por rango más cercano sobre una lista ya ordenada
+    if not valores_ordenados:
+        return None
+    posicion = max(0, -(-percentil * len(valores_ordenados) // 100) - 1)
+    return valores_ordenados[int(posicion)]
+
+
+def resumir_util(latencias_ms, consultas, errores, duracion_s):
+    ordenadas = sorted(latencias_ms)
+    return {
+        "solicitudes": len(ordenadas),
+        "errores": errores,
+        "p50_ms": redondear_util(percentil_util(ordenadas, 50)),
+        "p95_ms": redondear_util(percentil_util(ordenadas, 95)),
+        "p99_ms": redondear_util(percentil_util(ordenadas, 99)),
+        "max_ms": redondear_util(ordenadas[-1] if ordenadas else None),
+        "rendimiento_rps": round(len(ordenadas) / duracion_s, 2)
+        if duracion_s
+        else None,
+        "consultas_promedio": (
+            round(sum(consultas) / len(consultas), 2) if consultas else None
+        ),
+        "consultas_max": max(consultas) if consultas else None,
+    }
+
+
+def redondear_util(valor):
+    return None if valor is None else round(valor, 3)
+
+
+def consultas_util(server_timing):
+    coincidencia = PATRON_CONSULTAS.search(server_timing or "")
+    return int(coincidencia.group(1)) if coincidencia else None
+
+
+def rss_pico_kb_util():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # En macOS ru_maxrss está en bytes y en Linux en kilobytes
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def medir_cliente(app, escenarios, contador, encabezados, iteraciones, calentamiento):
+    resultados = {}
+    cliente = app.test_client()
+    for escenario in escenarios:
+        latencias = []
+        consultas = []
+        errores = 0
+        inicio_escenario = time.perf_counter()
+        for iteracion in range(calentamiento + iteraciones):
+            cuerpo = escenario["cuerpo"]
+            inicio = time.perf_counter()
+            respuesta = cliente.open(
+                escenario["ruta"],
+                method=escenario["metodo"],
+                json=cuerpo(next(contador)) if cuerpo else None,
+                headers=encabezados,
+            )
+            respuesta.get_data()
+            duracion_ms = (time.perf_counter() - inicio) * 1000
+            if iteracion < calentamiento:
+                inicio_escenario = time.perf_counter()
+                continue
+            latencias.append(duracion_ms)
+            if respuesta.status_code >= 400:
+                errores += 1
+            cantidad = consultas_util(respuesta.headers.get("Server-Timing"))
+            if cantidad is not None:
+                consultas.append(cantidad)
+        resultados[escenario["nombre"]] = resumir_util(
+            latencias, consultas, errores, time.perf_counter() - inicio_escenario
+        )
+    return resultados
+
+
+def solicitud_http_util(url_base, escenario, encabezados, contador):
+    cuerpo = escenario["cuerpo"]
+    datos = None
+    encabezados = dict(encabezados)
+    if cuerpo:
+        datos = json.dumps(cuerpo(next(contador))).encode("utf-8")
+        encabezados["Content-Type"] = "application/json"
+    solicitud = urllib.request.Request(
+        url_base + escenario["ruta"],
+        data=datos,
+        method=escenario["metodo"],
+        headers=encabezados,
+    )
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(solicitud) as respuesta:
+            respuesta.read()
+            estado = respuesta.status
+            server_timing = respuesta.headers.get("Server-Timing")
+    except urllib.error.HTTPError as e:
+        e.read()
+        estado = e.code
+        server_timing = e.headers.get("Server-Timing")
+    return (time.perf_counter() - inicio) * 1000, estado, consultas_util(server_timing)
+
+
+def medir_http(app, escenarios, contador, encabezados, iteraciones, hilos):
+    # Servidor WSGI local con un hilo por solicitud y un pool de clientes que
+    # envían las solicitudes de cada escenario de lectura en paralelo
+    from werkzeug.serving import make_server
+
+    servidor = make_server("127.0.0.1", 0, app, threaded=True)
+    hilo_servidor = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo_servidor.start()
+    url_base = "http://127.0.0.1:{}".format(servidor.server_port)
+
+    resultados = {}
+    try:
+        with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+            for escenario in escenarios:
+                if not escenario["lectura"]:
+                    continue
+                inicio = time.perf_counter()
+                mediciones = list(
+                    ejecutor.map(
+                        lambda _: solicitud_http_util(
+                            url_base, escenario, encabezados, contador
+                        ),
+                        range(iteraciones),
+                    )
+                )
+                duracion_s = time.perf_counter() - inicio
+                resultados[escenario["nombre"]] = resumir_util(
+                    [latencia for latencia, _, _ in mediciones],
+                    [cantidad for _, _, cantidad in mediciones if cantidad is not None],
+                    sum(1 for _, estado, _ in mediciones if estado >= 400),
+                    duracion_s,
+                )
+    finally:
+        servidor.shutdown()
+    return resultados
+
+
+def comparar(resultados, linea_base, tolerancia):
+    # Compara el p95 de cada escenario con la línea base; una regresión es un
+    # p95 mayor que el de la línea base multiplicado por la tolerancia
+    comparaciones = []
+    for driver in ("cliente", "http"):
+        for nombre, actual in resultados.get(driver, {}).items():
+            base = linea_base.get(driver, {}).get(nombre)
+            if not base or not base.get("p95_ms") or actual["p95_ms"] is None:
+                continue
+            razon = actual["p95_ms"] / base["p95_ms"]
+            comparaciones.append(
+                {
+                    "driver": driver,
+                    "escenario": nombre,
+                    "p95_base_ms": base["p95_ms"],
+                    "p95_actual_ms": actual["p95_ms"],
+                    "razon": round(razon, 3),
+                    "regresion": razon > tolerancia,
+                }
+            )
+    return comparaciones
+
+
+def leer_argumentos_util(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.ejecutar",
+        description="Siembra una base SQLite sintética y mide todos los endpoints",
+    )
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    for parametro in ESCALAS["humo"]:
+        parser.add_argument(
+            "--{}".format(parametro.replace("_", "-")), dest=parametro, type=int
+        )
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument(
+        "--base-datos", help="Archivo SQLite; se recrea en cada corrida"
+    )
+    parser.add_argument("--iteraciones", type=int, default=50)
+    parser.add_argument("--calentamiento", type=int, default=3)
+    parser.add_argument("--hilos", type=int, default=8)
+    parser.add_argument("--sin-http", action="store_true")
+    parser.add_argument("--salida", help="Archivo JSON para los resultados")
+    parser.add_argument("--linea-base", help="Resultados JSON de una corrida anterior")
+    parser.add_argument("--tolerancia", type=float, default=1.2)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argumentos = leer_argumentos_util(argv)
+    escala = dict(ESCALAS[argumentos.escala])
+    for parametro in escala:
+        if getattr(argumentos, parametro) is not None:
+            escala[parametro] = getattr(argumentos, parametro)
+
+    ruta_base_datos = os.path.abspath(
+        argumentos.base_datos
+        or os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "benchmark.sqlite")
+    )
+    # Con la base se descarta el catálogo de ingredientes que quedó a su lado
+    for sufijo in ("", "-catalogo"):
+        if os.path.exists(ruta_base_datos + sufijo):
+            os.remove(ruta_base_datos + sufijo)
+    uri = "sqlite:///" + ruta_base_datos
+
+    inicio = time.perf_counter()
+    motor = create_engine(uri)
+    muestra = sembrar(motor, escala, argumentos.semilla)
+    motor.dispose()
+    tiempo_siembra_s = time.perf_counter() - inicio
+
+    # La aplicación toma la base de datos del entorno al importarse
+    os.environ["SQLALCHEMY_DATABASE_URI"] = uri
+    from app import app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    logging.getLogger("restaurantes.instrumentacion").setLevel(logging.ERROR)
+
+    escenarios, contador = escenarios_util(muestra)
+    resultados = {
+        "escala": argumentos.escala,
+        "parametros": escala,
+        "semilla": argumentos.semilla,
+        "conteos": muestra["conteos"],
+        "entorno": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+        },
+        "tiempo_siembra_s": round(tiempo_siembra_s, 3),
+        "endpoints_sin_escenario": endpoints_sin_escenario_util(app, escenarios),
+    }
+
+    # Las vistas imprimen en stdout; se descarta para no mezclarlo con el reporte
+    with contextlib.redirect_stdout(io.StringIO()):
+        cliente = app.test_client()
+        respuesta = cliente.post(
+            "/login", json=escenarios[0]["cuerpo"](None)
+        ).get_json()
+        encabezados = {"Authorization": "Bearer {}".format(respuesta["token"])}
+
+        resultados["cliente"] = medir_cliente(
+            app,
+            escenarios,
+            contador,
+            encabezados,
+            argumentos.iteraciones,
+            argumentos.calentamiento,
+        )
+        if not argumentos.sin_http:
+            resultados["http"] = medir_http(
+                app,
+                escenarios,
+                contador,
+                encabezados,
+                argumentos.iteraciones,
+                argumentos.hilos,
+            )
+    resultados["rss_pico_kb"] = rss_pico_kb_util()
+
+    regresiones = []
+    if argumentos.linea_base:
+        with open(argumentos.linea_base) as archivo:
+            linea_base = json.load(archivo)
+        resultados["comparacion"] = comparar(
+            resultados, linea_base, argumentos.tolerancia
+        )
+        regresiones = [c for c in resultados["comparacion"] if c["regresion"]]
+
+    contenido = json.dumps(resultados, indent=2, ensure_ascii=False)
+    if argumentos.salida:
+        with open(argumentos.salida, "w") as archivo:
+            archivo.write(contenido + "\n")
+    else:
+        print(contenido)
+
+    for regresion in regresiones:
+        print(
+            "Regresión en {driver} / {escenario}: p95 {p95_base_ms} ms -> "
+            "{p95_actual_ms} ms".format(**regresion),
+            file=sys.stderr,
+        )
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine
+
+from .datos import ESCALAS, sembrar
+
+FORMATOS = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+
+def recorrer_util(cliente, ruta, encabezados):
+    # Recorre la respuesta sin bufferizarla, como un cliente que la consume a
+    # medida que llega
+    inicio = time.perf_counter()
+    respuesta = cliente.get(ruta, headers=encabezados, buffered=False)
+    primer_fragmento = None
+    bytes_totales = 0
+    for fragmento in respuesta.response:
+        if primer_fragmento is None:
+            primer_fragmento = time.perf_counter()
+        bytes_totales += len(fragmento)
+    fin = time.perf_counter()
+    respuesta.close()
+    return respuesta.status_code, primer_fragmento or fin, fin, inicio, bytes_totales
+
+
+def medir_util(cliente, ruta, encabezados, formato):
+    # La caché de respuestas se invalida para medir siempre la consulta y la
+    # serialización. Los tiempos se toman sin tracemalloc, que los distorsiona,
+    # y la memoria pico en una segunda pasada
+    from vistas import cache_respuestas
+
+    encabezados = dict(encabezados, Accept=FORMATOS[formato])
+    cache_respuestas.invalidar("ingrediente")
+    estado, primer_fragmento, fin, inicio, bytes_totales = recorrer_util(
+        cliente, ruta, encabezados
+    )
+    cache_respuestas.invalidar("ingrediente")
+    tracemalloc.start()
+    recorrer_util(cliente, ruta, encabezados)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "estado": estado,
+        "primer_fragmento_ms": round((primer_fragmento - inicio) * 1000, 3),
+        "total_ms": round((fin - inicio) * 1000, 3),
+        "bytes": bytes_totales,
+        "memoria_pico_kb": round(pico / 1024, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.flujo",
+        description=(
+            "Compara la memoria pico y el tiempo al primer byte de los listados "
+            "en JSON y en NDJSON (streaming)"
+        ),
+    )
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--ingredientes", type=int)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="Archivo JSON para los resultados")
+    argumentos = parser.parse_args(argv)
+
+    escala = dict(ESCALAS[argumentos.escala])
+    if argumentos.ingredientes is not None:
+        escala["ingredientes"] = argumentos.ingredientes
+    uri = "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(prefix="flujo-"), "benchmark.sqlite"
+    )
+    motor = create_engine(uri)
+    muestra = sembrar(motor, escala, argumentos.semilla)
+    motor.dispose()
+
+    # La aplicación toma la base de datos del entorno al importarse
+    os.environ["SQLALCHEMY_DATABASE_URI"] = uri
+    from app import app
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        token = create_access_token(identity=muestra["administrador"]["id"])
+    encabezados = {"Authorization": "Bearer {}".format(token)}
+    rutas = {
+        "ingredientes": "/ingredientes",
+        "recetas": "/recetas/{}".format(muestra["chef"]),
+        "menu semana": "/menu-semana/{}".format(muestra["administrador"]["id"]),
+    }
+
+    resultados = {"escala": argumentos.escala, "parametros": escala, "rutas": {}}
+    with contextlib.redirect_stdout(io.StringIO()):
+        cliente = app.test_client()
+        for nombre, ruta in rutas.items():
+            # Una solicitud previa para no medir la compilación de los schemas
+            cliente.get(ruta, headers=encabezados).close()
+            resultados["rutas"][nombre] = {
+                formato: medir_util(cliente, ruta, encabezados, formato)
+                for formato in FORMATOS
+            }
+
+    contenido = json.dumps(resultados, indent=2, ensure_ascii=False)
+    if argumentos.salida:
+        with open(argumentos.salida, "w") as archivo:
+            archivo.write(contenido + "\n")
+    else:
+        print(contenido)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+# gunicorn lee este archivo desde el directorio de trabajo. Con preload_app el
+# master importa la aplicación una sola vez y los workers la heredan al hacer
+# fork; crear_app no abre conexiones, así que ninguna se comparte entre procesos
+preload_app = True
+
+
+def pre_fork(server, worker):
+    from vistas import schemas
+
+    schemas.precargar()
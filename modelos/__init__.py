@@ -1 +1,38 @@
+import importlib
+
 from .modelos import *
+from .migraciones import aplicar_migraciones, inicializar_esquema
+from .perfil import PerfilSQLite, perfil_sqlite
+from .versiones import incrementar_versiones, leer_versiones
+
+# marshmallow y los schemas son lo más costoso de importar, así que se cargan
+# en el primer acceso (p. ej. from modelos import RecetaSchema) y no al
+# arrancar cada worker o comando
+PEREZOSOS = {
+    "RestauranteSchema": ".esquemas",
+    "IngredienteSchema": ".esquemas",
+    "RecetaIngredienteSchema": ".esquemas",
+    "RecetaSchema": ".esquemas",
+    "UsuarioSchema": ".esquemas",
+    "MenuRecetaSchema": ".esquemas",
+    "MenuSemanaSchema": ".esquemas",
+    "SerializadorCompilado": ".serializacion",
+}
+
+
+def __getattr__(nombre):
+    if nombre not in PEREZOSOS:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, nombre)
+        )
+    valor = getattr(importlib.import_module(PEREZOSOS[nombre], __name__), nombre)
+    globals()[nombre] = valor
+    return valor
+
+
+def serializador_para(schema):
+    # Quien tiene un schema ya importó marshmallow; el serializador se importa
+    # aquí para no cargarlo antes
+    from .serializacion import serializador_para as serializador
+
+    return serializador(schema)
@@ -0,0 +1,96 @@
+from marshmallow import fields
+from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
+
+from .modelos import (
+    Ingrediente,
+    MenuReceta,
+    MenuSemana,
+    Receta,
+    RecetaIngrediente,
+    Restaurante,
+    Usuario,
+)
+
+
+class RestauranteSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = Restaurante
+        include_relationships = True
+        include_fk = True
+        load_instance = True
+
+    id = fields.String()
+    chefs = fields.List(fields.Nested("UsuarioSchema"))
+    menu_semana = fields.List(fields.Nested("MenuSemanaSchema"))
+
+
+class IngredienteSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = Ingrediente
+        load_instance = True
+
+    id = fields.String()
+    costo = fields.String()
+    calorias = fields.String()
+
+
+class RecetaIngredienteSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = RecetaIngrediente
+        include_relationships = True
+        include_fk = True
+        load_instance = True
+
+    id = fields.String()
+    cantidad = fields.String()
+    ingrediente = fields.String()
+
+
+class RecetaSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = Receta
+        include_relationships = True
+        include_fk = True
+        load_instance = True
+
+    id = fields.String()
+    duracion = fields.String()
+    porcion = fields.String()
+    costo_total = fields.String()
+    calorias_total = fields.String()
+    costo_porcion = fields.String()
+    ingredientes = fields.List(fields.Nested(RecetaIngredienteSchema()))
+
+
+class UsuarioSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = Usuario
+        include_relationships = True
+        load_instance = True
+
+    id = fields.String()
+    rol = fields.String()
+
+
+class MenuRecetaSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = MenuReceta
+        include_relationships = True
+        include_fk = True
+        load_instance = True
+
+    receta = fields.String()
+
+
+class MenuSemanaSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = MenuSemana
+        include_relationships = True
+        load_instance = True
+
+    id = fields.String()
+    nombre = fields.String()
+    fecha_inicial = fields.Date()
+    fecha_final = fields.Date()
+    recetas = fields.List(fields.Nested(MenuRecetaSchema()))
+    usuario = fields.Nested(UsuarioSchema())
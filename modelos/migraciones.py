@@ -0,0 +1,281 @@
+import os
+import sys
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    func,
+    inspect,
+    text,
+)
+from sqlalchemy.exc import IntegrityError
+
+metadata_migraciones = MetaData()
+
+tabla_migracion = Table(
+    "migracion",
+    metadata_migraciones,
+    Column("version", Integer, primary_key=True),
+    Column("nombre", String(128)),
+    Column("aplicada", DateTime, server_default=func.current_timestamp()),
+)
+
+# (nombre, tabla, columnas, único). Coinciden con los índices declarados en
+# modelos.py, que db.create_all solo crea en bases nuevas
+INDICES = [
+    ("ix_usuario_usuario", "usuario", ("usuario",), True),
+    ("ix_usuario_restaurante_id", "usuario", ("restaurante_id",), False),
+    ("ix_receta_usuario", "receta", ("usuario",), False),
+    ("ix_receta_ingrediente_receta", "receta_ingrediente", ("receta",), False),
+    (
+        "ix_receta_ingrediente_ingrediente",
+        "receta_ingrediente",
+        ("ingrediente",),
+        False,
+    ),
+    ("ix_menu_receta_menu", "menu_receta", ("menu",), False),
+    ("ix_menu_receta_receta", "menu_receta", ("receta",), False),
+    ("ix_menu_semana_nombre", "menu_semana", ("nombre",), False),
+    ("ix_menu_semana_id_usuario", "menu_semana", ("id_usuario",), False),
+    (
+        "ix_menu_semana_restaurante_fechas",
+        "menu_semana",
+        ("id_restaurante", "fecha_inicial", "fecha_final"),
+        False,
+    ),
+    (
+        "ix_restaurante_administrador_nombre",
+        "restaurante",
+        ("administrador_id", "nombre"),
+        False,
+    ),
+    ("ix_ingrediente_nombre", "ingrediente", ("nombre",), False),
+    (
+        "ix_resumen_menu_restaurante_fecha",
+        "resumen_menu",
+        ("restaurante", "fecha_inicial"),
+        False,
+    ),
+    (
+        "ix_resumen_restaurante_ingrediente_usos",
+        "resumen_restaurante_ingrediente",
+        ("restaurante", "usos"),
+        False,
+    ),
+    (
+        "ix_trabajo_estado_disponible",
+        "trabajo",
+        ("estado", "disponible_en"),
+        False,
+    ),
+    ("ix_trabajo_id_usuario", "trabajo", ("id_usuario",), False),
+]
+
+# (tabla FTS5, tabla de contenido, columnas indexadas). El tokenizador quita
+# tildes y diéresis, y los índices de prefijos de 2 y 3 caracteres aceleran
+# las búsquedas por prefijo
+BUSQUEDAS = [
+    ("ingrediente_fts", "ingrediente", ("nombre", "sitio")),
+    ("receta_fts", "receta", ("nombre", "preparacion")),
+]
+
+
+def agregar_totales_receta(conexion):
+    columnas = {columna["name"] for columna in inspect(conexion).get_columns("receta")}
+    nuevas = [
+        nombre
+        for nombre in ("costo_total", "calorias_total", "costo_porcion")
+        if nombre not in columnas
+    ]
+    if not nuevas:
+        return
+
+    for nombre in nuevas:
+        conexion.execute(
+            text("ALTER TABLE receta ADD COLUMN {} NUMERIC DEFAULT 0".format(nombre))
+        )
+    conexion.execute(
+        text(
+            "UPDATE receta SET "
+            "costo_total = coalesce((SELECT sum(ri.cantidad * i.costo) "
+            "FROM receta_ingrediente ri JOIN ingrediente i ON i.id = ri.ingrediente "
+            "WHERE ri.receta = receta.id), 0), "
+            "calorias_total = coalesce((SELECT sum(ri.cantidad * i.calorias) "
+            "FROM receta_ingrediente ri JOIN ingrediente i ON i.id = ri.ingrediente "
+            "WHERE ri.receta = receta.id), 0)"
+        )
+    )
+    conexion.execute(
+        text(
+            "UPDATE receta SET costo_porcion = CASE WHEN porcion > 0 "
+            "THEN costo_total / porcion ELSE 0 END"
+        )
+    )
+
+
+def crear_indices(conexion):
+    repetidos = conexion.execute(
+        text(
+            "SELECT usuario FROM usuario WHERE usuario IS NOT NULL "
+            "GROUP BY usuario HAVING count(*) > 1"
+        )
+    ).fetchall()
+    if repetidos:
+        raise RuntimeError(
+            "No se puede crear el índice único de usuario, hay usuarios repetidos: "
+            + ", ".join(usuario for usuario, in repetidos)
+        )
+
+    # Las tablas que crea una migración posterior se crean con sus índices
+    tablas = set(inspect(conexion).get_table_names())
+    for nombre, tabla, columnas, unico in INDICES:
+        if tabla not in tablas:
+            continue
+        conexion.execute(
+            text(
+                "CREATE {}INDEX IF NOT EXISTS {} ON {} ({})".format(
+                    "UNIQUE " if unico else "", nombre, tabla, ", ".join(columnas)
+                )
+            )
+        )
+
+
+def crear_busqueda(conexion):
+    # Tablas FTS5 de contenido externo: guardan solo el índice y leen el texto
+    # de la tabla original. Los triggers las sincronizan con cualquier
+    # escritura, incluidas las masivas que no pasan por el ORM
+    if conexion.dialect.name != "sqlite":
+        return
+
+    for tabla_fts, tabla, columnas in BUSQUEDAS:
+        lista = ", ".join(columnas)
+        nuevos = ", ".join("new." + columna for columna in columnas)
+        anteriores = ", ".join("old." + columna for columna in columnas)
+        insertar = "INSERT INTO {0} (rowid, {1}) VALUES (new.id, {2});".format(
+            tabla_fts, lista, nuevos
+        )
+        borrar = (
+            "INSERT INTO {0} ({0}, rowid, {1}) VALUES ('delete', old.id, {2});"
+        ).format(tabla_fts, lista, anteriores)
+
+        conexion.execute(
+            text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5({}, "
+                "content='{}', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')".format(
+                    tabla_fts, lista, tabla
+                )
+            )
+        )
+        conexion.execute(
+            text(
+                "CREATE TRIGGER IF NOT EXISTS {0}_ai AFTER INSERT ON {1} "
+                "BEGIN {2} END".format(tabla_fts, tabla, insertar)
+            )
+        )
+        conexion.execute(
+            text(
+                "CREATE TRIGGER IF NOT EXISTS {0}_ad AFTER DELETE ON {1} "
+                "BEGIN {2} END".format(tabla_fts, tabla, borrar)
+            )
+        )
+        conexion.execute(
+            text(
+                "CREATE TRIGGER IF NOT EXISTS {0}_au AFTER UPDATE OF {1} ON {2} "
+                "BEGIN {3} {4} END".format(tabla_fts, lista, tabla, borrar, insertar)
+            )
+        )
+        conexion.execute(
+            text("INSERT INTO {0} ({0}) VALUES ('rebuild')".format(tabla_fts))
+        )
+
+
+def crear_reportes(conexion):
+    # Tablas de resumen de los reportes, llenadas con los menús existentes
+    from .modelos import db
+    from .reportes import TABLAS_REPORTES, reconstruir_resumenes
+
+    db.Model.metadata.create_all(conexion, tables=TABLAS_REPORTES)
+    reconstruir_resumenes(conexion)
+
+
+def crear_trabajos(conexion):
+    # Tabla de la cola de trabajos en segundo plano
+    from .modelos import Trabajo, db
+
+    db.Model.metadata.create_all(conexion, tables=[Trabajo.__table__])
+
+
+def crear_versiones(conexion):
+    # Versiones compartidas de las cachés de respuestas y de autorización
+    from .modelos import VersionEntidad, db
+
+    db.Model.metadata.create_all(conexion, tables=[VersionEntidad.__table__])
+
+
+# Migraciones en orden. Cada una debe poder correr sobre una base creada con
+# db.create_all, donde sus cambios ya existen
+MIGRACIONES = [
+    (1, "totales_receta", agregar_totales_receta),
+    (2, "indices", crear_indices),
+    (3, "busqueda", crear_busqueda),
+    (4, "reportes", crear_reportes),
+    (5, "trabajos", crear_trabajos),
+    (6, "versiones", crear_versiones),
+]
+
+
+def aplicar_migraciones(motor):
+    # Aplica las migraciones pendientes, cada una en su propia transacción. La
+    # fila de la migración se inserta antes de los cambios: si otro proceso ya
+    # la está aplicando, este espera su commit y luego la omite
+    metadata_migraciones.create_all(motor)
+    with motor.connect() as conexion:
+        aplicadas = {
+            version
+            for version, in conexion.execute(
+                text("SELECT version FROM migracion")
+            ).fetchall()
+        }
+
+    nuevas = []
+    for version, nombre, migracion in MIGRACIONES:
+        if version in aplicadas:
+            continue
+        with motor.begin() as conexion:
+            try:
+                conexion.execute(
+                    tabla_migracion.insert(), {"version": version, "nombre": nombre}
+                )
+            except IntegrityError:
+                continue
+            migracion(conexion)
+        nuevas.append(nombre)
+    return nuevas
+
+
+def inicializar_esquema(motor):
+    # Crea las tablas que falten y aplica las migraciones pendientes. Se corre
+    # una sola vez por despliegue (python -m modelos.migraciones), no al
+    # arrancar cada worker
+    from .modelos import db
+
+    db.Model.metadata.create_all(motor)
+    return aplicar_migraciones(motor)
+
+
+if __name__ == "__main__":
+    uri = (
+        sys.argv[1]
+        if len(sys.argv) > 1
+        else os.environ.get("SQLALCHEMY_DATABASE_URI", "sqlite:///dbapp.sqlite")
+    )
+    motor = create_engine(uri)
+    for nombre in inicializar_esquema(motor):
+        print("Migración aplicada: {}".format(nombre))
+    motor.dispose()
@@ -1,25 +1,32 @@
 import enum
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from marshmallow import fields
-from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
 
 
 db = SQLAlchemy()
 
 
 class MenuSemana(db.Model):
+    __table_args__ = (
+        db.Index(
+            "ix_menu_semana_restaurante_fechas",
+            "id_restaurante",
+            "fecha_inicial",
+            "fecha_final",
+        ),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(50))
+    nombre = db.Column(db.String(50), index=True)
     fecha_inicial = db.Column(db.Date)
     fecha_final = db.Column(db.Date)
     recetas = db.relationship("MenuReceta", cascade="all, delete, delete-orphan")
     id_restaurante = db.Column(db.Integer, db.ForeignKey("restaurante.id"))
-    id_usuario = db.Column(db.Integer, db.ForeignKey("usuario.id"))
+    id_usuario = db.Column(db.Integer, db.ForeignKey("usuario.id"), index=True)
 
 
 class Ingrediente(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(128))
+    nombre = db.Column(db.String(128), index=True)
     unidad = db.Column(db.String(128))
     costo = db.Column(db.Numeric)
     calorias = db.Column(db.Numeric)
@@ -29,8 +36,8 @@ class Ingrediente(db.Model):
 class RecetaIngrediente(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     cantidad = db.Column(db.Numeric)
-    ingrediente = db.Column(db.Integer, db.ForeignKey("ingrediente.id"))
-    receta = db.Column(db.Integer, db.ForeignKey("receta.id"))
+    ingrediente = db.Column(db.Integer, db.ForeignKey("ingrediente.id"), index=True)
+    receta = db.Column(db.Integer, db.ForeignKey("receta.id"), index=True)
 
 
 class Receta(db.Model):
@@ -39,10 +46,14 @@ class Receta(db.Model):
     duracion = db.Column(db.Numeric)
     porcion = db.Column(db.Numeric)
     preparacion = db.Column(db.String)
+    # Totales precalculados a partir de los ingredientes de la receta
+    costo_total = db.Column(db.Numeric, default=0)
+    calorias_total = db.Column(db.Numeric, default=0)
+    costo_porcion = db.Column(db.Numeric, default=0)
     ingredientes = db.relationship(
         "RecetaIngrediente", cascade="all, delete, delete-orphan"
     )
-    usuario = db.Column(db.Integer, db.ForeignKey("usuario.id"))
+    usuario = db.Column(db.Integer, db.ForeignKey("usuario.id"), index=True)
 
 
 class Rol(enum.Enum):
@@ -52,11 +63,11 @@ class Rol(enum.Enum):
 
 class Usuario(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    usuario = db.Column(db.String(128))  # correo del chef
+    usuario = db.Column(db.String(128), unique=True, index=True)  # correo del chef
     contrasena = db.Column(db.String(50))
     rol = db.Column(db.Enum(Rol))
     nombre = db.Column(db.String(128))
-    restaurante_id = db.Column(db.Integer, db.ForeignKey("restaurante.id"))
+    restaurante_id = db.Column(db.Integer, db.ForeignKey("restaurante.id"), index=True)
     recetas = db.relationship("Receta", cascade="all, delete, delete-orphan")
     restaurantes = db.relationship("Restaurante", foreign_keys=[restaurante_id])
     menu_semana = db.relationship(
@@ -67,6 +78,9 @@ class Usuario(db.Model):
 
 
 class Restaurante(db.Model):
+    __table_args__ = (
+        db.Index("ix_restaurante_administrador_nombre", "administrador_id", "nombre"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100))
     direccion = db.Column(db.String(200))
@@ -92,86 +106,87 @@ class Restaurante(db.Model):
 class MenuReceta(db.Model):
     __tablename__ = "menu_receta"
     id = db.Column(db.Integer, primary_key=True)
-    menu = db.Column(db.Integer, db.ForeignKey("menu_semana.id"))
-    receta = db.Column(db.Integer, db.ForeignKey("receta.id"))
-
-
-class RestauranteSchema(SQLAlchemyAutoSchema):
-    class Meta:
-        model = Restaurante
-        include_relationships = True
-        include_fk = True
-        load_instance = True
-
-    id = fields.String()
-    chefs = fields.List(fields.Nested("UsuarioSchema"))
-    menu_semana = fields.List(fields.Nested("MenuSemanaSchema"))
-
-
-class IngredienteSchema(SQLAlchemyAutoSchema):
-    class Meta:
-        model = Ingrediente
-        load_instance = True
-
-    id = fields.String()
-    costo = fields.String()
-    calorias = fields.String()
-
-
-class RecetaIngredienteSchema(SQLAlchemyAutoSchema):
-    class Meta:
-        model = RecetaIngrediente
-        include_relationships = True
-        include_fk = True
-        load_instance = True
-
-    id = fields.String()
-    cantidad = fields.String()
-    ingrediente = fields.String()
+    menu = db.Column(db.Integer, db.ForeignKey("menu_semana.id"), index=True)
+    receta = db.Column(db.Integer, db.ForeignKey("receta.id"), index=True)
 
 
-class RecetaSchema(SQLAlchemyAutoSchema):
-    class Meta:
-        model = Receta
-        include_relationships = True
-        include_fk = True
-        load_instance = True
-
-    id = fields.String()
-    duracion = fields.String()
-    porcion = fields.String()
-    ingredientes = fields.List(fields.Nested(RecetaIngredienteSchema()))
-
-
-class UsuarioSchema(SQLAlchemyAutoSchema):
-    class Meta:
-        model = Usuario
-        include_relationships = True
-        load_instance = True
-
-    id = fields.String()
-    rol = fields.String()
-
-
-class MenuRecetaSchema(SQLAlchemyAutoSchema):
-    class Meta:
-        model = MenuReceta
-        include_relationships = True
-        include_fk = True
-        load_instance = True
+# Tablas de resumen de los reportes, mantenidas por modelos/reportes.py. No
+# tienen llaves foráneas: las filas de un menú o restaurante borrado se
+# descuentan en la misma transacción del borrado
+class ResumenMenu(db.Model):
+    __tablename__ = "resumen_menu"
+    __table_args__ = (
+        db.Index("ix_resumen_menu_restaurante_fecha", "restaurante", "fecha_inicial"),
+    )
+    menu = db.Column(db.Integer, primary_key=True)
+    restaurante = db.Column(db.Integer)
+    fecha_inicial = db.Column(db.Date)
+    recetas = db.Column(db.Integer, default=0)
+    costo_total = db.Column(db.Numeric, default=0)
+    suma_costo_porcion = db.Column(db.Numeric, default=0)
+    calorias_total = db.Column(db.Numeric, default=0)
+
+
+class ResumenMenuIngrediente(db.Model):
+    __tablename__ = "resumen_menu_ingrediente"
+    menu = db.Column(db.Integer, primary_key=True)
+    ingrediente = db.Column(db.Integer, primary_key=True)
+    usos = db.Column(db.Integer, default=0)
+    cantidad = db.Column(db.Numeric, default=0)
+
+
+class ResumenRestaurante(db.Model):
+    __tablename__ = "resumen_restaurante"
+    restaurante = db.Column(db.Integer, primary_key=True)
+    menus = db.Column(db.Integer, default=0)
+    recetas = db.Column(db.Integer, default=0)
+    costo_total = db.Column(db.Numeric, default=0)
+    suma_costo_porcion = db.Column(db.Numeric, default=0)
+    calorias_total = db.Column(db.Numeric, default=0)
+
+
+class ResumenRestauranteIngrediente(db.Model):
+    __tablename__ = "resumen_restaurante_ingrediente"
+    __table_args__ = (
+        db.Index("ix_resumen_restaurante_ingrediente_usos", "restaurante", "usos"),
+    )
+    restaurante = db.Column(db.Integer, primary_key=True)
+    ingrediente = db.Column(db.Integer, primary_key=True)
+    usos = db.Column(db.Integer, default=0)
+    cantidad = db.Column(db.Numeric, default=0)
 
-    receta = fields.String()
 
+class EstadoTrabajo(enum.Enum):
+    PENDIENTE = 1
+    EJECUTANDO = 2
+    COMPLETADO = 3
+    FALLIDO = 4
 
-class MenuSemanaSchema(SQLAlchemyAutoSchema):
-    class Meta:
-        model = MenuSemana
-        include_relationships = True
-        load_instance = True
 
-    id = fields.String()
-    nombre = fields.String()
-    fecha_inicial = fields.Date()
-    fecha_final = fields.Date()
-    recetas = fields.List(fields.Nested(MenuRecetaSchema()))
-    usuario = fields.Nested(UsuarioSchema())
+# Cola de trabajos en segundo plano (vistas/trabajos.py). Los parámetros y el
+# resultado se guardan como JSON
+class Trabajo(db.Model):
+    __table_args__ = (
+        db.Index("ix_trabajo_estado_disponible", "estado", "disponible_en"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(64))
+    parametros = db.Column(db.Text)
+    estado = db.Column(db.Enum(EstadoTrabajo), default=EstadoTrabajo.PENDIENTE)
+    intentos = db.Column(db.Integer, default=0)
+    max_intentos = db.Column(db.Integer, default=3)
+    disponible_en = db.Column(db.DateTime, default=datetime.utcnow)
+    resultado = db.Column(db.Text)
+    error = db.Column(db.Text)
+    id_usuario = db.Column(db.Integer, index=True)
+    creado = db.Column(db.DateTime, default=datetime.utcnow)
+    actualizado = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Versión de cada entidad de la que dependen las cachés (una tabla, un
+# usuario). La comparten todos los procesos que usan la base: se incrementa en
+# la misma transacción de la escritura (modelos/versiones.py)
+class VersionEntidad(db.Model):
+    __tablename__ = "version_entidad"
+    entidad = db.Column(db.String(128), primary_key=True)
+    version = db.Column(db.Integer, default=0)
@@ -0,0 +1,92 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# Valores del perfil "produccion". Cada uno se puede cambiar con la variable de
+# entorno del mismo nombre o con la configuración de la aplicación
+CONFIGURACION_PRODUCCION = {
+    "SQLITE_JOURNAL_MODE": "WAL",
+    "SQLITE_SYNCHRONOUS": "NORMAL",
+    "SQLITE_BUSY_TIMEOUT_MS": 5000,
+    "SQLITE_MMAP_SIZE": 256 * 1024 * 1024,
+    "SQLITE_CACHE_SIZE_KB": 64 * 1024,
+    "DB_POOL_SIZE": 5,
+    "DB_POOL_MAX_OVERFLOW": 10,
+    "DB_POOL_TIMEOUT": 30,
+    "DB_POOL_RECYCLE": -1,
+}
+
+MODOS_JOURNAL = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+MODOS_SYNCHRONOUS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def entorno_util(nombre, defecto):
+    valor = os.environ.get(nombre)
+    if valor is None:
+        return defecto
+    if isinstance(defecto, int):
+        return int(valor)
+    return valor.upper()
+
+
+class PerfilSQLite:
+    # Perfil de base de datos para SQLite con varios workers: WAL para que los
+    # lectores no esperen a los escritores, synchronous=NORMAL, espera ante
+    # bloqueos, mmap y caché de páginas, y un pool de conexiones por proceso.
+    # Con DB_PERFIL=basico se conservan los valores por defecto de SQLite
+    def __init__(self):
+        self.pragmas = []
+
+    def init_app(self, app, db):
+        app.config.setdefault("DB_PERFIL", os.environ.get("DB_PERFIL", "produccion"))
+        uri = app.config["SQLALCHEMY_DATABASE_URI"]
+        if app.config["DB_PERFIL"] != "produccion" or not self.es_archivo_util(uri):
+            return
+
+        for nombre, defecto in CONFIGURACION_PRODUCCION.items():
+            app.config.setdefault(nombre, entorno_util(nombre, defecto))
+        if app.config["SQLITE_JOURNAL_MODE"] not in MODOS_JOURNAL:
+            raise ValueError("SQLITE_JOURNAL_MODE inválido")
+        if app.config["SQLITE_SYNCHRONOUS"] not in MODOS_SYNCHRONOUS:
+            raise ValueError("SQLITE_SYNCHRONOUS inválido")
+
+        # Los pragmas se aplican a cada conexión nueva del pool. cache_size
+        # negativo se interpreta en KiB
+        self.pragmas = [
+            "PRAGMA journal_mode={}".format(app.config["SQLITE_JOURNAL_MODE"]),
+            "PRAGMA synchronous={}".format(app.config["SQLITE_SYNCHRONOUS"]),
+            "PRAGMA busy_timeout={:d}".format(app.config["SQLITE_BUSY_TIMEOUT_MS"]),
+            "PRAGMA mmap_size={:d}".format(app.config["SQLITE_MMAP_SIZE"]),
+            "PRAGMA cache_size=-{:d}".format(app.config["SQLITE_CACHE_SIZE_KB"]),
+        ]
+
+        opciones = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+        opciones.setdefault("poolclass", QueuePool)
+        opciones.setdefault("pool_size", app.config["DB_POOL_SIZE"])
+        opciones.setdefault("max_overflow", app.config["DB_POOL_MAX_OVERFLOW"])
+        opciones.setdefault("pool_timeout", app.config["DB_POOL_TIMEOUT"])
+        opciones.setdefault("pool_recycle", app.config["DB_POOL_RECYCLE"])
+        # Las conexiones del pool se comparten entre los hilos del worker
+        argumentos = opciones.setdefault("connect_args", {})
+        argumentos.setdefault("check_same_thread", False)
+        argumentos.setdefault("timeout", app.config["SQLITE_BUSY_TIMEOUT_MS"] / 1000)
+
+        with app.app_context():
+            motor = db.engine
+        event.listen(motor, "connect", self.configurar_conexion)
+
+    def es_archivo_util(self, uri):
+        return uri.startswith("sqlite:") and uri not in (
+            "sqlite://",
+            "sqlite:///:memory:",
+        )
+
+    def configurar_conexion(self, conexion_dbapi, registro):
+        cursor = conexion_dbapi.cursor()
+        for pragma in self.pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+perfil_sqlite = PerfilSQLite()
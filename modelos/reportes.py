@@ -0,0 +1,202 @@
+from sqlalchemy import bindparam, func, select, text
+
+from .modelos import (
+    MenuReceta,
+    MenuSemana,
+    Receta,
+    RecetaIngrediente,
+    ResumenMenu,
+    ResumenMenuIngrediente,
+    ResumenRestaurante,
+    ResumenRestauranteIngrediente,
+)
+
+TAMANO_LOTE_REPORTES = 500
+
+resumen_menu = ResumenMenu.__table__
+resumen_menu_ingrediente = ResumenMenuIngrediente.__table__
+resumen_restaurante = ResumenRestaurante.__table__
+resumen_restaurante_ingrediente = ResumenRestauranteIngrediente.__table__
+TABLAS_REPORTES = [
+    resumen_menu,
+    resumen_menu_ingrediente,
+    resumen_restaurante,
+    resumen_restaurante_ingrediente,
+]
+
+# Columnas de resumen_menu que se acumulan en resumen_restaurante
+ACUMULADOS = ("recetas", "costo_total", "suma_costo_porcion", "calorias_total")
+
+
+def menus_de_recetas(conexion, ids_recetas):
+    # Menús que incluyen alguna de las recetas, por el índice de menu_receta
+    ids_recetas = sorted(ids_recetas)
+    ids_menus = set()
+    for inicio in range(0, len(ids_recetas), TAMANO_LOTE_REPORTES):
+        lote = ids_recetas[inicio : inicio + TAMANO_LOTE_REPORTES]
+        ids_menus.update(
+            id_menu
+            for id_menu, in conexion.execute(
+                select(MenuReceta.menu)
+                .where(MenuReceta.receta.in_(lote), MenuReceta.menu.isnot(None))
+                .distinct()
+            )
+        )
+    return ids_menus
+
+
+def actualizar_resumenes(conexion, ids_menus, ingredientes=True):
+    # Recalcula el resumen de los menús indicados (incluidos los borrados) y
+    # aplica al resumen de sus restaurantes solo la diferencia con el anterior,
+    # así el costo no depende de la historia del restaurante. Con
+    # ingredientes=False solo se recalculan costos y calorías, para los cambios
+    # de totales de las recetas que no tocan sus líneas
+    ids_menus = sorted(ids_menus)
+    for inicio in range(0, len(ids_menus), TAMANO_LOTE_REPORTES):
+        actualizar_lote_util(
+            conexion, ids_menus[inicio : inicio + TAMANO_LOTE_REPORTES], ingredientes
+        )
+
+
+def reconstruir_resumenes(conexion):
+    # Reconstrucción completa, para la migración y las escrituras masivas
+    for tabla in TABLAS_REPORTES:
+        conexion.execute(tabla.delete())
+    actualizar_resumenes(
+        conexion, [id_menu for id_menu, in conexion.execute(select(MenuSemana.id))]
+    )
+
+
+def actualizar_lote_util(conexion, ids_menus, ingredientes):
+    # Todo ocurre en SQL, sin traer filas: se resta el aporte anterior de los
+    # menús con el restaurante que tenían, se reemplazan sus filas y se suma el
+    # aporte nuevo
+    restaurantes = set()
+    if ingredientes:
+        restaurantes.update(restaurantes_de_menus_util(conexion, ids_menus))
+        sumar_ingredientes_util(conexion, ids_menus, -1)
+    sumar_restaurantes_util(conexion, ids_menus, -1)
+
+    conexion.execute(resumen_menu.delete().where(resumen_menu.c.menu.in_(ids_menus)))
+    conexion.execute(
+        resumen_menu.insert().from_select(
+            ["menu", "restaurante", "fecha_inicial"] + list(ACUMULADOS),
+            select(
+                MenuSemana.id,
+                MenuSemana.id_restaurante,
+                MenuSemana.fecha_inicial,
+                func.count(Receta.id),
+                func.coalesce(func.sum(Receta.costo_total), 0),
+                func.coalesce(func.sum(Receta.costo_porcion), 0),
+                func.coalesce(func.sum(Receta.calorias_total), 0),
+            )
+            .select_from(MenuSemana)
+            .outerjoin(MenuReceta, MenuReceta.menu == MenuSemana.id)
+            .outerjoin(Receta, Receta.id == MenuReceta.receta)
+            .where(MenuSemana.id.in_(ids_menus))
+            .group_by(MenuSemana.id),
+        )
+    )
+    if ingredientes:
+        conexion.execute(
+            resumen_menu_ingrediente.delete().where(
+                resumen_menu_ingrediente.c.menu.in_(ids_menus)
+            )
+        )
+        conexion.execute(
+            resumen_menu_ingrediente.insert().from_select(
+                ["menu", "ingrediente", "usos", "cantidad"],
+                select(
+                    MenuReceta.menu,
+                    RecetaIngrediente.ingrediente,
+                    func.count(),
+                    func.coalesce(func.sum(RecetaIngrediente.cantidad), 0),
+                )
+                .select_from(MenuReceta)
+                .join(RecetaIngrediente, RecetaIngrediente.receta == MenuReceta.receta)
+                .where(
+                    MenuReceta.menu.in_(ids_menus),
+                    RecetaIngrediente.ingrediente.isnot(None),
+                )
+                .group_by(MenuReceta.menu, RecetaIngrediente.ingrediente),
+            )
+        )
+
+    sumar_restaurantes_util(conexion, ids_menus, 1)
+    conexion.execute(
+        resumen_restaurante.delete().where(resumen_restaurante.c.menus <= 0)
+    )
+    if ingredientes:
+        sumar_ingredientes_util(conexion, ids_menus, 1)
+        restaurantes.update(restaurantes_de_menus_util(conexion, ids_menus))
+        # Por el índice (restaurante, usos), sin recorrer otros restaurantes
+        conexion.execute(
+            resumen_restaurante_ingrediente.delete().where(
+                resumen_restaurante_ingrediente.c.restaurante.in_(sorted(restaurantes)),
+                resumen_restaurante_ingrediente.c.usos <= 0,
+            )
+        )
+
+
+def restaurantes_de_menus_util(conexion, ids_menus):
+    return {
+        id_restaurante
+        for id_restaurante, in conexion.execute(
+            select(resumen_menu.c.restaurante)
+            .where(
+                resumen_menu.c.menu.in_(ids_menus),
+                resumen_menu.c.restaurante.isnot(None),
+            )
+            .distinct()
+        )
+    }
+
+
+def upsert_util(tabla, llaves, columnas, origen, agrupacion):
+    # INSERT ... SELECT ... ON CONFLICT DO UPDATE de SQLite: suma a cada fila
+    # existente la diferencia de los menús (por :signo) y crea las que faltan.
+    # Es texto porque SQLAlchemy no guarda en caché la compilación del upsert
+    return text(
+        "INSERT INTO {tabla} ({llaves}, {columnas}) "
+        "SELECT {agrupacion}, {valores} FROM {origen} "
+        "WHERE resumen_menu.menu IN :menus "
+        "AND resumen_menu.restaurante IS NOT NULL "
+        "GROUP BY {agrupacion} "
+        "ON CONFLICT ({llaves}) DO UPDATE SET {sumas}".format(
+            tabla=tabla.name,
+            llaves=", ".join(llaves),
+            columnas=", ".join(columna for columna, _ in columnas),
+            agrupacion=agrupacion,
+            valores=", ".join(":signo * " + valor for _, valor in columnas),
+            origen=origen,
+            sumas=", ".join(
+                "{0} = {0} + excluded.{0}".format(columna) for columna, _ in columnas
+            ),
+        )
+    ).bindparams(bindparam("menus", expanding=True))
+
+
+SUMAR_RESTAURANTES = upsert_util(
+    resumen_restaurante,
+    ["restaurante"],
+    [("menus", "count(*)")]
+    + [(columna, "sum({})".format(columna)) for columna in ACUMULADOS],
+    "resumen_menu",
+    "resumen_menu.restaurante",
+)
+SUMAR_INGREDIENTES = upsert_util(
+    resumen_restaurante_ingrediente,
+    ["restaurante", "ingrediente"],
+    [("usos", "sum(usos)"), ("cantidad", "sum(cantidad)")],
+    "resumen_menu_ingrediente JOIN resumen_menu "
+    "ON resumen_menu.menu = resumen_menu_ingrediente.menu",
+    "resumen_menu.restaurante, resumen_menu_ingrediente.ingrediente",
+)
+
+
+def sumar_restaurantes_util(conexion, ids_menus, signo):
+    conexion.execute(SUMAR_RESTAURANTES, {"menus": ids_menus, "signo": signo})
+
+
+def sumar_ingredientes_util(conexion, ids_menus, signo):
+    conexion.execute(SUMAR_INGREDIENTES, {"menus": ids_menus, "signo": signo})
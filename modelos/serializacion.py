@@ -0,0 +1,111 @@
+from marshmallow import fields, missing
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+from marshmallow_sqlalchemy.fields import Related, RelatedList
+
+serializadores = {}
+
+
+def serializador_para(schema):
+    # Un serializador compilado por clase de schema y combinación de campos
+    # (only/exclude), así se construye una sola vez por proceso
+    llave = (
+        type(schema),
+        frozenset(schema.only) if schema.only is not None else None,
+        frozenset(schema.exclude),
+    )
+    serializador = serializadores.get(llave)
+    if serializador is None:
+        serializador = SerializadorCompilado(schema)
+        serializadores[llave] = serializador
+    return serializador
+
+
+class SerializadorCompilado:
+    # Produce la misma salida que schema.dump pero resuelve al construirse, y no
+    # en cada fila, el atributo, la llave de salida y la conversión de cada campo.
+    # Los campos que no tienen una conversión directa usan el _serialize del
+    # propio campo de marshmallow
+    def __init__(self, schema):
+        self.schema = schema
+        self.compatible = not any(
+            procesadores
+            for llave, procesadores in schema._hooks.items()
+            if llave[0] in (PRE_DUMP, POST_DUMP)
+        )
+        self.campos = None
+
+    def compilar_util(self):
+        campos = []
+        for nombre, campo in self.schema.dump_fields.items():
+            llave = campo.data_key if campo.data_key is not None else nombre
+            atributo = campo.attribute if campo.attribute is not None else nombre
+            conversion = None
+            if "." not in atributo and campo.default is missing:
+                conversion = conversion_campo_util(campo)
+            if conversion is None:
+                campos.append((llave, None, campo.serialize, nombre))
+            else:
+                campos.append((llave, atributo, conversion, None))
+        self.campos = campos
+
+    def serializar_uno(self, obj):
+        if not self.compatible:
+            return self.schema.dump(obj)
+        if self.campos is None:
+            self.compilar_util()
+
+        resultado = {}
+        for llave, atributo, conversion, nombre in self.campos:
+            if atributo is None:
+                valor = conversion(nombre, obj, accessor=self.schema.get_attribute)
+                if valor is not missing:
+                    resultado[llave] = valor
+                continue
+            valor = getattr(obj, atributo, missing)
+            if valor is missing:
+                continue
+            resultado[llave] = conversion(valor)
+        return resultado
+
+    def serializar(self, objs):
+        if not self.compatible:
+            return self.schema.dump(objs, many=True)
+        return [self.serializar_uno(obj) for obj in objs]
+
+
+def texto_util(valor):
+    # Equivale a fields.String: Decimal, int y enums se convierten con str()
+    if valor is None or type(valor) is str:
+        return valor
+    return str(valor)
+
+
+def entero_util(valor):
+    return None if valor is None else int(valor)
+
+
+def conversion_campo_util(campo):
+    # Retorna None cuando el campo no tiene una conversión directa
+    tipo = type(campo)
+    if tipo is fields.String:
+        return texto_util
+    if tipo is fields.Integer and not campo.as_string:
+        return entero_util
+    if tipo in (fields.Date, fields.Boolean):
+        return lambda valor: campo._serialize(valor, None, None)
+    if tipo is Related and len(campo.related_keys) == 1:
+        llave_relacion = campo.related_keys[0].key
+        return lambda valor: getattr(valor, llave_relacion, None)
+    if tipo in (fields.List, RelatedList) and campo.inner.attribute is None:
+        conversion_interna = conversion_campo_util(campo.inner)
+        if conversion_interna is None:
+            return None
+        return lambda valor: (
+            None if valor is None else [conversion_interna(each) for each in valor]
+        )
+    if tipo is fields.Nested and not campo.many and not campo.schema.many:
+        serializador = serializador_para(campo.schema)
+        return lambda valor: (
+            None if valor is None else serializador.serializar_uno(valor)
+        )
+    return None
@@ -0,0 +1,31 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from .modelos import VersionEntidad
+
+
+def leer_versiones(conexion, entidades):
+    # Una entidad que nunca se escribió tiene versión 0
+    tabla = VersionEntidad.__table__
+    versiones = dict(
+        conexion.execute(
+            select(tabla.c.entidad, tabla.c.version).where(
+                tabla.c.entidad.in_(list(entidades))
+            )
+        ).all()
+    )
+    return [versiones.get(entidad, 0) for entidad in entidades]
+
+
+def incrementar_versiones(conexion, entidades):
+    # Con la conexión de la transacción que escribe: el incremento se ve en los
+    # demás procesos junto con los datos, al confirmarse
+    if not entidades:
+        return
+    tabla = VersionEntidad.__table__
+    conexion.execute(
+        insert(tabla).on_conflict_do_update(
+            index_elements=[tabla.c.entidad], set_={"version": tabla.c.version + 1}
+        ),
+        [{"entidad": entidad, "version": 1} for entidad in sorted(entidades)],
+    )
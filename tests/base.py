@@ -0,0 +1,35 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from app import app
+from modelos import db, inicializar_esquema
+from vistas import cola_trabajos
+
+
+class PruebaApp(TestCase):
+    # Base de las pruebas que usan db.session fuera de las solicitudes: el
+    # contexto de la aplicación queda activo durante toda la corrida, sobre un
+    # esquema al día. Se prepara con la primera clase que corre, con pytest o
+    # con python -m unittest discover -s tests
+    contexto = None
+    directorio = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if PruebaApp.contexto is not None:
+            return
+        # Los trabajos en segundo plano no corren solos durante las pruebas:
+        # cada prueba vacía la cola con cola_trabajos.drenar() cuando lo necesita
+        app.config["COLA_EJECUTOR"] = "manual"
+        cola_trabajos.init_app(app)
+        # La instantánea del catálogo de ingredientes va a un directorio
+        # temporal, que se borra al terminar, y no junto a la base del árbol
+        PruebaApp.directorio = tempfile.TemporaryDirectory()
+        app.config["CATALOGO_RUTA"] = os.path.join(
+            PruebaApp.directorio.name, "catalogo"
+        )
+        PruebaApp.contexto = app.app_context()
+        PruebaApp.contexto.push()
+        inicializar_esquema(db.engine)
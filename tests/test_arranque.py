@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from sqlalchemy import create_engine, inspect
+
+from app import crear_app
+from modelos import inicializar_esquema
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestArranque(TestCase):
+    def test_crear_app_no_toca_la_base(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, "nueva.sqlite")
+            app = crear_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///" + ruta})
+            self.assertIn("vistaingredientes", app.view_functions)
+            self.assertFalse(os.path.exists(ruta))
+
+    def test_importar_app_no_importa_marshmallow(self):
+        # En un proceso nuevo, porque en este las pruebas ya lo importaron
+        resultado = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, app; print('marshmallow' in sys.modules)",
+            ],
+            cwd=RAIZ,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(resultado.stdout.strip(), "False")
+
+    def test_inicializar_esquema(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            motor = create_engine(
+                "sqlite:///" + os.path.join(directorio, "nueva.sqlite")
+            )
+            self.assertEqual(
+                inicializar_esquema(motor),
+                [
+                    "totales_receta",
+                    "indices",
+                    "busqueda",
+                    "reportes",
+                    "trabajos",
+                    "versiones",
+                ],
+            )
+            self.assertEqual(inicializar_esquema(motor), [])
+            tablas = set(inspect(motor).get_table_names())
+            motor.dispose()
+        self.assertTrue({"usuario", "receta", "migracion", "receta_fts"} <= tablas)
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import importlib.util
+import json
+from unittest import skipUnless
+
+from faker import Faker
+from modelos import db, Usuario, Ingrediente, Receta, RecetaIngrediente, Rol
+
+from app import app
+from tests.base import PruebaApp
+
+
+@skipUnless(importlib.util.find_spec("aiosqlite"), "aiosqlite no está instalado")
+class TestAsgi(PruebaApp):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import asgi
+
+        cls.asgi = asgi
+
+    @classmethod
+    def tearDownClass(cls):
+        asyncio.run(cls.asgi.sesiones_asincronas.cerrar())
+
+    def setUp(self):
+        self.data_factory = Faker()
+        self.client = app.test_client()
+
+        nombre_usuario = "test_" + self.data_factory.name()
+        contrasena = "T1$" + self.data_factory.word()
+        contrasena_encriptada = hashlib.md5(contrasena.encode("utf-8")).hexdigest()
+
+        # Se crea el usuario para identificarse en la aplicación
+        usuario_nuevo = Usuario(
+            usuario=nombre_usuario,
+            contrasena=contrasena_encriptada,
+            rol=Rol.ADMINISTRADOR,
+        )
+        db.session.add(usuario_nuevo)
+        db.session.commit()
+
+        usuario_login = {"usuario": nombre_usuario, "contrasena": contrasena}
+
+        solicitud_login = self.client.post(
+            "/login",
+            data=json.dumps(usuario_login),
+            headers={"Content-Type": "application/json"},
+        )
+
+        respuesta_login = json.loads(solicitud_login.get_data())
+
+        self.token = respuesta_login["token"]
+        self.usuario_id = respuesta_login["id"]
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer {}".format(self.token),
+        }
+
+        self.ingrediente = Ingrediente(
+            nombre=self.data_factory.sentence(),
+            unidad="kg",
+            costo=2,
+            calorias=3,
+            sitio=self.data_factory.sentence(),
+        )
+        db.session.add(self.ingrediente)
+        db.session.commit()
+        self.receta = Receta(
+            nombre=self.data_factory.word(),
+            porcion=1,
+            usuario=self.usuario_id,
+            ingredientes=[
+                RecetaIngrediente(cantidad=2, ingrediente=self.ingrediente.id)
+            ],
+        )
+        db.session.add(self.receta)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.delete(Receta.query.get(self.receta.id))
+        db.session.delete(Ingrediente.query.get(self.ingrediente.id))
+        db.session.delete(Usuario.query.get(self.usuario_id))
+        db.session.commit()
+
+    def solicitar(self, metodo, ruta, consulta="", cuerpo=None, autenticado=True):
+        async def solicitar_asgi():
+            mensajes = []
+            contenido = json.dumps(cuerpo).encode() if cuerpo is not None else b""
+
+            async def receive():
+                return {"type": "http.request", "body": contenido}
+
+            async def send(mensaje):
+                mensajes.append(mensaje)
+
+            encabezados = [(b"content-type", b"application/json")]
+            if autenticado:
+                encabezados.append(
+                    (b"authorization", "Bearer {}".format(self.token).encode())
+                )
+            scope = {
+                "type": "http",
+                "method": metodo,
+                "path": ruta,
+                "query_string": consulta.encode(),
+                "headers": encabezados,
+            }
+            await self.asgi.aplicacion(scope, receive, send)
+            return mensajes
+
+        inicio, cuerpo_respuesta = asyncio.run(solicitar_asgi())
+        return inicio["status"], json.loads(cuerpo_respuesta["body"])
+
+    def test_lecturas_asincronas_iguales_a_wsgi(self):
+        rutas = [
+            ("/receta/{}".format(self.receta.id), ""),
+            ("/recetas/{}".format(self.usuario_id), ""),
+            ("/recetas/{}".format(self.usuario_id), "limit=1&orden=nombre"),
+            ("/ingrediente/{}".format(self.ingrediente.id), ""),
+            ("/ingredientes", "limit=2"),
+        ]
+        for ruta, consulta in rutas:
+            with self.subTest(ruta=ruta, consulta=consulta):
+                esperado = self.client.get(ruta + "?" + consulta, headers=self.headers)
+                estado, datos = self.solicitar("GET", ruta, consulta)
+                self.assertEqual(estado, 200)
+                self.assertEqual(datos, json.loads(esperado.get_data()))
+
+    def test_errores_y_escrituras_usan_la_vista_sincrona(self):
+        estado, _ = self.solicitar(
+            "GET", "/receta/{}".format(self.receta.id), autenticado=False
+        )
+        self.assertEqual(estado, 401)
+        estado, _ = self.solicitar("GET", "/receta/{}".format(self.receta.id + 1000))
+        self.assertEqual(estado, 404)
+        estado, _ = self.solicitar("GET", "/ingredientes", "limit=0")
+        self.assertEqual(estado, 400)
+
+        estado, datos = self.solicitar(
+            "PATCH", "/receta/{}".format(self.receta.id), cuerpo={"porcion": 4}
+        )
+        self.assertEqual(estado, 200)
+        db.session.expire_all()
+        self.assertEqual(float(Receta.query.get(self.receta.id).porcion), 4)
@@ -0,0 +1,117 @@
+import hashlib
+import json
+
+from faker import Faker
+from flask_jwt_extended import decode_token
+from sqlalchemy import event
+from modelos import db, Usuario, Rol
+from vistas import cache_autorizacion
+
+from app import app
+from tests.base import PruebaApp
+
+
+class TestAutorizacion(PruebaApp):
+    def setUp(self):
+        self.data_factory = Faker()
+        self.client = app.test_client()
+        self.usuarios_creados = []
+
+        self.administrador, self.token = self.crear_usuario(Rol.ADMINISTRADOR)
+        self.otro_administrador, _ = self.crear_usuario(Rol.ADMINISTRADOR)
+        self.headers = {"Authorization": "Bearer {}".format(self.token)}
+
+    def tearDown(self):
+        for id_usuario in self.usuarios_creados:
+            usuario = Usuario.query.get(id_usuario)
+            if usuario is not None:
+                db.session.delete(usuario)
+        db.session.commit()
+
+    def crear_usuario(self, rol):
+        contrasena = "T1$" + self.data_factory.word()
+        usuario = Usuario(
+            usuario="test_" + self.data_factory.email(),
+            contrasena=hashlib.md5(contrasena.encode("utf-8")).hexdigest(),
+            rol=rol,
+        )
+        db.session.add(usuario)
+        db.session.commit()
+        self.usuarios_creados.append(usuario.id)
+
+        solicitud_login = self.client.post(
+            "/login",
+            data=json.dumps({"usuario": usuario.usuario, "contrasena": contrasena}),
+            headers={"Content-Type": "application/json"},
+        )
+        return usuario.id, json.loads(solicitud_login.get_data())["token"]
+
+    def consultas_usuario(self, ruta):
+        consultas = []
+
+        def registrar_consulta(conn, cursor, statement, *args):
+            if "FROM usuario" in statement:
+                consultas.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", registrar_consulta)
+        try:
+            resultado = self.client.get(ruta, headers=self.headers)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", registrar_consulta)
+        return resultado, len(consultas)
+
+    def test_claims_del_token(self):
+        with app.app_context():
+            claims = decode_token(self.token)
+        self.assertEqual(claims["sub"], self.administrador)
+        self.assertEqual(claims["rol"], Rol.ADMINISTRADOR.name)
+        self.assertIsNone(claims["restaurante_id"])
+
+    def test_autorizar_sin_consultar_usuario(self):
+        # El usuario del token se autoriza con sus claims
+        for ruta in ["/restaurantes/{}", "/menu-semana/{}"]:
+            with self.subTest(ruta=ruta):
+                resultado, consultas = self.consultas_usuario(
+                    ruta.format(self.administrador)
+                )
+                self.assertEqual(resultado.status_code, 200)
+                self.assertEqual(consultas, 0)
+
+        # Otro usuario se consulta una vez y luego sale de la caché
+        ruta = "/menu-semana/{}".format(self.otro_administrador)
+        _, consultas = self.consultas_usuario(ruta)
+        self.assertEqual(consultas, 1)
+        _, consultas = self.consultas_usuario(ruta)
+        self.assertEqual(consultas, 0)
+
+    def test_escrituras_invalidan_la_autorizacion(self):
+        ruta = "/menu-semana/{}".format(self.otro_administrador)
+        self.consultas_usuario(ruta)
+        usuario = Usuario.query.get(self.otro_administrador)
+        usuario.rol = Rol.CHEF
+        db.session.commit()
+        resultado = self.client.get(
+            "/chefs/{}".format(self.otro_administrador), headers=self.headers
+        )
+        self.assertEqual(resultado.status_code, 401)
+
+        # Los claims de un usuario borrado después del login se descartan
+        db.session.delete(Usuario.query.get(self.administrador))
+        db.session.commit()
+        resultado = self.client.get(
+            "/menu-semana/{}".format(self.administrador), headers=self.headers
+        )
+        self.assertEqual(resultado.status_code, 404)
+
+    def test_cambios_de_otro_proceso(self):
+        # Sin el estado en memoria de este proceso (otro worker, python -m
+        # trabajador o un reinicio) los claims de antes del cambio se descartan
+        usuario = Usuario.query.get(self.administrador)
+        usuario.rol = Rol.CHEF
+        db.session.commit()
+        cache_autorizacion.limpiar()
+
+        resultado = self.client.get(
+            "/chefs/{}".format(self.administrador), headers=self.headers
+        )
+        self.assertEqual(resultado.status_code, 401)
@@ -0,0 +1,55 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from sqlalchemy import create_engine, text
+
+from benchmarks.datos import ESCALAS, sembrar
+from benchmarks.ejecutar import comparar, percentil_util
+
+
+class TestBenchmark(TestCase):
+    def test_sembrar_escala_humo(self):
+        escala = ESCALAS["humo"]
+        with tempfile.TemporaryDirectory() as directorio:
+            motor = create_engine(
+                "sqlite:///" + os.path.join(directorio, "benchmark.sqlite")
+            )
+            muestra = sembrar(motor, escala, semilla=1)
+            with motor.connect() as conexion:
+                lineas_por_receta = conexion.execute(
+                    text(
+                        "SELECT min(c), max(c) FROM (SELECT count(*) AS c "
+                        "FROM receta_ingrediente GROUP BY receta)"
+                    )
+                ).one()
+                traslapes = conexion.execute(
+                    text(
+                        "SELECT count(*) FROM menu_semana a JOIN menu_semana b "
+                        "ON a.id_restaurante = b.id_restaurante AND a.id < b.id "
+                        "AND a.fecha_inicial <= b.fecha_final "
+                        "AND b.fecha_inicial <= a.fecha_final"
+                    )
+                ).scalar()
+            motor.dispose()
+
+        self.assertEqual(muestra["conteos"]["ingrediente"], escala["ingredientes"])
+        self.assertEqual(
+            muestra["conteos"]["menu_semana"],
+            escala["administradores"] * escala["restaurantes"] * escala["semanas"],
+        )
+        self.assertGreaterEqual(lineas_por_receta[0], escala["min_lineas"])
+        self.assertLessEqual(lineas_por_receta[1], escala["max_lineas"])
+        self.assertEqual(traslapes, 0)
+
+    def test_percentiles_y_comparacion(self):
+        valores = list(range(1, 101))
+        self.assertEqual(percentil_util(valores, 50), 50)
+        self.assertEqual(percentil_util(valores, 99), 99)
+        self.assertIsNone(percentil_util([], 95))
+
+        linea_base = {"cliente": {"GET chefs": {"p95_ms": 10.0}}}
+        actual = {"cliente": {"GET chefs": {"p95_ms": 13.0}}}
+        comparacion = comparar(actual, linea_base, 1.2)
+        self.assertTrue(comparacion[0]["regresion"])
+        self.assertFalse(comparar(actual, linea_base, 1.5)[0]["regresion"])
@@ -0,0 +1,89 @@
+import time
+
+from modelos import db, Ingrediente
+from vistas.cache import CacheLocal, CacheRedis, CacheRespuestas, cache_respuestas
+
+from app import app
+from tests.base import PruebaApp
+
+
+class ClienteRedisFalso:
+    def __init__(self):
+        self.valores = {}
+
+    def get(self, llave):
+        return self.valores.get(llave)
+
+    def set(self, llave, valor, ex=None):
+        self.valores[llave] = valor.encode("utf-8")
+
+
+class TestCache(PruebaApp):
+    def test_cache_local_expulsa_menos_usado(self):
+        cache = CacheLocal(ttl=60, max_entradas=2)
+        cache.guardar("a", "1")
+        cache.guardar("b", "2")
+        cache.obtener("a")
+        cache.guardar("c", "3")
+
+        self.assertEqual(cache.obtener("a"), "1")
+        self.assertIsNone(cache.obtener("b"))
+        self.assertEqual(cache.obtener("c"), "3")
+
+    def test_cache_local_limite_bytes(self):
+        cache = CacheLocal(ttl=60, max_bytes=10)
+        cache.guardar("a", "x" * 6)
+        cache.guardar("b", "y" * 6)
+        cache.guardar("c", "z" * 11)
+
+        self.assertIsNone(cache.obtener("a"))
+        self.assertEqual(cache.obtener("b"), "y" * 6)
+        self.assertIsNone(cache.obtener("c"))
+        self.assertEqual(cache.bytes_totales, 6)
+
+    def test_cache_local_expira(self):
+        cache = CacheLocal(ttl=0.01)
+        cache.guardar("a", "1")
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.obtener("a"))
+
+    def test_cache_redis(self):
+        cache = CacheRedis(ClienteRedisFalso(), ttl=60)
+        cache.guardar("a", "1")
+
+        self.assertEqual(cache.obtener("a"), "1")
+        self.assertIsNone(cache.obtener("b"))
+
+    def test_versiones_compartidas_entre_workers(self):
+        # Otra instancia, con su propio respaldo local, hace las veces de otro
+        # worker: una escritura confirmada en este cambia también su ETag
+        otro_worker = CacheRespuestas()
+        with app.test_request_context("/ingredientes"):
+            etag = otro_worker.calcular_etag(["ingrediente", "receta"])
+            self.assertEqual(
+                cache_respuestas.calcular_etag(["ingrediente", "receta"]), etag
+            )
+
+            ingrediente = Ingrediente(nombre="sal", unidad="kg", costo=1, calorias=0)
+            db.session.add(ingrediente)
+            db.session.commit()
+            nuevo_etag = otro_worker.calcular_etag(["ingrediente", "receta"])
+            db.session.delete(ingrediente)
+            db.session.commit()
+        self.assertNotEqual(nuevo_etag, etag)
+
+        # Las escrituras revertidas no cambian la versión
+        with app.test_request_context("/ingredientes"):
+            etag = otro_worker.calcular_etag(["ingrediente"])
+            db.session.add(Ingrediente(nombre="sal", unidad="kg"))
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(otro_worker.calcular_etag(["ingrediente"]), etag)
+
+    def test_etag_depende_del_formato(self):
+        etags = []
+        for accept in ("application/json", "application/x-ndjson"):
+            with app.test_request_context("/ingredientes", headers={"Accept": accept}):
+                etags.append(cache_respuestas.calcular_etag(["ingrediente"]))
+        self.assertNotEqual(etags[0], etags[1])
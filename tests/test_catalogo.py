@@ -0,0 +1,175 @@
+import json
+import hashlib
+
+from faker import Faker
+from sqlalchemy import event
+from modelos import (
+    db,
+    Ingrediente,
+    Receta,
+    RecetaIngrediente,
+    Rol,
+    Trabajo,
+    Usuario,
+)
+from vistas import catalogo_ingredientes, cola_trabajos, serializar_ingredientes_util
+from vistas.catalogo import CatalogoIngredientes
+
+from app import app
+from tests.base import PruebaApp
+
+
+class TestCatalogo(PruebaApp):
+    def setUp(self):
+        self.data_factory = Faker()
+        self.client = app.test_client()
+
+        nombre_usuario = "test_" + self.data_factory.email()
+        contrasena = "T1$" + self.data_factory.word()
+        usuario = Usuario(
+            usuario=nombre_usuario,
+            contrasena=hashlib.md5(contrasena.encode("utf-8")).hexdigest(),
+            rol=Rol.ADMINISTRADOR,
+        )
+        db.session.add(usuario)
+        db.session.commit()
+        self.usuario_id = usuario.id
+
+        solicitud_login = self.client.post(
+            "/login",
+            data=json.dumps({"usuario": nombre_usuario, "contrasena": contrasena}),
+            headers={"Content-Type": "application/json"},
+        )
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer {}".format(
+                json.loads(solicitud_login.get_data())["token"]
+            ),
+        }
+
+        # Incluye nulos, ceros y textos que no son ASCII
+        self.ingredientes = [
+            Ingrediente(
+                nombre="ñame", unidad="kg", costo=0.45, calorias=1.5, sitio="plaza"
+            ),
+            Ingrediente(nombre="sal", unidad=None, costo=0, calorias=0, sitio=None),
+            Ingrediente(nombre="agua", unidad="l", costo=1, calorias=None, sitio=""),
+        ]
+        db.session.add_all(self.ingredientes)
+        db.session.commit()
+        self.ids = [ingrediente.id for ingrediente in self.ingredientes]
+
+    def tearDown(self):
+        for receta in Receta.query.filter(Receta.usuario == self.usuario_id):
+            db.session.delete(receta)
+        Ingrediente.query.filter(Ingrediente.id.in_(self.ids)).delete()
+        db.session.delete(Usuario.query.get(self.usuario_id))
+        db.session.commit()
+
+    def consultas_ingrediente(self, funcion):
+        consultas = []
+
+        def registrar_consulta(conn, cursor, statement, *args):
+            if "FROM ingrediente" in statement:
+                consultas.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", registrar_consulta)
+        try:
+            resultado = funcion()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", registrar_consulta)
+        return resultado, len(consultas)
+
+    def test_misma_salida_que_el_schema(self):
+        db.session.expire_all()
+        esperado = serializar_ingredientes_util(
+            Ingrediente.query.filter(Ingrediente.id.in_(self.ids)).all()
+        )
+        instantanea = catalogo_ingredientes.instantanea()
+        self.assertEqual(instantanea.ingredientes(self.ids + [0]), esperado)
+        self.assertIsNone(instantanea.buscar(max(self.ids) + 1000))
+
+    def test_receta_sin_consultar_ingredientes(self):
+        receta = Receta(
+            nombre="sopa",
+            usuario=self.usuario_id,
+            ingredientes=[
+                RecetaIngrediente(cantidad=1, ingrediente=id_ingrediente)
+                for id_ingrediente in self.ids
+            ],
+        )
+        db.session.add(receta)
+        db.session.commit()
+        catalogo_ingredientes.instantanea()
+
+        resultado, consultas = self.consultas_ingrediente(
+            lambda: self.client.get(
+                "/receta/{}".format(receta.id), headers=self.headers
+            )
+        )
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(consultas, 0)
+        self.assertEqual(
+            json.loads(resultado.get_data())["ingredientes"][0]["ingrediente"][
+                "nombre"
+            ],
+            "ñame",
+        )
+
+        # Una escritura confirmada cambia la versión: la lectura consulta la
+        # base con una consulta IN, sin reconstruir el catálogo
+        self.ingredientes[0].nombre = "yuca"
+        db.session.commit()
+
+        def listar():
+            return self.client.get(
+                "/recetas/{}".format(self.usuario_id), headers=self.headers
+            )
+
+        resultado, consultas = self.consultas_ingrediente(listar)
+        self.assertEqual(consultas, 1)
+        self.assertEqual(
+            json.loads(resultado.get_data())[0]["ingredientes"][0]["ingrediente"][
+                "nombre"
+            ],
+            "yuca",
+        )
+        self.assertIsNone(catalogo_ingredientes.instantanea(reconstruir=False))
+
+        # Un solo trabajo lo reconstruye para toda la ráfaga de escrituras
+        self.ingredientes[1].nombre = "sal marina"
+        db.session.commit()
+        reconstrucciones = Trabajo.query.filter(
+            Trabajo.id.in_(cola_trabajos.drenar()),
+            Trabajo.tipo == "reconstruir_catalogo",
+        ).count()
+        self.assertEqual(reconstrucciones, 1)
+        resultado, consultas = self.consultas_ingrediente(listar)
+        self.assertEqual(consultas, 0)
+        self.assertEqual(
+            json.loads(resultado.get_data())[0]["ingredientes"][1]["ingrediente"][
+                "nombre"
+            ],
+            "sal marina",
+        )
+
+    def test_compartido_entre_workers(self):
+        # Otra instancia hace las veces de otro worker sobre el mismo archivo
+        otro_worker = CatalogoIngredientes()
+        primera = catalogo_ingredientes.instantanea()
+        segunda, consultas = self.consultas_ingrediente(otro_worker.instantanea)
+        self.assertEqual(consultas, 0)
+        self.assertEqual(segunda.version, primera.version)
+
+        db.session.delete(self.ingredientes.pop())
+        db.session.commit()
+        self.ids.pop()
+        self.assertIsNone(otro_worker.instantanea(reconstruir=False))
+        nueva, consultas = self.consultas_ingrediente(otro_worker.instantanea)
+        self.assertEqual(consultas, 1)
+        self.assertNotEqual(nueva.version, primera.version)
+        self.assertEqual(len(nueva.ingredientes(self.ids)), 2)
+
+        # El primer worker mapea la instantánea publicada, sin reconstruirla
+        _, consultas = self.consultas_ingrediente(catalogo_ingredientes.instantanea)
+        self.assertEqual(consultas, 0)
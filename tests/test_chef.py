@@ -1,15 +1,15 @@
 import json
 import hashlib
-from unittest import TestCase
 
 from faker import Faker
 from faker.generator import random
 from modelos import db, Usuario, Restaurante, Rol
 
 from app import app
+from tests.base import PruebaApp
 
 
-class TestChef(TestCase):
+class TestChef(PruebaApp):
     def setUp(self):
         self.data_factory = Faker()
         self.client = app.test_client()
@@ -169,3 +169,34 @@ class TestChef(TestCase):
         self.assertIn("usuario", chef)
         self.assertIn("rol", chef)
         self.assertIn("restaurantes", chef)
+
+    def test_listar_chefs_restaurante_resumen(self):
+        for i in range(3):
+            nuevo_chef = Usuario(
+                nombre=self.data_factory.sentence(),
+                usuario=self.data_factory.sentence(),
+                contrasena=self.data_factory.sentence(),
+                rol=Rol.CHEF,
+                restaurante_id=self.restaurante.id,
+            )
+            db.session.add(nuevo_chef)
+            db.session.commit()
+            self.chefs_creados.append(nuevo_chef)
+
+        solicitud_listar_chefs = self.client.get(
+            f"/chefs/{self.usuario_id}?restaurante=resumen",
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.token}",
+            },
+        )
+
+        respuesta_listar_chefs = json.loads(solicitud_listar_chefs.get_data())
+
+        self.assertEqual(solicitud_listar_chefs.status_code, 200)
+        self.assertEqual(len(respuesta_listar_chefs), 3)
+        for chef in respuesta_listar_chefs:
+            self.assertEqual(chef["restaurante"]["id"], str(self.restaurante.id))
+            self.assertEqual(chef["restaurante"]["nombre"], self.restaurante.nombre)
+            self.assertNotIn("chefs", chef["restaurante"])
+            self.assertNotIn("menu_semana", chef["restaurante"])
@@ -1,15 +1,17 @@
 import json
 import hashlib
-from unittest import TestCase
 
 from faker import Faker
 from faker.generator import random
-from modelos import db, Usuario, Ingrediente, Rol
+from modelos import db, Usuario, Ingrediente, Receta, RecetaIngrediente, Rol
+from vistas import cola_trabajos
+from vistas.paginacion import codificar_cursor
 
 from app import app
+from tests.base import PruebaApp
 
 
-class TestIngrediente(TestCase):
+class TestIngrediente(PruebaApp):
     def setUp(self):
         self.data_factory = Faker()
         self.client = app.test_client()
@@ -302,3 +304,361 @@ class TestIngrediente(TestCase):
                     )
                     self.assertEqual(ingrediente["sitio"], ingrediente_creado.sitio)
                     self.assertEqual(ingrediente["id"], str(ingrediente_creado.id))
+
+    def test_listar_ingredientes_paginado(self):
+        # Los dos primeros sin nombre, que van antes que el resto
+        for i in range(0, 5):
+            ingrediente = Ingrediente(
+                nombre=self.data_factory.sentence() if i >= 2 else None,
+                unidad=self.data_factory.sentence(),
+                calorias=round(random.uniform(0.1, 0.99), 2),
+                costo=round(random.uniform(0.1, 0.99), 2),
+                sitio=self.data_factory.sentence(),
+            )
+            db.session.add(ingrediente)
+            db.session.commit()
+            self.ingredientes_creados.append(ingrediente)
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer {}".format(self.token),
+        }
+
+        # Recorrer todas las páginas por nombre siguiendo el cursor
+        ids_paginados = []
+        nombres_paginados = []
+        endpoint_ingredientes = "/ingredientes?limit=2&orden=nombre&fields=id,nombre"
+        while endpoint_ingredientes is not None:
+            resultado = self.client.get(endpoint_ingredientes, headers=headers)
+            datos_respuesta = json.loads(resultado.get_data())
+            self.assertEqual(resultado.status_code, 200)
+            self.assertLessEqual(len(datos_respuesta["items"]), 2)
+            for ingrediente in datos_respuesta["items"]:
+                self.assertEqual(set(ingrediente.keys()), {"id", "nombre"})
+                ids_paginados.append(ingrediente["id"])
+                nombres_paginados.append(ingrediente["nombre"])
+            endpoint_ingredientes = None
+            if datos_respuesta["next"] is not None:
+                endpoint_ingredientes = (
+                    "/ingredientes?limit=2&orden=nombre&fields=id,nombre&cursor="
+                    + datos_respuesta["next"]
+                )
+
+        self.assertEqual(len(ids_paginados), len(set(ids_paginados)))
+        self.assertEqual(len(ids_paginados), Ingrediente.query.count())
+        self.assertEqual(
+            nombres_paginados,
+            sorted(nombres_paginados, key=lambda nombre: (nombre is not None, nombre)),
+        )
+        for ingrediente_creado in self.ingredientes_creados:
+            self.assertIn(str(ingrediente_creado.id), ids_paginados)
+
+    def test_listar_ingredientes_ndjson(self):
+        headers = {"Authorization": "Bearer {}".format(self.token)}
+        resultado_json = self.client.get(
+            "/ingredientes?orden=nombre&fields=id,nombre", headers=headers
+        )
+
+        resultado = self.client.get(
+            "/ingredientes?orden=nombre&fields=id,nombre",
+            headers=dict(headers, Accept="application/x-ndjson"),
+        )
+        lineas = resultado.get_data(as_text=True).splitlines()
+
+        # El flujo no pasa por la caché de respuestas
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(resultado.mimetype, "application/x-ndjson")
+        self.assertNotIn("ETag", resultado.headers)
+        # Una caché compartida distingue los dos formatos del mismo path
+        self.assertIn("Accept", resultado.vary)
+        self.assertIn("Accept", resultado_json.vary)
+        self.assertEqual(
+            [json.loads(linea) for linea in lineas],
+            json.loads(resultado_json.get_data()),
+        )
+
+    def test_listar_ingredientes_parametros_invalidos(self):
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer {}".format(self.token),
+        }
+
+        for parametros in ["limit=0", "cursor=invalido", "fields=inexistente"]:
+            resultado = self.client.get("/ingredientes?" + parametros, headers=headers)
+            self.assertEqual(resultado.status_code, 400)
+
+        # Cursores bien codificados pero con valores de otro tipo
+        for valores in [
+            ["nombre", ["a"], 1],
+            ["nombre", {"a": 1}, 1],
+            ["nombre", "a", [1]],
+            ["nombre", "a", True],
+            ["id", "a", 1],
+            [["id"], None, 1],
+        ]:
+            resultado = self.client.get(
+                "/ingredientes?orden={}&cursor={}".format(
+                    valores[0] if isinstance(valores[0], str) else "id",
+                    codificar_cursor(valores),
+                ),
+                headers=headers,
+            )
+            self.assertEqual(resultado.status_code, 400, valores)
+
+    def test_listar_ingredientes_etag(self):
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer {}".format(self.token),
+        }
+
+        resultado = self.client.get("/ingredientes", headers=headers)
+        etag = resultado.headers["ETag"]
+        self.assertEqual(resultado.status_code, 200)
+
+        # Sin cambios el servidor responde 304 sin cuerpo
+        resultado_sin_cambios = self.client.get(
+            "/ingredientes", headers=dict(headers, **{"If-None-Match": etag})
+        )
+        self.assertEqual(resultado_sin_cambios.status_code, 304)
+        self.assertEqual(resultado_sin_cambios.get_data(), b"")
+
+        # Crear un ingrediente cambia la versión y por lo tanto el ETag
+        ingrediente = Ingrediente(
+            nombre=self.data_factory.sentence(),
+            unidad=self.data_factory.sentence(),
+            calorias=round(random.uniform(0.1, 0.99), 2),
+            costo=round(random.uniform(0.1, 0.99), 2),
+            sitio=self.data_factory.sentence(),
+        )
+        db.session.add(ingrediente)
+        db.session.commit()
+        self.ingredientes_creados.append(ingrediente)
+
+        resultado_con_cambios = self.client.get(
+            "/ingredientes", headers=dict(headers, **{"If-None-Match": etag})
+        )
+        datos_respuesta = json.loads(resultado_con_cambios.get_data())
+        self.assertEqual(resultado_con_cambios.status_code, 200)
+        self.assertNotEqual(resultado_con_cambios.headers["ETag"], etag)
+        self.assertIn(str(ingrediente.id), [i["id"] for i in datos_respuesta])
+
+    def test_importar_exportar_ingredientes_lote(self):
+        prefijo = "lote " + self.data_factory.uuid4()
+        ingrediente = Ingrediente(
+            nombre=prefijo + " existente",
+            unidad="kg",
+            costo=1,
+            calorias=1,
+            sitio=self.data_factory.sentence(),
+        )
+        db.session.add(ingrediente)
+        db.session.commit()
+        self.ingredientes_creados.append(ingrediente)
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer {}".format(self.token),
+        }
+
+        filas = [
+            {
+                "nombre": prefijo + " nuevo",
+                "unidad": "gr",
+                "costo": 2.5,
+                "calorias": 10,
+                "sitio": "plaza",
+            },
+            {
+                "id": ingrediente.id,
+                "nombre": ingrediente.nombre,
+                "unidad": "kg",
+                "costo": 3,
+                "calorias": 4,
+                "sitio": "tienda",
+            },
+            {"nombre": prefijo + " sin costo", "unidad": "gr", "sitio": "plaza"},
+            {
+                "nombre": prefijo + " costo invalido",
+                "unidad": "gr",
+                "costo": "caro",
+                "calorias": 1,
+                "sitio": "plaza",
+            },
+        ]
+        resultado = self.client.post(
+            "/ingredientes/lote", data=json.dumps(filas), headers=headers
+        )
+        reporte = json.loads(resultado.get_data())
+
+        # Las recetas de los ingredientes actualizados se recalculan en un
+        # trabajo en segundo plano
+        self.assertEqual(resultado.status_code, 202)
+        self.assertTrue(
+            resultado.headers["Location"].endswith(reporte["trabajo"]["url"])
+        )
+        self.assertEqual(reporte["insertados"], 1)
+        self.assertEqual(reporte["actualizados"], 1)
+        self.assertEqual([error["fila"] for error in reporte["errores"]], [3, 4])
+        self.assertIn("costo", reporte["errores"][0]["errores"])
+        self.assertEqual(float(Ingrediente.query.get(ingrediente.id).costo), 3)
+        self.assertIn(reporte["trabajo"]["id"], cola_trabajos.drenar())
+
+        # Un CSV con el mismo nombre actualiza el ingrediente en lugar de duplicarlo
+        csv_ingredientes = (
+            "nombre,unidad,costo,calorias,sitio\n"
+            + prefijo
+            + " nuevo,gr,7,10,plaza\n"
+            + prefijo
+            + " csv,ml,1,1,plaza\n"
+        )
+        resultado = self.client.post(
+            "/ingredientes/lote",
+            data=csv_ingredientes,
+            headers=dict(headers, **{"Content-Type": "text/csv"}),
+        )
+        reporte = json.loads(resultado.get_data())
+        self.assertEqual(resultado.status_code, 202)
+        self.assertEqual((reporte["insertados"], reporte["actualizados"]), (1, 1))
+
+        importados = Ingrediente.query.filter(
+            Ingrediente.nombre.like(prefijo + "%"), Ingrediente.id != ingrediente.id
+        ).all()
+        self.ingredientes_creados.extend(importados)
+        self.assertEqual(
+            sorted(i.nombre for i in importados), [prefijo + " csv", prefijo + " nuevo"]
+        )
+
+        resultado = self.client.get(
+            "/ingredientes/lote?formato=ndjson", headers=headers
+        )
+        exportados = [
+            json.loads(linea) for linea in resultado.get_data(as_text=True).splitlines()
+        ]
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(len(exportados), Ingrediente.query.count())
+        exportados_por_id = {fila["id"]: fila for fila in exportados}
+        self.assertEqual(float(exportados_por_id[str(ingrediente.id)]["costo"]), 3)
+
+    def test_borrar_ingredientes_lote(self):
+        ingredientes = []
+        for _ in range(3):
+            ingrediente = Ingrediente(
+                nombre=self.data_factory.sentence(),
+                unidad="kg",
+                costo=1,
+                calorias=1,
+                sitio=self.data_factory.sentence(),
+            )
+            db.session.add(ingrediente)
+            ingredientes.append(ingrediente)
+        db.session.commit()
+        usado = ingredientes[0]
+        self.ingredientes_creados.append(usado)
+
+        recetas = [
+            Receta(
+                nombre=self.data_factory.sentence(),
+                ingredientes=[RecetaIngrediente(cantidad=1, ingrediente=usado.id)],
+            )
+            for _ in range(2)
+        ]
+        db.session.add_all(recetas)
+        db.session.commit()
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer {}".format(self.token),
+        }
+        ids = [ingrediente.id for ingrediente in ingredientes]
+        id_inexistente = max(ids) + 1000
+        resultado = self.client.delete(
+            "/ingredientes/lote",
+            data=json.dumps({"ids": ids + [id_inexistente]}),
+            headers=headers,
+        )
+        respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(respuesta["borrados"], ids[1:])
+        self.assertEqual(respuesta["bloqueados"], [{"id": usado.id, "recetas": 2}])
+        self.assertEqual(respuesta["no_encontrados"], [id_inexistente])
+        self.assertIsNone(Ingrediente.query.get(ids[1]))
+        self.assertIsNotNone(Ingrediente.query.get(usado.id))
+
+        # El borrado individual también se bloquea mientras haya recetas
+        resultado = self.client.delete(
+            "/ingrediente/{}".format(usado.id), headers=headers
+        )
+        self.assertEqual(resultado.status_code, 409)
+
+        for receta in recetas:
+            db.session.delete(receta)
+        db.session.commit()
+
+    def test_buscar_ingredientes(self):
+        # Una marca única para no depender de los demás ingredientes de la base
+        marca = "marca" + self.data_factory.hexify("^^^^^^^^")
+        for nombre in ["Café " + marca, "Cafetera " + marca, "Piña " + marca]:
+            ingrediente = Ingrediente(
+                nombre=nombre, unidad="kg", costo=1, calorias=1, sitio="Plaza central"
+            )
+            db.session.add(ingrediente)
+            db.session.commit()
+            self.ingredientes_creados.append(ingrediente)
+        cafe, cafetera, pina = self.ingredientes_creados
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer {}".format(self.token),
+        }
+
+        def buscar(consulta, parametros=""):
+            resultado = self.client.get(
+                "/ingredientes/buscar?q={}{}".format(consulta, parametros),
+                headers=headers,
+            )
+            self.assertEqual(resultado.status_code, 200)
+            return json.loads(resultado.get_data())
+
+        # Sin tildes, con mayúsculas y por prefijo
+        ids = [item["id"] for item in buscar("PINA " + marca)["items"]]
+        self.assertEqual(ids, [str(pina.id)])
+        ids = [item["id"] for item in buscar("caf " + marca)["items"]]
+        self.assertEqual(set(ids), {str(cafe.id), str(cafetera.id)})
+
+        # Paginado por relevancia siguiendo el cursor
+        ids_paginados = []
+        respuesta = buscar(marca, "&limit=2&fields=id")
+        ids_paginados += [item["id"] for item in respuesta["items"]]
+        self.assertIsNotNone(respuesta["next"])
+        respuesta = buscar(marca, "&limit=2&fields=id&cursor=" + respuesta["next"])
+        ids_paginados += [item["id"] for item in respuesta["items"]]
+        self.assertIsNone(respuesta["next"])
+        self.assertEqual(
+            sorted(ids_paginados), sorted(str(i.id) for i in self.ingredientes_creados)
+        )
+
+        # El índice sigue las ediciones y los borrados
+        self.client.put(
+            "/ingrediente/{}".format(pina.id),
+            data=json.dumps(
+                {
+                    "nombre": "Mango " + marca,
+                    "unidad": "kg",
+                    "costo": 1,
+                    "calorias": 1,
+                    "sitio": "Plaza central",
+                }
+            ),
+            headers=headers,
+        )
+        self.assertEqual(buscar("pina " + marca)["items"], [])
+        self.assertEqual(len(buscar("mango " + marca)["items"]), 1)
+        self.client.delete("/ingrediente/{}".format(cafetera.id), headers=headers)
+        self.ingredientes_creados.remove(cafetera)
+        self.assertEqual(len(buscar("caf " + marca)["items"]), 1)
+
+        for parametros in ["q=", "q=*()", "q=cafe&orden=nombre"]:
+            resultado = self.client.get(
+                "/ingredientes/buscar?" + parametros, headers=headers
+            )
+            self.assertEqual(resultado.status_code, 400)
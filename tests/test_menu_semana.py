@@ -1,16 +1,28 @@
 import json
 import hashlib
-from unittest import TestCase
+import threading
 
 from faker import Faker
 from faker.generator import random
-from datetime import datetime, timedelta
-from modelos import db, Usuario, MenuSemana, Receta, Rol
+from datetime import date, datetime, timedelta
+from sqlalchemy import event
+from modelos import (
+    db,
+    Usuario,
+    Ingrediente,
+    MenuSemana,
+    MenuReceta,
+    Receta,
+    RecetaIngrediente,
+    Restaurante,
+    Rol,
+)
 
 from app import app
+from tests.base import PruebaApp
 
 
-class TestMenuSemana(TestCase):
+class TestMenuSemana(PruebaApp):
     def setUp(self) -> None:
         self.data_factory = Faker()
         self.client = app.test_client()
@@ -42,6 +54,7 @@ class TestMenuSemana(TestCase):
 
         self.menu_semana_creados = []
         self.recetas_creadas = []
+        self.restaurantes_creados = []
         for i in range(3):
             self.crear_receta()
 
@@ -49,6 +62,9 @@ class TestMenuSemana(TestCase):
         for menu_creado in self.menu_semana_creados:
             menu = MenuSemana.query.get(menu_creado.id)
             db.session.delete(menu)
+        for restaurante_creado in self.restaurantes_creados:
+            restaurante = Restaurante.query.get(restaurante_creado.id)
+            db.session.delete(restaurante)
         for receta_creada in self.recetas_creadas:
             receta = Receta.query.get(receta_creada.id)
             db.session.delete(receta)
@@ -111,3 +127,206 @@ class TestMenuSemana(TestCase):
         )
         datos_respuesta = json.loads(resultado_get_menu_semana.get_data())
         self.assertEqual(resultado_get_menu_semana.status_code, 200)
+
+    def crear_restaurante(self):
+        restaurante = Restaurante(
+            nombre=self.data_factory.sentence(),
+            direccion=self.data_factory.sentence(),
+            telefono=self.data_factory.word(),
+            administrador_id=self.usuario_id,
+        )
+        db.session.add(restaurante)
+        db.session.commit()
+        self.restaurantes_creados.append(restaurante)
+        return restaurante
+
+    def crear_menus(self, restaurante, cantidad):
+        fecha_base = date(2000, 1, 3) + timedelta(weeks=len(self.menu_semana_creados))
+        for i in range(cantidad):
+            fecha_inicial = fecha_base + timedelta(weeks=i)
+            menu = MenuSemana(
+                nombre=self.data_factory.sentence(),
+                fecha_inicial=fecha_inicial,
+                fecha_final=fecha_inicial + timedelta(days=6),
+                id_restaurante=restaurante.id,
+                id_usuario=self.usuario_id,
+                recetas=[
+                    MenuReceta(receta=receta.id) for receta in self.recetas_creadas
+                ],
+            )
+            db.session.add(menu)
+            self.menu_semana_creados.append(menu)
+        db.session.commit()
+
+    def contar_consultas_get_menu_semana(self):
+        consultas = []
+
+        def registrar_consulta(conn, cursor, statement, *args):
+            consultas.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", registrar_consulta)
+        try:
+            resultado = self.client.get(
+                "/menu-semana/{}".format(self.usuario_id),
+                headers={"Authorization": "Bearer {}".format(self.token)},
+            )
+        finally:
+            event.remove(db.engine, "before_cursor_execute", registrar_consulta)
+        return resultado, len(consultas)
+
+    def test_get_menu_semana_consultas_acotadas(self):
+        restaurante = self.crear_restaurante()
+        self.crear_menus(restaurante, 2)
+        resultado, consultas_pocos_menus = self.contar_consultas_get_menu_semana()
+        self.assertEqual(len(json.loads(resultado.get_data())), 2)
+
+        self.crear_menus(restaurante, 8)
+        resultado, consultas_muchos_menus = self.contar_consultas_get_menu_semana()
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(len(datos_respuesta), 10)
+        self.assertEqual(consultas_muchos_menus, consultas_pocos_menus)
+        for menu in datos_respuesta:
+            self.assertEqual(len(menu["recetas"]), 3)
+            self.assertEqual(menu["usuario"]["rol"], Rol.ADMINISTRADOR.name)
+
+    def test_get_menu_semana_ndjson(self):
+        restaurante = self.crear_restaurante()
+        self.crear_menus(restaurante, 3)
+        endpoint = "/menu-semana/{}".format(self.usuario_id)
+        headers = {"Authorization": "Bearer {}".format(self.token)}
+        resultado_json = self.client.get(endpoint, headers=headers)
+
+        resultado = self.client.get(
+            endpoint, headers=dict(headers, Accept="application/x-ndjson")
+        )
+        lineas = resultado.get_data(as_text=True).splitlines()
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(resultado.mimetype, "application/x-ndjson")
+        self.assertEqual(
+            [json.loads(linea) for linea in lineas],
+            json.loads(resultado_json.get_data()),
+        )
+
+    def solicitud_crear_menu(self, id_restaurante, fecha_inicial):
+        nuevo_menu = {
+            "nombre": self.data_factory.sentence(),
+            "fechaInicial": fecha_inicial.strftime("%Y-%m-%d"),
+            "fechaFinal": (fecha_inicial + timedelta(days=6)).strftime("%Y-%m-%d"),
+            "recetas": [],
+            "id_restaurante": id_restaurante,
+        }
+        resultado = self.client.post(
+            "/menu-semana/{}".format(self.usuario_id),
+            data=json.dumps(nuevo_menu),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": "Bearer {}".format(self.token),
+            },
+        )
+        if resultado.status_code == 200:
+            self.menu_semana_creados.append(
+                MenuSemana(id=json.loads(resultado.get_data())["id"])
+            )
+        return resultado
+
+    def test_crear_menu_semana_dentro_de_otro_rango(self):
+        restaurante = self.crear_restaurante()
+        menu_largo = MenuSemana(
+            nombre=self.data_factory.sentence(),
+            fecha_inicial=date(2001, 1, 1),
+            fecha_final=date(2001, 1, 31),
+            id_restaurante=restaurante.id,
+            id_usuario=self.usuario_id,
+        )
+        db.session.add(menu_largo)
+        db.session.commit()
+        self.menu_semana_creados.append(menu_largo)
+
+        resultado = self.solicitud_crear_menu(restaurante.id, date(2001, 1, 10))
+        self.assertEqual(resultado.status_code, 400)
+
+        resultado = self.solicitud_crear_menu(restaurante.id, date(2001, 2, 1))
+        self.assertEqual(resultado.status_code, 200)
+
+    def test_crear_menu_semana_concurrente(self):
+        # El id se lee en el hilo principal para no refrescar el objeto desde otro hilo
+        id_restaurante = self.crear_restaurante().id
+        resultados = []
+
+        def crear_menu_en_hilo():
+            resultado = self.solicitud_crear_menu(id_restaurante, date(2002, 3, 4))
+            resultados.append(resultado.status_code)
+
+        hilos = [threading.Thread(target=crear_menu_en_hilo) for i in range(4)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(sorted(resultados), [200, 400, 400, 400])
+        self.assertEqual(
+            MenuSemana.query.filter_by(id_restaurante=id_restaurante).count(), 1
+        )
+
+    def test_lista_compras_menu_semana(self):
+        restaurante = self.crear_restaurante()
+        ingredientes = [
+            Ingrediente(
+                nombre="ingrediente {}".format(i),
+                unidad="gr",
+                costo=i + 1,
+                calorias=10 * (i + 1),
+                sitio=self.data_factory.word(),
+            )
+            for i in range(2)
+        ]
+        db.session.add_all(ingredientes)
+        db.session.commit()
+
+        # Las dos primeras recetas usan ambos ingredientes, la tercera ninguno
+        for receta in self.recetas_creadas[:2]:
+            for ingrediente in ingredientes:
+                receta.ingredientes.append(
+                    RecetaIngrediente(cantidad=2, ingrediente=ingrediente.id)
+                )
+        db.session.commit()
+        self.crear_menus(restaurante, 2)
+        ids_menus = ",".join(str(menu.id) for menu in self.menu_semana_creados)
+        headers = {"Authorization": "Bearer {}".format(self.token)}
+
+        resultado = self.client.get(
+            "/menu-semana/{}/lista-compras?menus={}".format(self.usuario_id, ids_menus),
+            headers=headers,
+        )
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(len(datos_respuesta), 2)
+        for i, linea in enumerate(datos_respuesta):
+            self.assertEqual(linea["id_ingrediente"], ingredientes[i].id)
+            self.assertEqual(linea["unidad"], "gr")
+            # 2 menús x 2 recetas x cantidad 2
+            self.assertEqual(linea["cantidad"], 8)
+            self.assertEqual(linea["costo"], 8 * (i + 1))
+            self.assertEqual(linea["calorias"], 80 * (i + 1))
+
+        resultado_csv = self.client.get(
+            "/menu-semana/{}/lista-compras?fecha_inicial=2000-01-01"
+            "&fecha_final=2000-12-31&formato=csv".format(self.usuario_id),
+            headers=headers,
+        )
+        lineas_csv = resultado_csv.get_data(as_text=True).splitlines()
+
+        self.assertEqual(resultado_csv.status_code, 200)
+        self.assertEqual(resultado_csv.mimetype, "text/csv")
+        self.assertEqual(lineas_csv[0].split(",")[0], "id_ingrediente")
+        self.assertEqual(len(lineas_csv), 3)
+
+        for receta in self.recetas_creadas:
+            receta.ingredientes = []
+        for ingrediente in ingredientes:
+            db.session.delete(ingrediente)
+        db.session.commit()
@@ -0,0 +1,94 @@
+import json
+import hashlib
+
+from faker import Faker
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from modelos import db, Usuario, Rol
+from vistas import instrumentacion
+
+from app import app
+from tests.base import PruebaApp
+
+
+class TestMetricas(PruebaApp):
+    def setUp(self):
+        self.data_factory = Faker()
+        self.client = app.test_client()
+
+        nombre_usuario = "test_" + self.data_factory.name()
+        contrasena = "T1$" + self.data_factory.word()
+        contrasena_encriptada = hashlib.md5(contrasena.encode("utf-8")).hexdigest()
+
+        # Se crea el usuario para identificarse en la aplicación
+        usuario_nuevo = Usuario(
+            usuario=nombre_usuario,
+            contrasena=contrasena_encriptada,
+            rol=Rol.ADMINISTRADOR,
+        )
+        db.session.add(usuario_nuevo)
+        db.session.commit()
+
+        usuario_login = {"usuario": nombre_usuario, "contrasena": contrasena}
+
+        solicitud_login = self.client.post(
+            "/login",
+            data=json.dumps(usuario_login),
+            headers={"Content-Type": "application/json"},
+        )
+
+        respuesta_login = json.loads(solicitud_login.get_data())
+
+        self.usuario_id = respuesta_login["id"]
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer {}".format(respuesta_login["token"]),
+        }
+
+    def tearDown(self):
+        usuario_login = Usuario.query.get(self.usuario_id)
+        db.session.delete(usuario_login)
+        db.session.commit()
+
+    def test_consulta_fallida_no_deja_tiempos(self):
+        with app.test_request_context():
+            instrumentacion.iniciar_solicitud()
+            with db.engine.connect() as conexion:
+                with self.assertRaises(OperationalError):
+                    conexion.execute(text("SELECT * FROM tabla_inexistente"))
+                conexion.execute(text("SELECT 1"))
+                self.assertEqual(g.consultas["cantidad"], 1)
+                self.assertEqual(
+                    [
+                        valor
+                        for valor in conexion.info.values()
+                        if isinstance(valor, list)
+                    ],
+                    [],
+                )
+
+    def test_server_timing_cuenta_consultas(self):
+        resultado = self.client.get(
+            "/menu-semana/{}".format(self.usuario_id), headers=self.headers
+        )
+
+        server_timing = resultado.headers["Server-Timing"]
+        self.assertEqual(resultado.status_code, 200)
+        self.assertIn("db;dur=", server_timing)
+        self.assertIn("total;dur=", server_timing)
+        # La versión del usuario y los menús: el rol viene en el token
+        self.assertIn('desc="2 consultas"', server_timing)
+
+    def test_metricas_por_endpoint(self):
+        for i in range(3):
+            self.client.get("/chefs/{}".format(self.usuario_id), headers=self.headers)
+
+        resultado = self.client.get("/metricas", headers=self.headers)
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        histogramas = datos_respuesta["endpoints"]["GET vistachefs"]
+        self.assertGreaterEqual(histogramas["duracion_ms"]["total"], 3)
+        self.assertGreaterEqual(histogramas["consultas"]["suma"], 3)
+        self.assertIn("+Inf", histogramas["consultas"]["cubetas"])
@@ -0,0 +1,247 @@
+import os
+import tempfile
+
+from sqlalchemy import (
+    Column,
+    ForeignKey,
+    Integer,
+    MetaData,
+    Numeric,
+    String,
+    Table,
+    create_engine,
+    inspect,
+    select,
+    text,
+)
+
+from modelos import (
+    db,
+    Ingrediente,
+    MenuReceta,
+    MenuSemana,
+    Receta,
+    RecetaIngrediente,
+    Restaurante,
+    Rol,
+    Usuario,
+    aplicar_migraciones,
+)
+from modelos.migraciones import INDICES
+from vistas.paginacion import Paginacion
+from vistas.vistas import filtro_menus_usuario_util
+
+from app import app
+from tests.base import PruebaApp
+
+
+def plan_util(consulta):
+    # Detalle de EXPLAIN QUERY PLAN para una consulta ORM o Core
+    sentencia = getattr(consulta, "statement", consulta)
+    sql = sentencia.compile(
+        dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}
+    )
+    filas = db.session.execute(text("EXPLAIN QUERY PLAN {}".format(sql))).fetchall()
+    return [fila[-1] for fila in filas]
+
+
+class TestMigraciones(PruebaApp):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.motor = create_engine(
+            "sqlite:///" + os.path.join(self.directorio.name, "anterior.sqlite")
+        )
+
+        # Esquema anterior: las tablas del modelo sin índices y la receta sin
+        # las columnas de totales
+        metadata = MetaData()
+        Table(
+            "receta",
+            metadata,
+            Column("id", Integer, primary_key=True),
+            Column("nombre", String(128)),
+            Column("duracion", Numeric),
+            Column("porcion", Numeric),
+            Column("preparacion", String),
+            Column("usuario", Integer, ForeignKey("usuario.id")),
+        )
+        for tabla in db.Model.metadata.sorted_tables:
+            if tabla.name != "receta":
+                tabla.to_metadata(metadata).indexes.clear()
+        metadata.create_all(self.motor)
+        with self.motor.begin() as conexion:
+            conexion.execute(
+                text(
+                    "INSERT INTO ingrediente (id, nombre, costo, calorias) "
+                    "VALUES (1, 'Papa', 100, 10), (2, 'Sal', 50, 0)"
+                )
+            )
+            conexion.execute(
+                text("INSERT INTO receta (id, nombre, porcion) VALUES (1, 'Sopa', 2)")
+            )
+            conexion.execute(
+                text(
+                    "INSERT INTO receta_ingrediente (cantidad, ingrediente, receta) "
+                    "VALUES (3, 1, 1), (2, 2, 1)"
+                )
+            )
+
+    def tearDown(self):
+        self.motor.dispose()
+        self.directorio.cleanup()
+
+    def test_migrar_base_existente(self):
+        aplicadas = aplicar_migraciones(self.motor)
+        self.assertEqual(
+            aplicadas,
+            [
+                "totales_receta",
+                "indices",
+                "busqueda",
+                "reportes",
+                "trabajos",
+                "versiones",
+            ],
+        )
+        self.assertEqual(aplicar_migraciones(self.motor), [])
+
+        inspector = inspect(self.motor)
+        indices = {
+            indice["name"]: indice
+            for tabla in inspector.get_table_names()
+            for indice in inspector.get_indexes(tabla)
+        }
+        for nombre, _, columnas, unico in INDICES:
+            self.assertEqual(indices[nombre]["column_names"], list(columnas))
+            self.assertEqual(bool(indices[nombre]["unique"]), unico)
+
+        with self.motor.connect() as conexion:
+            totales = conexion.execute(
+                text(
+                    "SELECT costo_total, calorias_total, costo_porcion "
+                    "FROM receta WHERE id = 1"
+                )
+            ).one()
+        self.assertEqual([float(total) for total in totales], [400, 30, 200])
+
+        # El índice de búsqueda se llena con las filas existentes
+        with self.motor.connect() as conexion:
+            encontrados = conexion.execute(
+                text(
+                    "SELECT rowid FROM ingrediente_fts "
+                    "WHERE ingrediente_fts MATCH 'pap*'"
+                )
+            ).fetchall()
+        self.assertEqual(encontrados, [(1,)])
+
+    def test_usuarios_repetidos_detienen_la_migracion(self):
+        with self.motor.begin() as conexion:
+            conexion.execute(
+                text(
+                    "INSERT INTO usuario (usuario) "
+                    "VALUES ('chef@correo.com'), ('chef@correo.com')"
+                )
+            )
+
+        with self.assertRaises(RuntimeError):
+            aplicar_migraciones(self.motor)
+        with self.motor.connect() as conexion:
+            versiones = conexion.execute(
+                text("SELECT version FROM migracion")
+            ).fetchall()
+        self.assertEqual(versiones, [(1,)])
+
+    def test_indices_del_modelo_en_migraciones(self):
+        indices_modelo = {
+            (indice.name, tabla.name, tuple(c.name for c in indice.columns))
+            for tabla in db.Model.metadata.sorted_tables
+            for indice in tabla.indexes
+        }
+        self.assertEqual(
+            indices_modelo,
+            {(nombre, tabla, columnas) for nombre, tabla, columnas, _ in INDICES},
+        )
+
+
+class TestPlanesConsultas(PruebaApp):
+    def test_consultas_de_las_vistas_usan_indices(self):
+        administrador = Usuario(rol=Rol.ADMINISTRADOR)
+        administrador.id = 1
+        consultas = {
+            "ix_usuario_usuario": Usuario.query.filter(
+                Usuario.usuario == "chef@correo.com", Usuario.contrasena == "x"
+            ),
+            "ix_receta_usuario": Receta.query.filter_by(usuario=str(1)),
+            "ix_receta_ingrediente_receta": RecetaIngrediente.query.filter(
+                RecetaIngrediente.receta.in_([1, 2])
+            ),
+            "ix_receta_ingrediente_ingrediente": RecetaIngrediente.query.filter_by(
+                ingrediente=1
+            ),
+            "ix_menu_receta_menu": MenuReceta.query.filter(MenuReceta.menu.in_([1])),
+            "ix_menu_semana_nombre": MenuSemana.query.filter_by(nombre="Semana 1"),
+            "ix_menu_semana_restaurante_fechas": MenuSemana.query.filter(
+                filtro_menus_usuario_util(administrador)
+            ),
+            "ix_restaurante_administrador_nombre": Restaurante.query.filter(
+                Restaurante.administrador_id == 1
+            ).filter(Restaurante.nombre == "Restaurante"),
+            "ix_usuario_restaurante_id": Usuario.query.filter(
+                Usuario.restaurante_id.in_([1, 2]), Usuario.rol == Rol.CHEF
+            ),
+            "ix_ingrediente_nombre": select(Ingrediente.id).where(
+                Ingrediente.nombre.in_(["Papa", "Sal"])
+            ),
+        }
+        for indice, consulta in consultas.items():
+            with self.subTest(indice=indice):
+                plan = plan_util(consulta)
+                self.assertTrue(
+                    any(indice in detalle for detalle in plan), "\n".join(plan)
+                )
+
+        # El filtro por administrador usa también el índice del restaurante
+        plan = plan_util(
+            MenuSemana.query.filter(filtro_menus_usuario_util(administrador))
+        )
+        self.assertTrue(
+            any("ix_restaurante_administrador_nombre" in detalle for detalle in plan)
+        )
+
+        # Las páginas por nombre se recorren en el índice, sin ordenar en una
+        # tabla temporal, también a partir de un cursor
+        for cursor in (None, ["nombre", "Papa", 3], ["nombre", None, 3]):
+            paginacion = Paginacion(10, cursor, "nombre")
+            for consulta, columna_id, columna_nombre, indice in [
+                (
+                    Ingrediente.query,
+                    Ingrediente.id,
+                    Ingrediente.nombre,
+                    "ix_ingrediente_nombre",
+                ),
+                (
+                    Restaurante.query.filter_by(administrador_id=1),
+                    Restaurante.id,
+                    Restaurante.nombre,
+                    "ix_restaurante_administrador_nombre",
+                ),
+            ]:
+                with self.subTest(indice=indice, cursor=cursor):
+                    plan = plan_util(
+                        paginacion.preparar(consulta, columna_id, columna_nombre)
+                    )
+                    self.assertIn(indice, plan[0])
+                    self.assertFalse(any("TEMP B-TREE" in detalle for detalle in plan))
+
+        # La búsqueda de menús traslapados es un recorrido acotado del índice
+        # compuesto, sin ordenar en una tabla temporal
+        plan = plan_util(
+            MenuSemana.query.filter(
+                MenuSemana.id_restaurante == 1,
+                MenuSemana.fecha_inicial <= "2023-01-07",
+            )
+            .order_by(MenuSemana.fecha_inicial.desc())
+            .limit(1)
+        )
+        self.assertIn("ix_menu_semana_restaurante_fechas", plan[0])
+        self.assertFalse(any("TEMP B-TREE" in detalle for detalle in plan))
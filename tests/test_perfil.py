@@ -0,0 +1,23 @@
+from sqlalchemy import text
+
+from modelos import db
+
+from app import app
+from tests.base import PruebaApp
+
+
+class TestPerfil(PruebaApp):
+    def test_pragmas_perfil_produccion(self):
+        self.assertEqual(app.config["DB_PERFIL"], "produccion")
+        with db.engine.connect() as conexion:
+            journal = conexion.execute(text("PRAGMA journal_mode")).scalar()
+            synchronous = conexion.execute(text("PRAGMA synchronous")).scalar()
+            busy_timeout = conexion.execute(text("PRAGMA busy_timeout")).scalar()
+            cache_size = conexion.execute(text("PRAGMA cache_size")).scalar()
+
+        self.assertEqual(journal, "wal")
+        # 1 corresponde a NORMAL
+        self.assertEqual(synchronous, 1)
+        self.assertEqual(busy_timeout, app.config["SQLITE_BUSY_TIMEOUT_MS"])
+        self.assertEqual(cache_size, -app.config["SQLITE_CACHE_SIZE_KB"])
+        self.assertEqual(db.engine.pool.size(), app.config["DB_POOL_SIZE"])
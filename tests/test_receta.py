@@ -0,0 +1,488 @@
+import json
+import hashlib
+from unittest import mock
+
+from faker import Faker
+from faker.generator import random
+from sqlalchemy import event
+from modelos import db, Usuario, Ingrediente, Receta, RecetaIngrediente, Rol
+from vistas import actualizar_totales_receta_util, cola_trabajos
+
+from app import app
+from tests.base import PruebaApp
+
+
+class TestReceta(PruebaApp):
+    def setUp(self):
+        self.data_factory = Faker()
+        self.client = app.test_client()
+
+        nombre_usuario = "test_" + self.data_factory.name()
+        contrasena = "T1$" + self.data_factory.word()
+        contrasena_encriptada = hashlib.md5(contrasena.encode("utf-8")).hexdigest()
+
+        # Se crea el usuario para identificarse en la aplicación
+        usuario_nuevo = Usuario(
+            usuario=nombre_usuario,
+            contrasena=contrasena_encriptada,
+            rol=Rol.ADMINISTRADOR,
+        )
+        db.session.add(usuario_nuevo)
+        db.session.commit()
+
+        usuario_login = {"usuario": nombre_usuario, "contrasena": contrasena}
+
+        solicitud_login = self.client.post(
+            "/login",
+            data=json.dumps(usuario_login),
+            headers={"Content-Type": "application/json"},
+        )
+
+        respuesta_login = json.loads(solicitud_login.get_data())
+
+        self.token = respuesta_login["token"]
+        self.usuario_id = respuesta_login["id"]
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer {}".format(self.token),
+        }
+
+        self.ingredientes_creados = []
+        self.recetas_creadas = []
+        for i in range(3):
+            self.crear_ingrediente()
+
+    def tearDown(self):
+        for receta_creada in self.recetas_creadas:
+            receta = Receta.query.get(receta_creada.id)
+            if receta is not None:
+                db.session.delete(receta)
+        db.session.commit()
+
+        for ingrediente_creado in self.ingredientes_creados:
+            ingrediente = Ingrediente.query.get(ingrediente_creado.id)
+            db.session.delete(ingrediente)
+        db.session.commit()
+
+        usuario_login = Usuario.query.get(self.usuario_id)
+        db.session.delete(usuario_login)
+        db.session.commit()
+
+    def crear_ingrediente(self):
+        ingrediente = Ingrediente(
+            nombre=self.data_factory.sentence(),
+            unidad=self.data_factory.word(),
+            costo=round(random.uniform(0.1, 0.99), 2),
+            calorias=round(random.uniform(0.1, 0.99), 2),
+            sitio=self.data_factory.sentence(),
+        )
+        db.session.add(ingrediente)
+        db.session.commit()
+        self.ingredientes_creados.append(ingrediente)
+        return ingrediente
+
+    def crear_receta(self, ingredientes):
+        receta = Receta(
+            nombre=self.data_factory.word(),
+            duracion=self.data_factory.random_int(1, 60),
+            porcion=self.data_factory.random_int(1, 10),
+            preparacion=self.data_factory.text(),
+            ingredientes=[
+                RecetaIngrediente(
+                    cantidad=self.data_factory.random_int(1, 5),
+                    ingrediente=ingrediente.id,
+                )
+                for ingrediente in ingredientes
+            ],
+            usuario=self.usuario_id,
+        )
+        actualizar_totales_receta_util(receta)
+        db.session.add(receta)
+        db.session.commit()
+        self.recetas_creadas.append(receta)
+        return receta
+
+    def test_listar_recetas_resuelve_ingredientes(self):
+        self.crear_receta(self.ingredientes_creados)
+        self.crear_receta(self.ingredientes_creados[:2])
+
+        resultado = self.client.get(
+            "/recetas/{}".format(self.usuario_id), headers=self.headers
+        )
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(len(datos_respuesta), 2)
+        ingredientes_por_id = {
+            str(ingrediente.id): ingrediente
+            for ingrediente in self.ingredientes_creados
+        }
+        for receta in datos_respuesta:
+            for receta_ingrediente in receta["ingredientes"]:
+                ingrediente = receta_ingrediente["ingrediente"]
+                ingrediente_creado = ingredientes_por_id[ingrediente["id"]]
+                self.assertEqual(ingrediente["nombre"], ingrediente_creado.nombre)
+                self.assertEqual(ingrediente["costo"], float(ingrediente_creado.costo))
+
+    def test_listar_recetas_ndjson(self):
+        for _ in range(3):
+            self.crear_receta(self.ingredientes_creados)
+        endpoint = "/recetas/{}".format(self.usuario_id)
+        resultado_json = self.client.get(endpoint, headers=self.headers)
+
+        # Con lotes de 2 el flujo se arma en dos fragmentos
+        with mock.patch("vistas.flujos.TAMANO_LOTE_FLUJO", 2):
+            resultado = self.client.get(
+                endpoint, headers=dict(self.headers, Accept="application/x-ndjson")
+            )
+            lineas = resultado.get_data(as_text=True).splitlines()
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(resultado.mimetype, "application/x-ndjson")
+        self.assertEqual(
+            [json.loads(linea) for linea in lineas],
+            json.loads(resultado_json.get_data()),
+        )
+
+        resultado = self.client.get(
+            endpoint + "?limit=1",
+            headers=dict(self.headers, Accept="application/x-ndjson"),
+        )
+        self.assertEqual(resultado.status_code, 400)
+
+    def test_dar_receta_resuelve_ingredientes(self):
+        receta = self.crear_receta(self.ingredientes_creados)
+
+        resultado = self.client.get(
+            "/receta/{}".format(receta.id), headers=self.headers
+        )
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(datos_respuesta["nombre"], receta.nombre)
+        self.assertEqual(
+            sorted(
+                receta_ingrediente["ingrediente"]["id"]
+                for receta_ingrediente in datos_respuesta["ingredientes"]
+            ),
+            sorted(str(ingrediente.id) for ingrediente in self.ingredientes_creados),
+        )
+
+    def calcular_totales(self, lineas):
+        costo = sum(
+            cantidad * float(ingrediente.costo) for ingrediente, cantidad in lineas
+        )
+        calorias = sum(
+            cantidad * float(ingrediente.calorias) for ingrediente, cantidad in lineas
+        )
+        return costo, calorias
+
+    def test_crear_receta_calcula_totales(self):
+        lineas = [(ingrediente, 2) for ingrediente in self.ingredientes_creados]
+        nueva_receta = {
+            "nombre": self.data_factory.word(),
+            "preparacion": self.data_factory.text(),
+            "duracion": 30,
+            "porcion": 4,
+            "ingredientes": [
+                {"cantidad": cantidad, "idIngrediente": str(ingrediente.id)}
+                for ingrediente, cantidad in lineas
+            ],
+        }
+
+        resultado = self.client.post(
+            "/recetas/{}".format(self.usuario_id),
+            data=json.dumps(nueva_receta),
+            headers=self.headers,
+        )
+        datos_respuesta = json.loads(resultado.get_data())
+        receta = Receta.query.get(datos_respuesta["id"])
+        self.recetas_creadas.append(receta)
+
+        costo, calorias = self.calcular_totales(lineas)
+        self.assertEqual(resultado.status_code, 200)
+        self.assertAlmostEqual(float(receta.costo_total), costo, places=4)
+        self.assertAlmostEqual(float(receta.calorias_total), calorias, places=4)
+        self.assertAlmostEqual(float(receta.costo_porcion), costo / 4, places=4)
+
+    def test_crear_y_clonar_recetas_lote(self):
+        plantilla = self.crear_receta(self.ingredientes_creados[:2])
+        definiciones = [
+            {
+                "nombre": "lote {}".format(i),
+                "preparacion": self.data_factory.text(),
+                "duracion": 10,
+                "porcion": 2,
+                "ingredientes": [
+                    {"cantidad": i + 1, "idIngrediente": str(ingrediente.id)}
+                    for ingrediente in self.ingredientes_creados[: i + 1]
+                ],
+            }
+            for i in range(3)
+        ]
+
+        consultas = []
+
+        def registrar_consulta(conn, cursor, statement, *args):
+            consultas.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", registrar_consulta)
+        try:
+            resultado = self.client.post(
+                "/recetas/{}/lote".format(self.usuario_id),
+                data=json.dumps({"recetas": definiciones, "clonar": [plantilla.id]}),
+                headers=self.headers,
+            )
+        finally:
+            event.remove(db.engine, "before_cursor_execute", registrar_consulta)
+        datos_respuesta = json.loads(resultado.get_data())
+        self.assertEqual(resultado.status_code, 200)
+        ids = datos_respuesta["ids"] + [
+            clon["id"] for clon in datos_respuesta["clonadas"]
+        ]
+        self.recetas_creadas.extend(Receta.query.get(id_receta) for id_receta in ids)
+
+        # Los ingredientes se validan con una sola consulta IN
+        self.assertEqual(
+            len([c for c in consultas if "FROM ingrediente" in c and " IN " in c]), 1
+        )
+        for i, id_receta in enumerate(datos_respuesta["ids"]):
+            receta = Receta.query.get(id_receta)
+            self.assertEqual(receta.nombre, "lote {}".format(i))
+            lineas = [
+                (ingrediente, i + 1)
+                for ingrediente in self.ingredientes_creados[: i + 1]
+            ]
+            self.assertEqual(len(receta.ingredientes), i + 1)
+            costo, calorias = self.calcular_totales(lineas)
+            self.assertAlmostEqual(float(receta.costo_total), costo, places=4)
+            self.assertAlmostEqual(float(receta.calorias_total), calorias, places=4)
+            self.assertAlmostEqual(float(receta.costo_porcion), costo / 2, places=4)
+
+        clon = Receta.query.get(datos_respuesta["clonadas"][0]["id"])
+        self.assertEqual(datos_respuesta["clonadas"][0]["origen"], plantilla.id)
+        self.assertEqual(clon.nombre, plantilla.nombre)
+        self.assertEqual(clon.costo_total, plantilla.costo_total)
+        self.assertEqual(
+            sorted((l.ingrediente, l.cantidad) for l in clon.ingredientes),
+            sorted((l.ingrediente, l.cantidad) for l in plantilla.ingredientes),
+        )
+
+        # Un ingrediente inexistente rechaza todo el lote
+        recetas_antes = Receta.query.filter_by(usuario=self.usuario_id).count()
+        definiciones[1]["ingredientes"][0]["idIngrediente"] = "0"
+        resultado = self.client.post(
+            "/recetas/{}/lote".format(self.usuario_id),
+            data=json.dumps(definiciones),
+            headers=self.headers,
+        )
+        self.assertEqual(resultado.status_code, 400)
+        errores = json.loads(resultado.get_data())["errores"]
+        self.assertEqual([error["receta"] for error in errores], [1])
+        self.assertEqual(
+            Receta.query.filter_by(usuario=self.usuario_id).count(), recetas_antes
+        )
+
+    def test_lote_clonar_usuario_excede_maximo(self):
+        for _ in range(3):
+            self.crear_receta(self.ingredientes_creados[:1])
+        recetas_antes = Receta.query.filter_by(usuario=self.usuario_id).count()
+
+        consultas = []
+
+        def registrar_consulta(conn, cursor, statement, *args):
+            consultas.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", registrar_consulta)
+        try:
+            with mock.patch("vistas.vistas.MAXIMO_RECETAS_LOTE", 2):
+                resultado = self.client.post(
+                    "/recetas/{}/lote".format(self.usuario_id),
+                    data=json.dumps({"clonar_usuario": self.usuario_id}),
+                    headers=self.headers,
+                )
+        finally:
+            event.remove(db.engine, "before_cursor_execute", registrar_consulta)
+        self.assertEqual(resultado.status_code, 400)
+        self.assertIn("Máximo 2", json.loads(resultado.get_data()))
+
+        # Se rechaza con el LIMIT, sin leer las líneas de las recetas
+        self.assertTrue(any("LIMIT" in c and "FROM receta " in c for c in consultas))
+        self.assertFalse(any("FROM receta_ingrediente" in c for c in consultas))
+        self.assertEqual(
+            Receta.query.filter_by(usuario=self.usuario_id).count(), recetas_antes
+        )
+
+    def test_editar_receta_recalcula_totales(self):
+        receta = self.crear_receta(self.ingredientes_creados)
+        linea_conservada = receta.ingredientes[0]
+        ingrediente_nuevo = self.ingredientes_creados[2]
+        receta_editada = {
+            "nombre": receta.nombre,
+            "preparacion": receta.preparacion,
+            "duracion": 10,
+            "porcion": 2,
+            "ingredientes": [
+                {
+                    "id": str(linea_conservada.id),
+                    "cantidad": 3,
+                    "idIngrediente": str(linea_conservada.ingrediente),
+                },
+                {"id": "", "cantidad": 1, "idIngrediente": str(ingrediente_nuevo.id)},
+            ],
+        }
+
+        resultado = self.client.put(
+            "/receta/{}".format(receta.id),
+            data=json.dumps(receta_editada),
+            headers=self.headers,
+        )
+
+        receta = Receta.query.get(receta.id)
+        ingrediente_conservado = Ingrediente.query.get(linea_conservada.ingrediente)
+        costo, calorias = self.calcular_totales(
+            [(ingrediente_conservado, 3), (ingrediente_nuevo, 1)]
+        )
+        self.assertEqual(resultado.status_code, 200)
+        self.assertAlmostEqual(float(receta.costo_total), costo, places=4)
+        self.assertAlmostEqual(float(receta.calorias_total), calorias, places=4)
+        self.assertAlmostEqual(float(receta.costo_porcion), costo / 2, places=4)
+
+    def test_editar_ingrediente_recalcula_totales_recetas(self):
+        receta_con = self.crear_receta(self.ingredientes_creados)
+        receta_sin = self.crear_receta(self.ingredientes_creados[1:])
+        costo_sin_antes = receta_sin.costo_total
+        ingrediente = self.ingredientes_creados[0]
+        ingrediente_editado = {
+            "nombre": ingrediente.nombre,
+            "unidad": ingrediente.unidad,
+            "costo": 10.5,
+            "calorias": 20.25,
+            "sitio": ingrediente.sitio,
+        }
+
+        resultado = self.client.put(
+            "/ingrediente/{}".format(ingrediente.id),
+            data=json.dumps(ingrediente_editado),
+            headers=self.headers,
+        )
+
+        # El ingrediente se usa en recetas: sus totales se recalculan en un
+        # trabajo en segundo plano
+        self.assertEqual(resultado.status_code, 202)
+        trabajo = json.loads(
+            self.client.get(
+                resultado.headers["Location"], headers=self.headers
+            ).get_data()
+        )
+        self.assertEqual(trabajo["estado"], "PENDIENTE")
+        self.assertIn(trabajo["id"], cola_trabajos.drenar())
+        trabajo = json.loads(
+            self.client.get(
+                resultado.headers["Location"], headers=self.headers
+            ).get_data()
+        )
+        self.assertEqual(trabajo["estado"], "COMPLETADO")
+        self.assertEqual(trabajo["resultado"], {"recetas": 1})
+
+        receta_con = Receta.query.get(receta_con.id)
+        lineas = [
+            (Ingrediente.query.get(linea.ingrediente), float(linea.cantidad))
+            for linea in receta_con.ingredientes
+        ]
+        costo, calorias = self.calcular_totales(lineas)
+        self.assertAlmostEqual(float(receta_con.costo_total), costo, places=4)
+        self.assertAlmostEqual(float(receta_con.calorias_total), calorias, places=4)
+        self.assertEqual(Receta.query.get(receta_sin.id).costo_total, costo_sin_antes)
+
+    def test_editar_receta_parcial(self):
+        receta = self.crear_receta(self.ingredientes_creados)
+        nombre = receta.nombre
+        editada, borrada, intacta = receta.ingredientes
+        ingrediente_nuevo = self.crear_ingrediente()
+        cambios = {
+            "porcion": 5,
+            "ingredientes": [
+                {
+                    "id": str(editada.id),
+                    "cantidad": 7,
+                    "idIngrediente": str(editada.ingrediente),
+                },
+                {"id": str(borrada.id), "borrar": True},
+                {"id": "", "cantidad": 2, "idIngrediente": str(ingrediente_nuevo.id)},
+            ],
+        }
+        lineas_esperadas = {
+            editada.ingrediente: 7,
+            intacta.ingrediente: float(intacta.cantidad),
+            ingrediente_nuevo.id: 2,
+        }
+
+        resultado = self.client.patch(
+            "/receta/{}".format(receta.id),
+            data=json.dumps(cambios),
+            headers=self.headers,
+        )
+
+        self.assertEqual(resultado.status_code, 200)
+        receta = Receta.query.get(receta.id)
+        self.assertEqual(receta.nombre, nombre)
+        self.assertEqual(float(receta.porcion), 5)
+        self.assertEqual(
+            {linea.ingrediente: float(linea.cantidad) for linea in receta.ingredientes},
+            lineas_esperadas,
+        )
+        costo, calorias = self.calcular_totales(
+            [
+                (Ingrediente.query.get(id_ingrediente), cantidad)
+                for id_ingrediente, cantidad in lineas_esperadas.items()
+            ]
+        )
+        self.assertAlmostEqual(float(receta.costo_total), costo, places=4)
+        self.assertAlmostEqual(float(receta.calorias_total), calorias, places=4)
+        self.assertAlmostEqual(float(receta.costo_porcion), costo / 5, places=4)
+
+        # Una línea de otra receta se rechaza sin aplicar ningún cambio
+        otra_receta = self.crear_receta(self.ingredientes_creados[:1])
+        resultado = self.client.patch(
+            "/receta/{}".format(receta.id),
+            data=json.dumps(
+                {
+                    "nombre": "otro nombre",
+                    "ingredientes": [
+                        {"id": str(otra_receta.ingredientes[0].id), "borrar": True}
+                    ],
+                }
+            ),
+            headers=self.headers,
+        )
+        self.assertEqual(resultado.status_code, 400)
+        self.assertEqual(Receta.query.get(receta.id).nombre, nombre)
+        self.assertEqual(len(otra_receta.ingredientes), 1)
+
+    def test_buscar_recetas(self):
+        receta = self.crear_receta(self.ingredientes_creados[:2])
+        receta.nombre = "Ajiaco santafereño"
+        receta.preparacion = "Cocinar las papas con guascas"
+        self.crear_receta(self.ingredientes_creados[:1])
+        db.session.commit()
+
+        resultado = self.client.get(
+            "/recetas/{}/buscar?q=santaferen guasca".format(self.usuario_id),
+            headers=self.headers,
+        )
+        datos_respuesta = json.loads(resultado.get_data())
+
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(
+            [item["id"] for item in datos_respuesta["items"]], [str(receta.id)]
+        )
+        ingrediente = datos_respuesta["items"][0]["ingredientes"][0]["ingrediente"]
+        self.assertIn("nombre", ingrediente)
+
+        # Solo se buscan las recetas del usuario
+        resultado = self.client.get(
+            "/recetas/{}/buscar?q=ajiaco".format(self.usuario_id + 1000),
+            headers=self.headers,
+        )
+        self.assertEqual(json.loads(resultado.get_data())["items"], [])
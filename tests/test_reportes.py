@@ -0,0 +1,244 @@
+import json
+import hashlib
+from datetime import date, timedelta
+
+from faker import Faker
+from sqlalchemy import event, select
+from modelos import (
+    db,
+    Usuario,
+    Ingrediente,
+    MenuSemana,
+    MenuReceta,
+    Receta,
+    RecetaIngrediente,
+    Restaurante,
+    Rol,
+)
+from modelos.reportes import TABLAS_REPORTES, reconstruir_resumenes
+from vistas import actualizar_totales_receta_util, cola_trabajos
+
+from app import app
+from tests.base import PruebaApp
+
+
+class TestReportes(PruebaApp):
+    def setUp(self):
+        self.data_factory = Faker()
+        self.client = app.test_client()
+
+        nombre_usuario = "test_" + self.data_factory.email()
+        contrasena = "T1$" + self.data_factory.word()
+        usuario = Usuario(
+            usuario=nombre_usuario,
+            contrasena=hashlib.md5(contrasena.encode("utf-8")).hexdigest(),
+            rol=Rol.ADMINISTRADOR,
+        )
+        db.session.add(usuario)
+        db.session.commit()
+        self.usuario_id = usuario.id
+
+        solicitud_login = self.client.post(
+            "/login",
+            data=json.dumps({"usuario": nombre_usuario, "contrasena": contrasena}),
+            headers={"Content-Type": "application/json"},
+        )
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer {}".format(
+                json.loads(solicitud_login.get_data())["token"]
+            ),
+        }
+
+        self.restaurante = Restaurante(
+            nombre=self.data_factory.sentence(), administrador_id=self.usuario_id
+        )
+        db.session.add(self.restaurante)
+        self.arroz = Ingrediente(
+            nombre="arroz", unidad="kg", costo=2, calorias=100, sitio="plaza"
+        )
+        self.pollo = Ingrediente(
+            nombre="pollo", unidad="kg", costo=10, calorias=300, sitio="plaza"
+        )
+        db.session.add_all([self.arroz, self.pollo])
+        db.session.commit()
+
+        # Costo 12 en 4 porciones y costo 4 en 2 porciones
+        self.arroz_con_pollo = self.crear_receta(4, [(self.arroz, 1), (self.pollo, 1)])
+        self.arroz_blanco = self.crear_receta(2, [(self.arroz, 2)])
+        self.menus = []
+
+    def tearDown(self):
+        for menu in self.menus:
+            menu = MenuSemana.query.get(menu.id)
+            if menu is not None:
+                db.session.delete(menu)
+        db.session.delete(Restaurante.query.get(self.restaurante.id))
+        db.session.delete(Usuario.query.get(self.usuario_id))
+        db.session.commit()
+        for ingrediente in (self.arroz, self.pollo):
+            db.session.delete(Ingrediente.query.get(ingrediente.id))
+        db.session.commit()
+
+    def crear_receta(self, porcion, lineas):
+        receta = Receta(
+            nombre=self.data_factory.word(),
+            duracion=10,
+            porcion=porcion,
+            preparacion=self.data_factory.text(),
+            ingredientes=[
+                RecetaIngrediente(cantidad=cantidad, ingrediente=ingrediente.id)
+                for ingrediente, cantidad in lineas
+            ],
+            usuario=self.usuario_id,
+        )
+        actualizar_totales_receta_util(receta)
+        db.session.add(receta)
+        db.session.commit()
+        return receta
+
+    def crear_menus(self, cantidad, recetas):
+        fecha_base = date(2001, 1, 1) + timedelta(weeks=len(self.menus))
+        for i in range(cantidad):
+            fecha_inicial = fecha_base + timedelta(weeks=i)
+            menu = MenuSemana(
+                nombre=self.data_factory.sentence(),
+                fecha_inicial=fecha_inicial,
+                fecha_final=fecha_inicial + timedelta(days=6),
+                id_restaurante=self.restaurante.id,
+                id_usuario=self.usuario_id,
+                recetas=[MenuReceta(receta=receta.id) for receta in recetas],
+            )
+            db.session.add(menu)
+            self.menus.append(menu)
+        db.session.commit()
+
+    def reporte(self, ruta="/reportes/{}/restaurantes/{}"):
+        consultas = []
+
+        def registrar_consulta(conn, cursor, statement, *args):
+            consultas.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", registrar_consulta)
+        try:
+            resultado = self.client.get(
+                ruta.format(self.usuario_id, self.restaurante.id),
+                headers=self.headers,
+            )
+        finally:
+            event.remove(db.engine, "before_cursor_execute", registrar_consulta)
+        self.assertEqual(resultado.status_code, 200)
+        return json.loads(resultado.get_data()), len(consultas)
+
+    def resumenes(self):
+        return {
+            tabla.name: sorted(
+                tuple(str(valor) for valor in fila)
+                for fila in db.session.execute(select(tabla))
+            )
+            for tabla in TABLAS_REPORTES
+        }
+
+    def test_reporte_restaurante(self):
+        self.crear_menus(2, [self.arroz_con_pollo, self.arroz_blanco])
+        reporte, consultas_pocos_menus = self.reporte()
+
+        self.assertEqual(reporte["menus"], 2)
+        self.assertEqual(reporte["recetas"], 4)
+        self.assertAlmostEqual(reporte["costo_total"], 32)
+        self.assertAlmostEqual(reporte["costo_promedio_porcion"], 2.5)
+        self.assertAlmostEqual(reporte["calorias_total"], 1200)
+        self.assertEqual(
+            [
+                (ingrediente["nombre"], ingrediente["usos"])
+                for ingrediente in reporte["ingredientes_mas_usados"]
+            ],
+            [("arroz", 4), ("pollo", 2)],
+        )
+        self.assertEqual(len(reporte["tendencia_costos"]), 2)
+
+        # El número de consultas no depende de la historia del restaurante
+        self.crear_menus(10, [self.arroz_blanco])
+        reporte, consultas_muchos_menus = self.reporte()
+        self.assertEqual(reporte["menus"], 12)
+        self.assertEqual(consultas_muchos_menus, consultas_pocos_menus)
+
+        fechas = [semana["fecha_inicial"] for semana in reporte["tendencia_costos"]]
+        self.assertEqual(fechas, sorted(fechas))
+        self.assertEqual(reporte["tendencia_costos"][-1]["costo_total"], 4)
+
+        reporte, _ = self.reporte("/reportes/{}/restaurantes/{}?semanas=3")
+        self.assertEqual(len(reporte["tendencia_costos"]), 3)
+
+    def test_reporte_menu(self):
+        self.crear_menus(1, [self.arroz_con_pollo, self.arroz_blanco])
+        reporte, consultas = self.reporte(
+            "/reportes/{{}}/menu-semana/{}".format(self.menus[0].id)
+        )
+
+        self.assertEqual(reporte["recetas"], 2)
+        self.assertAlmostEqual(reporte["costo_total"], 16)
+        self.assertAlmostEqual(reporte["costo_promedio_porcion"], 2.5)
+        self.assertEqual(reporte["ingredientes_mas_usados"][0]["cantidad"], 3)
+
+    def test_escrituras_actualizan_los_resumenes(self):
+        self.crear_menus(3, [self.arroz_con_pollo])
+
+        # El cambio de precio de un ingrediente llega a los menús que lo usan
+        resultado = self.client.put(
+            "/ingrediente/{}".format(self.pollo.id),
+            data=json.dumps(
+                {
+                    "nombre": "pollo",
+                    "unidad": "kg",
+                    "costo": 20,
+                    "calorias": 300,
+                    "sitio": "plaza",
+                }
+            ),
+            headers=self.headers,
+        )
+        self.assertEqual(resultado.status_code, 202)
+        cola_trabajos.drenar()
+        reporte, _ = self.reporte()
+        self.assertAlmostEqual(reporte["costo_total"], 66)
+
+        # Editar las líneas de la receta cambia los ingredientes más usados
+        resultado = self.client.put(
+            "/receta/{}".format(self.arroz_con_pollo.id),
+            data=json.dumps(
+                {
+                    "nombre": "arroz",
+                    "preparacion": "hervir",
+                    "duracion": 10,
+                    "porcion": 4,
+                    "ingredientes": [{"idIngrediente": self.arroz.id, "cantidad": 5}],
+                }
+            ),
+            headers=self.headers,
+        )
+        self.assertEqual(resultado.status_code, 200)
+        reporte, _ = self.reporte()
+        self.assertAlmostEqual(reporte["costo_total"], 30)
+        self.assertEqual(
+            [i["nombre"] for i in reporte["ingredientes_mas_usados"]], ["arroz"]
+        )
+
+        db.session.delete(MenuSemana.query.get(self.menus.pop().id))
+        db.session.commit()
+        reporte, _ = self.reporte()
+        self.assertEqual(reporte["menus"], 2)
+        self.assertAlmostEqual(reporte["costo_total"], 20)
+
+        # Las actualizaciones incrementales coinciden con una reconstrucción
+        incrementales = self.resumenes()
+        reconstruir_resumenes(db.session)
+        db.session.commit()
+        self.assertEqual(self.resumenes(), incrementales)
+
+    def test_reporte_de_otro_administrador(self):
+        resultado = self.client.get(
+            "/reportes/{}/restaurantes/{}".format(self.usuario_id, 0),
+            headers=self.headers,
+        )
+        self.assertEqual(resultado.status_code, 404)
@@ -1,15 +1,15 @@
 import json
 import hashlib
-from unittest import TestCase
 
 from faker import Faker
 from faker.generator import random
 from modelos import db, Usuario, Restaurante, Rol
 
 from app import app
+from tests.base import PruebaApp
 
 
-class TestRestaurante(TestCase):
+class TestRestaurante(PruebaApp):
     def setUp(self):
         self.data_factory = Faker()
         self.client = app.test_client()
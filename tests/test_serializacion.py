@@ -0,0 +1,149 @@
+import json
+from datetime import date
+
+from faker import Faker
+from modelos import (
+    db,
+    Ingrediente,
+    IngredienteSchema,
+    MenuReceta,
+    MenuSemana,
+    MenuSemanaSchema,
+    Receta,
+    RecetaIngrediente,
+    RecetaIngredienteSchema,
+    RecetaSchema,
+    Restaurante,
+    RestauranteSchema,
+    Rol,
+    Usuario,
+    UsuarioSchema,
+    serializador_para,
+)
+
+from app import app
+from tests.base import PruebaApp
+
+
+class TestSerializacion(PruebaApp):
+    def setUp(self):
+        self.data_factory = Faker()
+
+        self.administrador = Usuario(
+            usuario="test_" + self.data_factory.email(),
+            contrasena=self.data_factory.md5(),
+            rol=Rol.ADMINISTRADOR,
+        )
+        db.session.add(self.administrador)
+        db.session.commit()
+
+        self.restaurante = Restaurante(
+            nombre=self.data_factory.sentence(),
+            direccion=self.data_factory.address(),
+            is_rappi=True,
+            administrador_id=self.administrador.id,
+        )
+        db.session.add(self.restaurante)
+        db.session.commit()
+
+        self.chef = Usuario(
+            usuario="test_" + self.data_factory.email(),
+            contrasena=self.data_factory.md5(),
+            nombre=self.data_factory.name(),
+            rol=Rol.CHEF,
+            restaurante_id=self.restaurante.id,
+        )
+        self.ingredientes = [
+            Ingrediente(
+                nombre=self.data_factory.word(),
+                unidad="gr",
+                costo=1.25,
+                calorias=30,
+                sitio=self.data_factory.word(),
+            ),
+            Ingrediente(nombre=self.data_factory.word()),
+        ]
+        db.session.add(self.chef)
+        db.session.add_all(self.ingredientes)
+        db.session.commit()
+
+        self.receta = Receta(
+            nombre=self.data_factory.word(),
+            duracion=15,
+            porcion=2.5,
+            preparacion=self.data_factory.text(),
+            usuario=self.chef.id,
+            ingredientes=[
+                RecetaIngrediente(cantidad=3, ingrediente=ingrediente.id)
+                for ingrediente in self.ingredientes
+            ],
+        )
+        db.session.add(self.receta)
+        db.session.commit()
+
+        self.menu = MenuSemana(
+            nombre=self.data_factory.sentence(),
+            fecha_inicial=date(2003, 1, 6),
+            fecha_final=date(2003, 1, 12),
+            id_restaurante=self.restaurante.id,
+            id_usuario=self.chef.id,
+            recetas=[MenuReceta(receta=self.receta.id)],
+        )
+        db.session.add(self.menu)
+        db.session.commit()
+
+        # Se recargan los objetos desde la base de datos como en las vistas
+        db.session.expire_all()
+
+    def tearDown(self):
+        db.session.delete(MenuSemana.query.get(self.menu.id))
+        db.session.delete(Receta.query.get(self.receta.id))
+        for ingrediente in self.ingredientes:
+            db.session.delete(Ingrediente.query.get(ingrediente.id))
+        db.session.delete(Usuario.query.get(self.chef.id))
+        db.session.delete(Restaurante.query.get(self.restaurante.id))
+        db.session.delete(Usuario.query.get(self.administrador.id))
+        db.session.commit()
+
+    def assertSalidaIdentica(self, schema, objetos):
+        esperado = schema.dump(objetos, many=True)
+        obtenido = serializador_para(schema).serializar(objetos)
+
+        self.assertEqual(obtenido, esperado)
+        self.assertEqual(json.dumps(obtenido), json.dumps(esperado))
+
+    def test_salida_identica_a_los_schemas(self):
+        casos = [
+            (IngredienteSchema(), Ingrediente, [i.id for i in self.ingredientes]),
+            (RecetaSchema(), Receta, [self.receta.id]),
+            (
+                RecetaIngredienteSchema(),
+                RecetaIngrediente,
+                [linea.id for linea in Receta.query.get(self.receta.id).ingredientes],
+            ),
+            (UsuarioSchema(), Usuario, [self.administrador.id, self.chef.id]),
+            (RestauranteSchema(), Restaurante, [self.restaurante.id]),
+            (MenuSemanaSchema(), MenuSemana, [self.menu.id]),
+        ]
+        for schema, modelo, ids in casos:
+            with self.subTest(schema=type(schema).__name__):
+                objetos = modelo.query.filter(modelo.id.in_(ids)).all()
+                self.assertSalidaIdentica(schema, objetos)
+
+    def test_salida_identica_con_proyeccion(self):
+        self.assertSalidaIdentica(
+            UsuarioSchema(only=["usuario", "rol"]), Usuario.query.all()
+        )
+        self.assertSalidaIdentica(
+            RestauranteSchema(only=["id", "nombre", "chefs"]),
+            Restaurante.query.filter_by(id=self.restaurante.id).all(),
+        )
+
+    def test_serializador_se_construye_una_vez(self):
+        self.assertIs(
+            serializador_para(RecetaSchema()), serializador_para(RecetaSchema())
+        )
+        self.assertIsNot(
+            serializador_para(UsuarioSchema()),
+            serializador_para(UsuarioSchema(only=["usuario"])),
+        )
@@ -0,0 +1,264 @@
+import json
+import hashlib
+import os
+import subprocess
+import sys
+from datetime import date, datetime, timedelta
+
+from faker import Faker
+from modelos import (
+    db,
+    EstadoTrabajo,
+    MenuReceta,
+    MenuSemana,
+    Receta,
+    Restaurante,
+    Rol,
+    Trabajo,
+    Usuario,
+)
+from vistas import cola_trabajos
+
+from app import app
+from tests.base import PruebaApp
+
+
+class TestTrabajos(PruebaApp):
+    def setUp(self):
+        # La cola empieza vacía: las escrituras de ingredientes de otras pruebas
+        # dejan encolada la reconstrucción del catálogo
+        cola_trabajos.drenar()
+        self.data_factory = Faker()
+        self.client = app.test_client()
+
+        nombre_usuario = "test_" + self.data_factory.email()
+        contrasena = "T1$" + self.data_factory.word()
+        usuario = Usuario(
+            usuario=nombre_usuario,
+            contrasena=hashlib.md5(contrasena.encode("utf-8")).hexdigest(),
+            rol=Rol.ADMINISTRADOR,
+        )
+        db.session.add(usuario)
+        db.session.commit()
+        self.usuario_id = usuario.id
+
+        solicitud_login = self.client.post(
+            "/login",
+            data=json.dumps({"usuario": nombre_usuario, "contrasena": contrasena}),
+            headers={"Content-Type": "application/json"},
+        )
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer {}".format(
+                json.loads(solicitud_login.get_data())["token"]
+            ),
+        }
+
+        # Una tarea que falla las primeras veces, para probar los reintentos
+        self.fallas = {"pendientes": 0}
+
+        @cola_trabajos.tarea("prueba")
+        def prueba(valor):
+            if self.fallas["pendientes"]:
+                self.fallas["pendientes"] -= 1
+                db.session.add(Receta(nombre="no se guarda", usuario=self.usuario_id))
+                raise RuntimeError("falla de prueba")
+            return {"valor": valor}
+
+    def tearDown(self):
+        cola_trabajos.tareas.pop("prueba")
+        Trabajo.query.filter(Trabajo.id_usuario == self.usuario_id).delete()
+        db.session.delete(Usuario.query.get(self.usuario_id))
+        db.session.commit()
+
+    def encolar(self, **parametros):
+        trabajo = cola_trabajos.encolar(
+            "prueba", id_usuario=self.usuario_id, **parametros
+        )
+        db.session.commit()
+        return trabajo.id
+
+    def estado(self, id_trabajo):
+        resultado = self.client.get(
+            "/trabajos/{}/{}".format(self.usuario_id, id_trabajo), headers=self.headers
+        )
+        self.assertEqual(resultado.status_code, 200)
+        return json.loads(resultado.get_data())
+
+    def test_reintentos_y_fallos(self):
+        self.fallas["pendientes"] = 1
+        id_trabajo = self.encolar(valor=7)
+        self.assertEqual(self.estado(id_trabajo)["estado"], "PENDIENTE")
+
+        # El primer intento falla y se revierte; el reintento termina
+        self.assertEqual(cola_trabajos.drenar(), [id_trabajo, id_trabajo])
+        trabajo = self.estado(id_trabajo)
+        self.assertEqual(trabajo["estado"], "COMPLETADO")
+        self.assertEqual(trabajo["intentos"], 2)
+        self.assertEqual(trabajo["resultado"], {"valor": 7})
+        self.assertEqual(Receta.query.filter_by(usuario=self.usuario_id).count(), 0)
+
+        # Sin éxito en max_intentos el trabajo queda fallido con el error
+        self.fallas["pendientes"] = 10
+        id_trabajo = self.encolar(valor=8)
+        cola_trabajos.drenar()
+        trabajo = self.estado(id_trabajo)
+        self.assertEqual(trabajo["estado"], "FALLIDO")
+        self.assertEqual(trabajo["intentos"], trabajo["max_intentos"])
+        self.assertEqual(trabajo["error"], "RuntimeError: falla de prueba")
+
+        resultado = self.client.get(
+            "/trabajos/{}?estado=FALLIDO".format(self.usuario_id), headers=self.headers
+        )
+        self.assertEqual(
+            [trabajo["id"] for trabajo in json.loads(resultado.get_data())],
+            [id_trabajo],
+        )
+
+    def test_reintento_espera(self):
+        # Fuera de las pruebas el reintento espera a que venza su disponible_en
+        self.fallas["pendientes"] = 1
+        id_trabajo = self.encolar(valor=1)
+        self.assertEqual(cola_trabajos.drenar(ignorar_espera=False), [id_trabajo])
+        trabajo = Trabajo.query.get(id_trabajo)
+        self.assertEqual(trabajo.estado, EstadoTrabajo.PENDIENTE)
+        self.assertEqual(cola_trabajos.drenar(ignorar_espera=False), [])
+
+    def test_intento_abandonado(self):
+        # Un proceso tomó el trabajo y murió: al vencer el intento se retoma
+        id_trabajo = self.encolar(valor=3)
+        trabajo = Trabajo.query.get(id_trabajo)
+        trabajo.estado = EstadoTrabajo.EJECUTANDO
+        trabajo.intentos = 1
+        trabajo.disponible_en = datetime.utcnow() + timedelta(minutes=5)
+        db.session.commit()
+        self.assertEqual(cola_trabajos.drenar(), [])
+
+        trabajo = Trabajo.query.get(id_trabajo)
+        trabajo.disponible_en = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        self.assertEqual(cola_trabajos.drenar(ignorar_espera=False), [id_trabajo])
+        trabajo = self.estado(id_trabajo)
+        self.assertEqual(trabajo["estado"], "COMPLETADO")
+        self.assertEqual(trabajo["intentos"], 2)
+
+        # Si el intento abandonado era el último, el trabajo queda fallido
+        id_trabajo = self.encolar(valor=4)
+        trabajo = Trabajo.query.get(id_trabajo)
+        trabajo.estado = EstadoTrabajo.EJECUTANDO
+        trabajo.intentos = trabajo.max_intentos
+        trabajo.disponible_en = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        self.assertEqual(cola_trabajos.drenar(), [])
+        trabajo = self.estado(id_trabajo)
+        self.assertEqual(trabajo["estado"], "FALLIDO")
+        self.assertEqual(trabajo["error"], "El intento excedió el tiempo límite")
+
+    def test_ejecutor_de_hilos(self):
+        id_trabajo = self.encolar(valor=1)
+        cola_trabajos.modo = "hilos"
+        try:
+            id_trabajo = self.encolar(valor=2)
+            cola_trabajos.cerrar()
+        finally:
+            cola_trabajos.modo = "manual"
+        self.assertEqual(self.estado(id_trabajo)["estado"], "COMPLETADO")
+        # Solo se envían los trabajos confirmados después del cambio de modo
+        self.assertEqual(len(cola_trabajos.drenar()), 1)
+
+    def test_borrar_restaurante(self):
+        restaurante = Restaurante(
+            nombre=self.data_factory.sentence(), administrador_id=self.usuario_id
+        )
+        db.session.add(restaurante)
+        db.session.commit()
+        receta = Receta(nombre="sopa", usuario=self.usuario_id)
+        db.session.add(receta)
+        db.session.commit()
+        for semana in range(3):
+            fecha_inicial = date(2001, 1, 1) + timedelta(weeks=semana)
+            db.session.add(
+                MenuSemana(
+                    nombre=self.data_factory.sentence(),
+                    fecha_inicial=fecha_inicial,
+                    fecha_final=fecha_inicial + timedelta(days=6),
+                    id_restaurante=restaurante.id,
+                    id_usuario=self.usuario_id,
+                    recetas=[MenuReceta(receta=receta.id)],
+                )
+            )
+        db.session.commit()
+        id_restaurante = restaurante.id
+        ruta = "/restaurantes/{}/{}".format(self.usuario_id, id_restaurante)
+
+        resultado = self.client.delete(ruta, headers=self.headers)
+        self.assertEqual(resultado.status_code, 202)
+        trabajo = json.loads(resultado.get_data())
+        self.assertTrue(resultado.headers["Location"].endswith(trabajo["url"]))
+        self.assertIsNotNone(Restaurante.query.get(id_restaurante))
+
+        self.assertEqual(cola_trabajos.drenar(), [trabajo["id"]])
+        self.assertEqual(self.estado(trabajo["id"])["resultado"], {"menus": 3})
+        self.assertIsNone(Restaurante.query.get(id_restaurante))
+        self.assertEqual(
+            MenuSemana.query.filter_by(id_restaurante=id_restaurante).count(), 0
+        )
+
+        resultado = self.client.delete(ruta, headers=self.headers)
+        self.assertEqual(resultado.status_code, 404)
+        db.session.delete(Receta.query.get(receta.id))
+        db.session.commit()
+
+    def test_trabajo_en_otro_proceso(self):
+        # Un trabajo que corre en otro proceso (python -m trabajador,
+        # COLA_EJECUTOR=procesos) cambia el ETag de las respuestas en caché
+        restaurante = Restaurante(
+            nombre=self.data_factory.sentence(), administrador_id=self.usuario_id
+        )
+        db.session.add(restaurante)
+        db.session.commit()
+        id_restaurante = restaurante.id
+        ruta = "/restaurantes/{}".format(self.usuario_id)
+        resultado = self.client.get(ruta, headers=self.headers)
+        etag = resultado.headers["ETag"]
+        self.assertEqual(
+            [r["id"] for r in json.loads(resultado.get_data())], [str(id_restaurante)]
+        )
+
+        resultado = self.client.delete(
+            "{}/{}".format(ruta, id_restaurante), headers=self.headers
+        )
+        self.assertEqual(resultado.status_code, 202)
+        proceso = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import app; from vistas import cola_trabajos; "
+                "print(cola_trabajos.ejecutar({}))".format(
+                    json.loads(resultado.get_data())["id"]
+                ),
+            ],
+            env=dict(
+                os.environ,
+                SQLALCHEMY_DATABASE_URI=app.config["SQLALCHEMY_DATABASE_URI"],
+            ),
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(proceso.stdout.strip(), "True", proceso.stderr)
+
+        resultado = self.client.get(
+            ruta, headers=dict(self.headers, **{"If-None-Match": etag})
+        )
+        self.assertEqual(resultado.status_code, 200)
+        self.assertNotEqual(resultado.headers["ETag"], etag)
+        self.assertEqual(json.loads(resultado.get_data()), [])
+
+    def test_trabajo_de_otro_usuario(self):
+        id_trabajo = self.encolar(valor=1)
+        resultado = self.client.get(
+            "/trabajos/{}/{}".format(self.usuario_id + 1000, id_trabajo),
+            headers=self.headers,
+        )
+        self.assertEqual(resultado.status_code, 404)
+        cola_trabajos.drenar()
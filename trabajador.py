@@ -0,0 +1,9 @@
+# Worker dedicado de la cola de trabajos: python -m trabajador. Ejecuta los
+# trabajos pendientes a medida que vencen, p. ej. con COLA_EJECUTOR=manual en
+# los procesos web para que todo el trabajo pesado corra aquí. Importar la
+# aplicación configura la cola y registra las tareas
+import app
+from vistas import cola_trabajos
+
+if __name__ == "__main__":
+    cola_trabajos.trabajar()
@@ -1 +1,5 @@
 from .vistas import *
+from .instrumentacion import VistaMetricas, instrumentacion
+from .reportes import VistaReporteMenu, VistaReporteRestaurante
+from .trabajos import VistaTrabajo, VistaTrabajos, cola_trabajos
+from .catalogo import catalogo_ingredientes
@@ -0,0 +1,154 @@
+from sqlalchemy import event, select
+from sqlalchemy.orm import selectinload, sessionmaker
+
+from modelos import (
+    Ingrediente,
+    Receta,
+    perfil_sqlite,
+    serializador_para,
+)
+from .cache import cache_respuestas
+from .catalogo import catalogo_ingredientes
+from .instrumentacion import instrumentacion
+from .paginacion import Paginacion, leer_campos_util, schema_proyectado_util
+from .vistas import (
+    TAMANO_LOTE_IN,
+    ids_ingredientes_util,
+    schemas,
+    reemplazar_ingredientes_util,
+    serializar_ingredientes_util,
+)
+
+
+class SesionesAsincronas:
+    # Motor y sesiones de SQLAlchemy asyncio sobre aiosqlite para el modo ASGI.
+    # aiosqlite es opcional: solo se importa cuando se activa este modo
+    def __init__(self):
+        self.motor = None
+        self.fabrica = None
+
+    def init_app(self, app, db):
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+        with app.app_context():
+            url = db.engine.url
+        self.motor = create_async_engine(
+            url.set(drivername="sqlite+aiosqlite"),
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=app.config.get("DB_POOL_SIZE", 5),
+            max_overflow=app.config.get("DB_POOL_MAX_OVERFLOW", 10),
+        )
+        event.listen(
+            self.motor.sync_engine, "connect", perfil_sqlite.configurar_conexion
+        )
+        instrumentacion.instrumentar_motor(self.motor.sync_engine)
+        self.fabrica = sessionmaker(
+            self.motor, class_=AsyncSession, expire_on_commit=False
+        )
+
+    def sesion(self):
+        return self.fabrica()
+
+    async def cerrar(self):
+        if self.motor is not None:
+            await self.motor.dispose()
+
+
+sesiones_asincronas = SesionesAsincronas()
+
+
+# Versiones asíncronas de las lecturas más frecuentes. Corren dentro del
+# contexto de la solicitud de Flask, con el JWT ya verificado, y producen la
+# misma respuesta que su vista síncrona. Si retornan None la solicitud se
+# atiende con la vista síncrona, p. ej. para generar el 404
+async def resolver_ingredientes_async(sesion, recetas):
+    # La construcción del catálogo bloquearía el event loop: si está
+    # desactualizado se consulta la base hasta que su trabajo lo reconstruya
+    ids_ordenados = ids_ingredientes_util(recetas)
+    instantanea = catalogo_ingredientes.instantanea(reconstruir=False)
+    if instantanea is not None:
+        return reemplazar_ingredientes_util(
+            recetas, instantanea.ingredientes(ids_ordenados)
+        )
+    ingredientes_por_id = {}
+    for inicio in range(0, len(ids_ordenados), TAMANO_LOTE_IN):
+        lote = ids_ordenados[inicio : inicio + TAMANO_LOTE_IN]
+        resultado = await sesion.execute(
+            select(Ingrediente).where(Ingrediente.id.in_(lote))
+        )
+        ingredientes_por_id.update(
+            serializar_ingredientes_util(resultado.scalars().all())
+        )
+    return reemplazar_ingredientes_util(recetas, ingredientes_por_id)
+
+
+@cache_respuestas.cacheada_async("ingrediente")
+async def listar_ingredientes(sesion):
+    try:
+        paginacion = Paginacion.desde_solicitud(ordenes=("id", "nombre"))
+        schema = schema_proyectado_util(schemas.ingrediente, leer_campos_util())
+    except ValueError as e:
+        return str(e), 400
+
+    consulta = paginacion.preparar(
+        select(Ingrediente), Ingrediente.id, Ingrediente.nombre
+    )
+    ingredientes = paginacion.recortar(
+        (await sesion.execute(consulta)).scalars().all(),
+        Ingrediente.id,
+        Ingrediente.nombre,
+    )
+    return paginacion.respuesta(serializador_para(schema).serializar(ingredientes))
+
+
+@cache_respuestas.cacheada_async("ingrediente")
+async def dar_ingrediente(sesion, id_ingrediente):
+    ingrediente = await sesion.get(Ingrediente, id_ingrediente)
+    if ingrediente is None:
+        return None
+    return schemas.ingrediente.dump(ingrediente)
+
+
+async def listar_recetas(sesion, id_usuario):
+    try:
+        paginacion = Paginacion.desde_solicitud(ordenes=("id", "nombre"))
+        schema = schema_proyectado_util(schemas.receta, leer_campos_util())
+    except ValueError as e:
+        return str(e), 400
+
+    consulta = paginacion.preparar(
+        select(Receta)
+        .filter_by(usuario=str(id_usuario))
+        .options(selectinload(Receta.ingredientes)),
+        Receta.id,
+        Receta.nombre,
+    )
+    recetas = paginacion.recortar(
+        (await sesion.execute(consulta)).scalars().all(), Receta.id, Receta.nombre
+    )
+    resultados = serializador_para(schema).serializar(recetas)
+    return paginacion.respuesta(await resolver_ingredientes_async(sesion, resultados))
+
+
+async def dar_receta(sesion, id_receta):
+    resultado = await sesion.execute(
+        select(Receta)
+        .where(Receta.id == id_receta)
+        .options(selectinload(Receta.ingredientes))
+    )
+    receta = resultado.scalar_one_or_none()
+    if receta is None:
+        return None
+    resultados = schemas.receta.dump(receta)
+    await resolver_ingredientes_async(sesion, [resultados])
+    return resultados
+
+
+# (endpoint, método) -> vista asíncrona
+VISTAS_ASINCRONAS = {
+    ("vistaingredientes", "GET"): listar_ingredientes,
+    ("vistaingrediente", "GET"): dar_ingrediente,
+    ("vistarecetas", "GET"): listar_recetas,
+    ("vistareceta", "GET"): dar_receta,
+}
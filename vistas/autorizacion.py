@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask_jwt_extended import get_jwt
+from sqlalchemy import String, cast, event, func, literal, select
+from sqlalchemy.orm import Session
+
+from modelos import db, incrementar_versiones, Rol, Usuario, VersionEntidad
+
+# Datos de un usuario que necesitan las vistas para autorizar una solicitud
+HechosUsuario = namedtuple("HechosUsuario", ["id", "rol", "restaurante_id"])
+
+TODOS = "*"
+
+
+class CacheAutorizacion:
+    # LRU en memoria del proceso con los hechos de autorización de cada usuario
+    # (incluido "no existe"), con expiración por TTL. Cada entrada es válida
+    # solo para la versión del usuario con la que se leyó: cualquier escritura
+    # sobre el usuario, en cualquier proceso, cambia su versión en la base
+    def __init__(self, ttl=60, max_entradas=4096):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.entradas = OrderedDict()
+        self.candado = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault("AUTORIZACION_TTL", 60)
+        app.config.setdefault("AUTORIZACION_MAX_ENTRADAS", 4096)
+        self.ttl = app.config["AUTORIZACION_TTL"]
+        self.max_entradas = app.config["AUTORIZACION_MAX_ENTRADAS"]
+        self.limpiar()
+
+    def limpiar(self):
+        with self.candado:
+            self.entradas.clear()
+
+    def obtener(self, id_usuario, version):
+        ahora = time.monotonic()
+        with self.candado:
+            entrada = self.entradas.get(id_usuario)
+            if entrada is not None and entrada[0] > ahora and entrada[1] == version:
+                self.entradas.move_to_end(id_usuario)
+                return entrada[2]
+
+        usuario = Usuario.query.get(id_usuario)
+        hechos = None
+        if usuario is not None:
+            hechos = HechosUsuario(usuario.id, usuario.rol, usuario.restaurante_id)
+        with self.candado:
+            self.entradas[id_usuario] = (ahora + self.ttl, version, hechos)
+            self.entradas.move_to_end(id_usuario)
+            while len(self.entradas) > self.max_entradas:
+                self.entradas.popitem(last=False)
+        return hechos
+
+
+cache_autorizacion = CacheAutorizacion()
+
+
+def entidad_usuario_util(id_usuario):
+    # Entidad de version_entidad de un usuario; la de TODOS cambia con las
+    # escrituras masivas sobre usuario
+    return "usuario:{}".format(id_usuario)
+
+
+def version_usuario_util(id_usuario):
+    # Expresión con la versión de un usuario, para un id o para la columna
+    # Usuario.id: la suma de la suya y la de TODOS, que cambia con cualquiera
+    tabla = VersionEntidad.__table__
+    return (
+        select(func.coalesce(func.sum(tabla.c.version), 0))
+        .where(
+            tabla.c.entidad.in_(
+                [
+                    literal(entidad_usuario_util("")) + cast(id_usuario, String),
+                    entidad_usuario_util(TODOS),
+                ]
+            )
+        )
+        .scalar_subquery()
+    )
+
+
+def claims_usuario_util(usuario, version):
+    # Claims adicionales del token de acceso emitido en el login, con la
+    # versión del usuario leída en la misma consulta que sus datos
+    return {
+        "rol": usuario.rol.name,
+        "restaurante_id": usuario.restaurante_id,
+        "version": version,
+    }
+
+
+def hechos_usuario_util(id_usuario):
+    # La versión del usuario se lee en cada solicitud, por llave primaria. Si
+    # la solicitud es del mismo usuario del token y no cambió desde el login se
+    # usan sus claims; si no, la caché de autorización de esa versión
+    version = db.session.scalar(select(version_usuario_util(id_usuario)))
+    claims = get_jwt()
+    if claims.get("sub") == id_usuario and claims.get("version") == version:
+        return HechosUsuario(id_usuario, Rol[claims["rol"]], claims["restaurante_id"])
+    return cache_autorizacion.obtener(id_usuario, version)
+
+
+# Las escrituras sobre usuario incrementan su versión una vez por transacción
+# y dentro de ella, como las de las tablas en la caché de respuestas
+def registrar_usuarios_util(session, ids_usuarios):
+    modificados = session.info.setdefault("usuarios_modificados", set())
+    nuevos = set(ids_usuarios) - modificados
+    if nuevos:
+        modificados.update(nuevos)
+        incrementar_versiones(
+            session.connection(),
+            {entidad_usuario_util(id_usuario) for id_usuario in nuevos},
+        )
+
+
+@event.listens_for(Session, "after_flush")
+def registrar_usuarios_flush(session, flush_context):
+    registrar_usuarios_util(
+        session,
+        {
+            objeto.id
+            for objeto in list(session.new)
+            + list(session.dirty)
+            + list(session.deleted)
+            if isinstance(objeto, Usuario)
+        },
+    )
+
+
+@event.listens_for(Session, "after_bulk_update")
+def registrar_usuarios_actualizacion_masiva(update_context):
+    if update_context.mapper.class_ is Usuario:
+        registrar_usuarios_util(update_context.session, {TODOS})
+
+
+@event.listens_for(Session, "after_bulk_delete")
+def registrar_usuarios_borrado_masivo(delete_context):
+    if delete_context.mapper.class_ is Usuario:
+        registrar_usuarios_util(delete_context.session, {TODOS})
+
+
+@event.listens_for(Session, "after_commit")
+def descartar_usuarios_confirmados(session):
+    session.info.pop("usuarios_modificados", None)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def descartar_usuarios(session, previous_transaction):
+    session.info.pop("usuarios_modificados", None)
@@ -0,0 +1,259 @@
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from modelos import db, incrementar_versiones, leer_versiones
+from .flujos import MIMETYPE_NDJSON, solicita_ndjson_util
+
+
+class CacheLocal:
+    # LRU en memoria del proceso con expiración por TTL y límite por número de
+    # entradas y por tamaño total. Solo guarda los cuerpos: las versiones, y por
+    # lo tanto los ETag, son las de la base y coinciden entre workers
+    def __init__(self, ttl=300, max_entradas=1024, max_bytes=32 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.epoca = "local"
+        self.entradas = OrderedDict()
+        self.bytes_totales = 0
+        self.candado = threading.Lock()
+
+    def obtener(self, llave):
+        with self.candado:
+            entrada = self.entradas.get(llave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira < time.monotonic():
+                self.eliminar_util(llave)
+                return None
+            self.entradas.move_to_end(llave)
+            return valor
+
+    def guardar(self, llave, valor):
+        tamano = len(valor)
+        if tamano > self.max_bytes:
+            return
+        with self.candado:
+            if llave in self.entradas:
+                self.eliminar_util(llave)
+            self.entradas[llave] = (time.monotonic() + self.ttl, valor)
+            self.bytes_totales += tamano
+            while (
+                len(self.entradas) > self.max_entradas
+                or self.bytes_totales > self.max_bytes
+            ):
+                self.eliminar_util(next(iter(self.entradas)))
+
+    def eliminar_util(self, llave):
+        _, valor = self.entradas.pop(llave)
+        self.bytes_totales -= len(valor)
+
+
+class CacheRedis:
+    # Respaldo compartido entre workers. Recibe cualquier cliente con la interfaz
+    # de redis-py (get y set con ex), p. ej. un Redis local
+    def __init__(self, cliente, ttl=300, prefijo="restaurantes"):
+        self.cliente = cliente
+        self.ttl = ttl
+        self.prefijo = prefijo
+        self.epoca = prefijo
+
+    def obtener(self, llave):
+        valor = self.cliente.get("{}:respuesta:{}".format(self.prefijo, llave))
+        if isinstance(valor, bytes):
+            valor = valor.decode("utf-8")
+        return valor
+
+    def guardar(self, llave, valor):
+        self.cliente.set(
+            "{}:respuesta:{}".format(self.prefijo, llave), valor, ex=self.ttl
+        )
+
+
+class CacheRespuestas:
+    # Caché de respuestas por ETag. El ETag depende de la versión de cada tabla
+    # en version_entidad, que se incrementa en la misma transacción que la
+    # escribe: un commit de otro worker de gunicorn, de python -m trabajador o
+    # de un ProcessPoolExecutor cambia el ETag en todos los procesos, y las
+    # versiones sobreviven a los reinicios
+    def __init__(self, respaldo=None):
+        self.respaldo = respaldo or CacheLocal()
+
+    def init_app(self, app):
+        app.config.setdefault("CACHE_TIPO", "local")
+        app.config.setdefault("CACHE_TTL", 300)
+        app.config.setdefault("CACHE_MAX_ENTRADAS", 1024)
+        app.config.setdefault("CACHE_MAX_BYTES", 32 * 1024 * 1024)
+        app.config.setdefault("CACHE_REDIS_URL", None)
+
+        if app.config["CACHE_TIPO"] == "redis":
+            import redis
+
+            self.respaldo = CacheRedis(
+                redis.Redis.from_url(app.config["CACHE_REDIS_URL"]),
+                ttl=app.config["CACHE_TTL"],
+            )
+        else:
+            self.respaldo = CacheLocal(
+                ttl=app.config["CACHE_TTL"],
+                max_entradas=app.config["CACHE_MAX_ENTRADAS"],
+                max_bytes=app.config["CACHE_MAX_BYTES"],
+            )
+
+    def invalidar(self, *entidades):
+        with db.engine.begin() as conexion:
+            incrementar_versiones(conexion, entidades)
+
+    def calcular_etag(self, entidades):
+        # El formato negociado por Accept es parte de la llave: el mismo path
+        # puede responder JSON o NDJSON. Las versiones se leen con una conexión
+        # propia, sin abrir la sesión de la solicitud
+        with db.engine.connect() as conexion:
+            versiones = leer_versiones(conexion, entidades)
+        formato = MIMETYPE_NDJSON if solicita_ndjson_util() else "application/json"
+        llave = "{}|{}|{}|{}".format(
+            self.respaldo.epoca,
+            request.full_path,
+            formato,
+            ",".join(
+                "{}={}".format(entidad, version)
+                for entidad, version in zip(entidades, versiones)
+            ),
+        )
+        return hashlib.sha1(llave.encode("utf-8")).hexdigest()
+
+    def buscar_util(self, entidades):
+        # Retorna el ETag, los encabezados y la respuesta en caché si la hay
+        etag = self.calcular_etag(entidades)
+        encabezados = {
+            "ETag": '"{}"'.format(etag),
+            "Cache-Control": "no-cache",
+            "Vary": "Accept",
+        }
+        if request.if_none_match.contains(etag):
+            return etag, encabezados, Response(status=304, headers=encabezados)
+        cuerpo = self.respaldo.obtener(etag)
+        if cuerpo is None:
+            return etag, encabezados, None
+        respuesta = Response(cuerpo, mimetype="application/json", headers=encabezados)
+        return etag, encabezados, respuesta
+
+    def guardar_util(self, etag, encabezados, resultado):
+        datos, estado = resultado, 200
+        if isinstance(resultado, tuple):
+            datos, estado = resultado[0], resultado[1]
+        if isinstance(datos, Response) or estado != 200:
+            return variar_por_accept_util(resultado)
+        cuerpo = json.dumps(datos) + "\n"
+        self.respaldo.guardar(etag, cuerpo)
+        return Response(cuerpo, mimetype="application/json", headers=encabezados)
+
+    def cacheada(self, *entidades):
+        # Decorador para los get de los recursos: la respuesta depende de las
+        # tablas indicadas, y su ETag cambia cada vez que una de ellas se escribe
+        def decorador(funcion):
+            @functools.wraps(funcion)
+            def envoltura(*args, **kwargs):
+                # Las respuestas en streaming no se guardan en la caché
+                if solicita_ndjson_util():
+                    return variar_por_accept_util(funcion(*args, **kwargs))
+                etag, encabezados, respuesta = self.buscar_util(entidades)
+                if respuesta is not None:
+                    return respuesta
+                return self.guardar_util(etag, encabezados, funcion(*args, **kwargs))
+
+            return envoltura
+
+        return decorador
+
+    def cacheada_async(self, *entidades):
+        # Igual que cacheada, para las vistas asíncronas del modo ASGI
+        def decorador(funcion):
+            @functools.wraps(funcion)
+            async def envoltura(*args, **kwargs):
+                etag, encabezados, respuesta = self.buscar_util(entidades)
+                if respuesta is not None:
+                    return respuesta
+                resultado = await funcion(*args, **kwargs)
+                if resultado is None:
+                    return None
+                return self.guardar_util(etag, encabezados, resultado)
+
+            return envoltura
+
+        return decorador
+
+
+cache_respuestas = CacheRespuestas()
+
+
+def variar_por_accept_util(resultado):
+    # Las cachés HTTP compartidas deben distinguir la respuesta JSON de la
+    # NDJSON. Acepta lo mismo que retorna un Resource: una Response o los
+    # datos con estado y encabezados opcionales
+    if isinstance(resultado, Response):
+        resultado.vary.add("Accept")
+        return resultado
+    if not isinstance(resultado, tuple):
+        return resultado, 200, {"Vary": "Accept"}
+    if len(resultado) == 2:
+        return resultado + ({"Vary": "Accept"},)
+    datos, estado, encabezados = resultado
+    return datos, estado, dict(encabezados or {}, Vary="Accept")
+
+
+# Toda escritura a través de la sesión incrementa la versión de las tablas
+# afectadas, incluidas las actualizaciones y borrados masivos, una vez por
+# transacción y dentro de ella: si se revierte, las versiones no cambian
+def registrar_tablas_util(session, tablas):
+    modificadas = session.info.setdefault("tablas_modificadas", set())
+    nuevas = set(tablas) - modificadas
+    if nuevas:
+        modificadas.update(nuevas)
+        incrementar_versiones(session.connection(), nuevas)
+
+
+@event.listens_for(Session, "after_flush")
+def registrar_flush(session, flush_context):
+    registrar_tablas_util(
+        session,
+        {
+            objeto.__table__.name
+            for objeto in list(session.new)
+            + list(session.dirty)
+            + list(session.deleted)
+        },
+    )
+
+
+@event.listens_for(Session, "after_bulk_update")
+def registrar_actualizacion_masiva(update_context):
+    registrar_tablas_util(
+        update_context.session, {update_context.mapper.local_table.name}
+    )
+
+
+@event.listens_for(Session, "after_bulk_delete")
+def registrar_borrado_masivo(delete_context):
+    registrar_tablas_util(
+        delete_context.session, {delete_context.mapper.local_table.name}
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def descartar_tablas_confirmadas(session):
+    session.info.pop("tablas_modificadas", None)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def descartar_tablas(session, previous_transaction):
+    session.info.pop("tablas_modificadas", None)
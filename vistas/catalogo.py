@@ -0,0 +1,314 @@
+import math
+import mmap
+import os
+import struct
+import threading
+import uuid
+from array import array
+from bisect import bisect_left
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from modelos import db, EstadoTrabajo, Ingrediente, Trabajo, leer_versiones
+from .trabajos import cola_trabajos
+
+# Marca, versión, inodo de la base, cantidad de ingredientes y bytes de texto
+ENCABEZADO = struct.Struct("<8s16sQQQ")
+MARCA = b"CATING01"
+# Valor de reconstruir para las lecturas síncronas: la primera instantánea se
+# construye en la solicitud, las siguientes las construye su trabajo
+PRIMERA = "primera"
+# Columnas de texto de cada ingrediente, en este orden. Las calorías se guardan
+# ya formateadas como las entrega el schema (el str del Decimal)
+CAMPOS_TEXTO = ("nombre", "unidad", "calorias", "sitio")
+
+
+class InstantaneaIngredientes:
+    # Columnas de solo lectura sobre un buffer (el mmap del archivo o bytes en
+    # memoria), sin copiarlas: ids ordenados (int64) para la búsqueda binaria,
+    # costo (float64, NaN es nulo), desplazamientos de los textos en UTF-8
+    # (int64), su marca de nulo (un byte) y los textos
+    __slots__ = (
+        "version",
+        "inodo",
+        "cantidad",
+        "ids",
+        "costos",
+        "inicios",
+        "nulos",
+        "textos",
+    )
+
+    def __init__(self, datos):
+        vista = memoryview(datos)
+        (
+            marca,
+            self.version,
+            self.inodo,
+            self.cantidad,
+            tamano_textos,
+        ) = ENCABEZADO.unpack_from(vista)
+        if marca != MARCA:
+            raise ValueError("El archivo no es un catálogo de ingredientes")
+        campos = self.cantidad * len(CAMPOS_TEXTO)
+        inicio = ENCABEZADO.size
+        self.ids, inicio = columna_util(vista, inicio, self.cantidad, "q")
+        self.costos, inicio = columna_util(vista, inicio, self.cantidad, "d")
+        self.inicios, inicio = columna_util(vista, inicio, campos + 1, "q")
+        self.nulos = vista[inicio : inicio + campos]
+        inicio += relleno_util(campos)
+        self.textos = vista[inicio : inicio + tamano_textos]
+
+    def buscar(self, id_ingrediente):
+        # Mismo diccionario que serializar_ingredientes_util, o None
+        posicion = bisect_left(self.ids, id_ingrediente)
+        if posicion == self.cantidad or self.ids[posicion] != id_ingrediente:
+            return None
+        campo = posicion * len(CAMPOS_TEXTO)
+        nombre, unidad, calorias, sitio = (
+            self.texto_util(campo + desplazamiento)
+            for desplazamiento in range(len(CAMPOS_TEXTO))
+        )
+        costo = self.costos[posicion]
+        return {
+            "nombre": nombre,
+            "id": str(id_ingrediente),
+            "calorias": calorias,
+            "costo": None if math.isnan(costo) else costo,
+            "unidad": unidad,
+            "sitio": sitio,
+        }
+
+    def ingredientes(self, ids_ingredientes):
+        ingredientes_por_id = {}
+        for id_ingrediente in ids_ingredientes:
+            ingrediente = self.buscar(id_ingrediente)
+            if ingrediente is not None:
+                ingredientes_por_id[ingrediente["id"]] = ingrediente
+        return ingredientes_por_id
+
+    def texto_util(self, campo):
+        if self.nulos[campo]:
+            return None
+        return str(
+            self.textos[self.inicios[campo] : self.inicios[campo + 1]],
+            "utf-8",
+            "surrogatepass",
+        )
+
+
+def columna_util(vista, inicio, cantidad, tipo):
+    fin = inicio + 8 * cantidad
+    return vista[inicio:fin].cast(tipo), fin
+
+
+def relleno_util(tamano):
+    # Las columnas de 8 bytes quedan alineadas
+    return -(-tamano // 8) * 8
+
+
+def serializar_instantanea_util(filas, version, inodo):
+    ids = array("q")
+    costos = array("d")
+    inicios = array("q", [0])
+    nulos = bytearray()
+    textos = bytearray()
+    for id_ingrediente, nombre, unidad, costo, calorias, sitio in filas:
+        ids.append(id_ingrediente)
+        costos.append(math.nan if costo is None else float(costo))
+        for valor in (
+            nombre,
+            unidad,
+            None if calorias is None else str(calorias),
+            sitio,
+        ):
+            nulos.append(valor is None)
+            if valor is not None:
+                textos += str(valor).encode("utf-8", "surrogatepass")
+            inicios.append(len(textos))
+    nulos += bytes(relleno_util(len(nulos)) - len(nulos))
+    return b"".join(
+        [
+            ENCABEZADO.pack(MARCA, version, inodo, len(ids), len(textos)),
+            ids.tobytes(),
+            costos.tobytes(),
+            inicios.tobytes(),
+            bytes(nulos),
+            bytes(textos),
+        ]
+    )
+
+
+class CatalogoIngredientes:
+    # Instantánea columnar de la tabla ingrediente para resolver las líneas de
+    # las recetas sin consultar la base ni construir objetos del ORM. Con
+    # CATALOGO_RUTA (por defecto junto a la base SQLite) la instantánea es un
+    # archivo que cada worker mapea con mmap, así la comparten sin copiarla. Su
+    # versión es la de la tabla ingrediente en version_entidad, que cambia en la
+    # misma transacción de cada escritura. La reconstruye el trabajo
+    # reconstruir_catalogo, encolado por esa transacción, y la publica con
+    # os.replace; los workers mapean la nueva al notar la versión. Sin ruta
+    # (p. ej. una base en memoria) la instantánea es del proceso
+    def __init__(self):
+        self.estados = {}
+        self.candado = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "CATALOGO_RUTA", ruta_catalogo_util(app.config["SQLALCHEMY_DATABASE_URI"])
+        )
+
+    def instantanea(self, reconstruir=True):
+        # La instantánea vigente. Con reconstruir=False retorna None si está
+        # desactualizada, para quien no puede esperar la reconstrucción; con
+        # PRIMERA solo se construye si todavía no hay ninguna
+        ruta, llave = self.ubicacion_util()
+        version = clave_version_util(self.version_util())
+        estado = self.estados.get(llave)
+        if estado is not None and estado[0] == version:
+            return estado[1]
+
+        # El trabajo de reconstrucción u otro worker ya pudo publicarla
+        publicada = self.publicada_util(ruta)
+        if publicada is not None and publicada.version == version:
+            self.estados[llave] = (version, publicada)
+            return publicada
+        if reconstruir is False or (
+            reconstruir is PRIMERA and (estado is not None or publicada is not None)
+        ):
+            return None
+
+        with self.candado:
+            estado = self.estados.get(llave)
+            if estado is not None and estado[0] == version:
+                return estado[1]
+            instantanea = self.reconstruir_util(ruta, version)
+            self.estados[llave] = (version, instantanea)
+            return instantanea
+
+    def ubicacion_util(self):
+        ruta = current_app.config["CATALOGO_RUTA"]
+        return ruta, ruta or current_app.config["SQLALCHEMY_DATABASE_URI"]
+
+    def version_util(self):
+        with db.engine.connect() as conexion:
+            return leer_versiones(conexion, [Ingrediente.__tablename__])[0]
+
+    def publicada_util(self, ruta):
+        # La instantánea publicada en la ruta, si es de esta base
+        if ruta is None:
+            return None
+        try:
+            instantanea = mapear_util(ruta)
+        except (FileNotFoundError, ValueError, struct.error):
+            return None
+        if instantanea.inodo != inodo_base_util():
+            return None
+        return instantanea
+
+    def reconstruir_util(self, ruta, version):
+        # La versión se leyó antes que las filas: si otra escritura se confirma
+        # mientras tanto, la instantánea queda con la versión anterior y esa
+        # escritura ya encoló otra reconstrucción
+        datos = serializar_instantanea_util(
+            filas_ingredientes_util(), version, inodo_base_util()
+        )
+        if ruta is None:
+            return InstantaneaIngredientes(datos)
+        temporal = "{}.{}".format(ruta, uuid.uuid4().hex)
+        with open(temporal, "w+b") as archivo:
+            archivo.write(datos)
+            archivo.flush()
+            instantanea = InstantaneaIngredientes(
+                mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+            )
+        os.replace(temporal, ruta)
+        return instantanea
+
+
+catalogo_ingredientes = CatalogoIngredientes()
+
+
+def ruta_base_util(uri):
+    url = make_url(uri)
+    if not url.drivername.startswith("sqlite") or url.database in (
+        None,
+        "",
+        ":memory:",
+    ):
+        return None
+    return url.database
+
+
+def ruta_catalogo_util(uri):
+    ruta_base = ruta_base_util(uri)
+    return None if ruta_base is None else ruta_base + "-catalogo"
+
+
+def clave_version_util(version):
+    return version.to_bytes(16, "little")
+
+
+def inodo_base_util():
+    # Una instantánea de otra base que quedó en la misma ruta no se reutiliza
+    ruta_base = ruta_base_util(current_app.config["SQLALCHEMY_DATABASE_URI"])
+    try:
+        return os.stat(ruta_base).st_ino
+    except (TypeError, FileNotFoundError):
+        return 0
+
+
+def mapear_util(ruta):
+    with open(ruta, "rb") as archivo:
+        return InstantaneaIngredientes(
+            mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        )
+
+
+def filas_ingredientes_util():
+    # Con una conexión propia y no la de la sesión, cuya transacción pudo
+    # empezar antes de la última escritura. Los Numeric llegan como el mismo
+    # Decimal que serializa el schema
+    tabla = Ingrediente.__table__
+    with db.engine.connect() as conexion:
+        return conexion.execute(
+            select(
+                tabla.c.id,
+                tabla.c.nombre,
+                tabla.c.unidad,
+                tabla.c.costo,
+                tabla.c.calorias,
+                tabla.c.sitio,
+            ).order_by(tabla.c.id)
+        ).all()
+
+
+@cola_trabajos.tarea("reconstruir_catalogo")
+def reconstruir_catalogo():
+    return {"ingredientes": catalogo_ingredientes.instantanea().cantidad}
+
+
+# Una transacción que escribe ingredientes encola la reconstrucción del
+# catálogo, salvo que ya haya una pendiente: esa todavía no leyó las filas, así
+# que una ráfaga de escrituras se reconstruye una sola vez. Mientras tanto las
+# lecturas consultan la base
+@event.listens_for(Session, "before_commit")
+def encolar_reconstruccion_catalogo(session):
+    if not has_app_context() or session is not db.session():
+        return
+    session.flush()
+    if "ingrediente" not in session.info.get("tablas_modificadas", ()):
+        return
+    pendiente = (
+        db.session.query(Trabajo.id)
+        .filter(
+            Trabajo.estado == EstadoTrabajo.PENDIENTE,
+            Trabajo.tipo == "reconstruir_catalogo",
+        )
+        .first()
+    )
+    if pendiente is None:
+        cola_trabajos.encolar("reconstruir_catalogo")
@@ -0,0 +1,46 @@
+import itertools
+import json
+
+from flask import Response, request, stream_with_context
+
+MIMETYPE_NDJSON = "application/x-ndjson"
+TAMANO_LOTE_FLUJO = 500
+
+
+def solicita_ndjson_util():
+    # El streaming es opcional: solo si el cliente prefiere NDJSON sobre JSON en
+    # el encabezado Accept. Sin Accept, o con */*, la respuesta sigue siendo JSON
+    return (
+        request.accept_mimetypes.best_match(["application/json", MIMETYPE_NDJSON])
+        == MIMETYPE_NDJSON
+    )
+
+
+def validar_paginacion_flujo_util(paginacion):
+    # En NDJSON no hay sobre donde enviar el siguiente cursor, así que el flujo
+    # es siempre la colección completa en el orden pedido
+    if paginacion.activa:
+        raise ValueError("El formato NDJSON no admite limit ni cursor")
+
+
+def lotes_util(consulta, tamano=None):
+    # Recorre la consulta con yield_per y la entrega en listas de a lo sumo
+    # "tamano" objetos; al soltar cada lista sus objetos salen del identity map,
+    # así la memoria no crece con el número de filas
+    tamano = tamano or TAMANO_LOTE_FLUJO
+    filas = iter(consulta.yield_per(tamano))
+    while True:
+        lote = list(itertools.islice(filas, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+def respuesta_ndjson_util(lotes):
+    # Cada lote de elementos serializados se envía como un fragmento de la
+    # respuesta chunked, con un objeto JSON por línea
+    def generar():
+        for lote in lotes:
+            yield "".join(json.dumps(elemento) + "\n" for elemento in lote)
+
+    return Response(stream_with_context(generar()), mimetype=MIMETYPE_NDJSON)
@@ -0,0 +1,161 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from flask_jwt_extended import jwt_required
+from flask_restful import Resource
+from sqlalchemy import event
+
+logger = logging.getLogger("restaurantes.instrumentacion")
+
+LIMITES_DURACION_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+LIMITES_CONSULTAS = [1, 2, 5, 10, 20, 50, 100, 250]
+
+
+class Histograma:
+    def __init__(self, limites):
+        self.limites = limites
+        self.cubetas = [0] * (len(limites) + 1)
+        self.total = 0
+        self.suma = 0
+
+    def registrar(self, valor):
+        self.cubetas[bisect_left(self.limites, valor)] += 1
+        self.total += 1
+        self.suma += valor
+
+    def resumen(self):
+        etiquetas = [str(limite) for limite in self.limites] + ["+Inf"]
+        return {
+            "cubetas": dict(zip(etiquetas, self.cubetas)),
+            "total": self.total,
+            "suma": round(self.suma, 3),
+        }
+
+
+class Instrumentacion:
+    # Cuenta las consultas SQL de cada solicitud a partir de los eventos del
+    # engine, agrega los tiempos en encabezados Server-Timing y en una línea de
+    # log, y acumula histogramas por endpoint para el endpoint de métricas
+    def __init__(self):
+        self.umbral_lenta_ms = 100
+        self.histogramas = {}
+        self.candado = threading.Lock()
+
+    def init_app(self, app, db):
+        app.config.setdefault("SQL_UMBRAL_LENTA_MS", 100)
+        self.umbral_lenta_ms = app.config["SQL_UMBRAL_LENTA_MS"]
+
+        with app.app_context():
+            self.instrumentar_motor(db.engine)
+        app.before_request(self.iniciar_solicitud)
+        app.after_request(self.finalizar_solicitud)
+
+    def instrumentar_motor(self, motor):
+        event.listen(motor, "before_cursor_execute", self.antes_de_consulta)
+        event.listen(motor, "after_cursor_execute", self.despues_de_consulta)
+
+    def antes_de_consulta(self, conn, cursor, statement, parameters, context, many):
+        # El inicio se guarda en el contexto de ejecución de la consulta: si
+        # falla, after_cursor_execute no corre y no queda nada en la conexión
+        if context is not None:
+            context.inicio_consulta = time.perf_counter()
+
+    def despues_de_consulta(self, conn, cursor, statement, parameters, context, many):
+        inicio = getattr(context, "inicio_consulta", None)
+        if inicio is None or not has_request_context() or "consultas" not in g:
+            return
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        consultas = g.consultas
+        consultas["cantidad"] += 1
+        consultas["tiempo_ms"] += duracion_ms
+        if duracion_ms > consultas["mas_lenta_ms"]:
+            consultas["mas_lenta_ms"] = duracion_ms
+            consultas["mas_lenta"] = statement
+        if duracion_ms >= self.umbral_lenta_ms:
+            logger.warning(
+                json.dumps(
+                    {
+                        "evento": "consulta_lenta",
+                        "endpoint": request.endpoint,
+                        "duracion_ms": round(duracion_ms, 3),
+                        "sql": statement,
+                    }
+                )
+            )
+
+    def iniciar_solicitud(self):
+        g.consultas = {
+            "cantidad": 0,
+            "tiempo_ms": 0.0,
+            "mas_lenta_ms": 0.0,
+            "mas_lenta": None,
+            "inicio": time.perf_counter(),
+        }
+
+    def finalizar_solicitud(self, respuesta):
+        consultas = g.pop("consultas", None)
+        if consultas is None:
+            return respuesta
+        total_ms = (time.perf_counter() - consultas["inicio"]) * 1000
+
+        respuesta.headers.add(
+            "Server-Timing",
+            'db;dur={:.3f};desc="{} consultas", total;dur={:.3f}'.format(
+                consultas["tiempo_ms"], consultas["cantidad"], total_ms
+            ),
+        )
+        logger.info(
+            json.dumps(
+                {
+                    "evento": "solicitud",
+                    "metodo": request.method,
+                    "endpoint": request.endpoint,
+                    "estado": respuesta.status_code,
+                    "duracion_ms": round(total_ms, 3),
+                    "consultas": consultas["cantidad"],
+                    "tiempo_db_ms": round(consultas["tiempo_ms"], 3),
+                    "consulta_mas_lenta_ms": round(consultas["mas_lenta_ms"], 3),
+                    "consulta_mas_lenta": consultas["mas_lenta"],
+                }
+            )
+        )
+
+        llave = "{} {}".format(request.method, request.endpoint)
+        with self.candado:
+            if llave not in self.histogramas:
+                self.histogramas[llave] = {
+                    "duracion_ms": Histograma(LIMITES_DURACION_MS),
+                    "tiempo_db_ms": Histograma(LIMITES_DURACION_MS),
+                    "consultas": Histograma(LIMITES_CONSULTAS),
+                }
+            histogramas = self.histogramas[llave]
+            histogramas["duracion_ms"].registrar(total_ms)
+            histogramas["tiempo_db_ms"].registrar(consultas["tiempo_ms"])
+            histogramas["consultas"].registrar(consultas["cantidad"])
+        return respuesta
+
+    def resumen(self):
+        with self.candado:
+            return {
+                llave: {
+                    nombre: histograma.resumen()
+                    for nombre, histograma in histogramas.items()
+                }
+                for llave, histogramas in self.histogramas.items()
+            }
+
+
+instrumentacion = Instrumentacion()
+
+
+class VistaMetricas(Resource):
+    @jwt_required()
+    def get(self):
+        return {
+            "umbral_consulta_lenta_ms": instrumentacion.umbral_lenta_ms,
+            "endpoints": instrumentacion.resumen(),
+        }
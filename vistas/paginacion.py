@@ -0,0 +1,171 @@
+import base64
+import binascii
+import json
+
+from flask import request
+from sqlalchemy import and_, or_, tuple_
+
+LIMITE_MAXIMO = 1000
+
+# Tipos que admite el valor de orden de un cursor, según el orden
+TIPOS_CURSOR = {
+    "id": (type(None),),
+    "nombre": (str, type(None)),
+    "relevancia": (int, float),
+}
+
+schemas_proyectados = {}
+
+
+class Paginacion:
+    # Paginación por llave (keyset) sobre id, sobre (nombre, id) o sobre
+    # (relevancia, id) en las búsquedas. Solo se activa cuando la solicitud
+    # envía "limit" o "cursor", así los clientes que esperan la lista completa
+    # siguen recibiendo el mismo arreglo
+    def __init__(self, limite=None, cursor=None, orden=None):
+        self.limite = limite
+        self.cursor = cursor
+        self.orden = orden
+        self.siguiente = None
+
+    @property
+    def activa(self):
+        return self.limite is not None or self.cursor is not None
+
+    @classmethod
+    def desde_solicitud(cls, ordenes=("id",)):
+        orden = request.args.get("orden", ordenes[0])
+        if orden not in ordenes:
+            raise ValueError("El orden debe ser uno de: {}".format(", ".join(ordenes)))
+
+        limite = request.args.get("limit")
+        if limite is not None:
+            try:
+                limite = int(limite)
+            except ValueError:
+                raise ValueError("El límite debe ser un número entero")
+            if not 1 <= limite <= LIMITE_MAXIMO:
+                raise ValueError(
+                    "El límite debe estar entre 1 y {}".format(LIMITE_MAXIMO)
+                )
+
+        cursor = request.args.get("cursor")
+        if cursor is not None:
+            cursor = decodificar_cursor(cursor)
+            if cursor[0] != orden:
+                raise ValueError("El cursor no corresponde al orden solicitado")
+            if isinstance(cursor[1], bool) or not isinstance(
+                cursor[1], TIPOS_CURSOR[orden]
+            ):
+                raise ValueError("Cursor inválido")
+            if limite is None:
+                limite = LIMITE_MAXIMO
+
+        return cls(limite, cursor, orden)
+
+    def aplicar(self, consulta, columna_id, columna_nombre=None):
+        elementos = self.preparar(consulta, columna_id, columna_nombre).all()
+        return self.recortar(elementos, columna_id, columna_nombre)
+
+    def preparar(self, consulta, columna_id, columna_nombre=None):
+        # Ordena, filtra por el cursor y limita una Query o un select(); la
+        # ejecución queda a cargo de quien llama, p. ej. una sesión asíncrona
+        if self.orden == "id":
+            llave = None
+            consulta = consulta.order_by(columna_id)
+        else:
+            # Por nombre o por relevancia de una búsqueda, con el id de desempate.
+            # Sobre la columna sin transformar, así el orden sale del índice; en
+            # SQLite los nombres nulos van primero
+            llave = columna_nombre
+            consulta = consulta.order_by(llave, columna_id)
+
+        if not self.activa:
+            return consulta
+
+        if self.cursor is not None:
+            _, valor, ultimo_id = self.cursor
+            if llave is None:
+                consulta = consulta.filter(columna_id > ultimo_id)
+            elif valor is None:
+                # El cursor está en el tramo de nombres nulos
+                consulta = consulta.filter(
+                    or_(
+                        llave.isnot(None), and_(llave.is_(None), columna_id > ultimo_id)
+                    )
+                )
+            else:
+                # Comparación de filas: un recorrido acotado del índice
+                consulta = consulta.filter(
+                    tuple_(llave, columna_id) > tuple_(valor, ultimo_id)
+                )
+        return consulta.limit(self.limite + 1)
+
+    def recortar(self, elementos, columna_id, columna_nombre=None):
+        if not self.activa or len(elementos) <= self.limite:
+            return elementos
+        elementos = elementos[: self.limite]
+        ultimo = elementos[-1]
+        valor = None
+        if self.orden != "id":
+            valor = getattr(ultimo, columna_nombre.key)
+        self.siguiente = codificar_cursor(
+            [self.orden, valor, getattr(ultimo, columna_id.key)]
+        )
+        return elementos
+
+    def respuesta(self, resultados):
+        if not self.activa:
+            return resultados
+        return {"items": resultados, "next": self.siguiente}
+
+
+def codificar_cursor(valores):
+    contenido = json.dumps(valores, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(contenido).decode("ascii")
+
+
+def decodificar_cursor(cursor):
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("Cursor inválido")
+    if (
+        not isinstance(valores, list)
+        or len(valores) != 3
+        or not isinstance(valores[0], str)
+        or valores[0] not in TIPOS_CURSOR
+        or not isinstance(valores[2], int)
+        or isinstance(valores[2], bool)
+    ):
+        raise ValueError("Cursor inválido")
+    return valores
+
+
+def leer_campos_util():
+    campos = request.args.get("fields")
+    if not campos:
+        return None
+    return tuple(campo.strip() for campo in campos.split(",") if campo.strip())
+
+
+def schema_proyectado_util(schema, campos, campos_extra=()):
+    # Los schemas proyectados se construyen una sola vez por combinación de campos
+    if campos is None:
+        return schema
+
+    desconocidos = set(campos) - set(schema.fields) - set(campos_extra)
+    if desconocidos:
+        raise ValueError(
+            "Campos desconocidos: {}".format(", ".join(sorted(desconocidos)))
+        )
+
+    campos_schema = tuple(sorted(set(campos) - set(campos_extra)))
+    llave = (type(schema), campos_schema)
+    if llave not in schemas_proyectados:
+        schemas_proyectados[llave] = type(schema)(only=campos_schema)
+    return schemas_proyectados[llave]
+
+
+def incluir_campo_util(campos, campo):
+    return campos is None or campo in campos
@@ -0,0 +1,258 @@
+from flask import request
+from flask_jwt_extended import jwt_required
+from flask_restful import Resource
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from modelos import (
+    db,
+    Ingrediente,
+    MenuReceta,
+    MenuSemana,
+    Receta,
+    RecetaIngrediente,
+    ResumenMenu,
+    ResumenMenuIngrediente,
+    ResumenRestaurante,
+    ResumenRestauranteIngrediente,
+    Restaurante,
+    Rol,
+)
+from modelos.reportes import (
+    actualizar_resumenes,
+    menus_de_recetas,
+    reconstruir_resumenes,
+)
+from .autorizacion import TODOS, hechos_usuario_util
+from .paginacion import LIMITE_MAXIMO
+
+SEMANAS_TENDENCIA = 52
+INGREDIENTES_MAS_USADOS = 10
+
+
+# Los resúmenes se actualizan en la misma transacción que la escritura, justo
+# antes del commit. En cada flush se registran los menús tocados, las recetas
+# cuyas líneas cambiaron (todo el resumen de sus menús) y las recetas
+# modificadas (solo los costos y calorías de sus menús)
+def registrar_reportes_util(session, menus=(), lineas=(), recetas=()):
+    session.info.setdefault("menus_reporte", set()).update(menus)
+    session.info.setdefault("lineas_reporte", set()).update(lineas)
+    session.info.setdefault("recetas_reporte", set()).update(recetas)
+
+
+@event.listens_for(Session, "after_flush")
+def registrar_reportes_flush(session, flush_context):
+    menus = set()
+    lineas = set()
+    recetas = set()
+    for objeto in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(objeto, MenuSemana):
+            menus.add(objeto.id)
+        elif isinstance(objeto, MenuReceta):
+            menus.add(objeto.menu)
+        elif isinstance(objeto, RecetaIngrediente):
+            lineas.add(objeto.receta)
+        elif isinstance(objeto, Receta):
+            recetas.add(objeto.id)
+    for ids in (menus, lineas, recetas):
+        ids.discard(None)
+    if menus or lineas or recetas:
+        registrar_reportes_util(session, menus, lineas, recetas)
+
+
+@event.listens_for(Session, "after_bulk_update")
+def registrar_reportes_actualizacion_masiva(update_context):
+    if update_context.mapper.class_ in (MenuSemana, MenuReceta, Receta):
+        registrar_reportes_util(update_context.session, {TODOS})
+
+
+@event.listens_for(Session, "after_bulk_delete")
+def registrar_reportes_borrado_masivo(delete_context):
+    if delete_context.mapper.class_ in (MenuSemana, MenuReceta, Receta):
+        registrar_reportes_util(delete_context.session, {TODOS})
+
+
+@event.listens_for(Session, "before_commit")
+def actualizar_reportes(session):
+    # Los cambios pendientes se registran al hacer flush
+    session.flush()
+    menus = session.info.pop("menus_reporte", set())
+    lineas = session.info.pop("lineas_reporte", set())
+    recetas = session.info.pop("recetas_reporte", set())
+    if TODOS in menus:
+        reconstruir_resumenes(session)
+        return
+    if lineas:
+        menus |= menus_de_recetas(session, lineas)
+    if menus:
+        actualizar_resumenes(session, menus)
+    if recetas:
+        actualizar_resumenes(
+            session, menus_de_recetas(session, recetas) - menus, ingredientes=False
+        )
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def descartar_reportes(session, previous_transaction):
+    for llave in ("menus_reporte", "lineas_reporte", "recetas_reporte"):
+        session.info.pop(llave, None)
+
+
+def decimal_float_util(valor):
+    return float(valor or 0)
+
+
+def promedio_util(suma, cantidad):
+    if not cantidad:
+        return 0.0
+    return float(suma) / cantidad
+
+
+def ingredientes_mas_usados_util(tabla, columna, valor):
+    # Lee solo las filas del resumen, ordenadas por usos en el índice
+    consulta = (
+        db.session.query(
+            tabla.ingrediente,
+            Ingrediente.nombre,
+            Ingrediente.unidad,
+            tabla.usos,
+            tabla.cantidad,
+        )
+        .outerjoin(Ingrediente, Ingrediente.id == tabla.ingrediente)
+        .filter(columna == valor)
+        .order_by(tabla.usos.desc(), tabla.ingrediente)
+        .limit(INGREDIENTES_MAS_USADOS)
+    )
+    return [
+        {
+            "id": id_ingrediente,
+            "nombre": nombre,
+            "unidad": unidad,
+            "usos": usos,
+            "cantidad": decimal_float_util(cantidad),
+        }
+        for id_ingrediente, nombre, unidad, usos, cantidad in consulta
+    ]
+
+
+def leer_semanas_util():
+    semanas = request.args.get("semanas", SEMANAS_TENDENCIA)
+    try:
+        semanas = int(semanas)
+    except ValueError:
+        raise ValueError("Las semanas deben ser un número entero")
+    if not 1 <= semanas <= LIMITE_MAXIMO:
+        raise ValueError("Las semanas deben estar entre 1 y {}".format(LIMITE_MAXIMO))
+    return semanas
+
+
+def validar_administrador_util(id_usuario):
+    usuario = hechos_usuario_util(id_usuario)
+    if usuario is None:
+        return "El Administrador no existe", 404
+    elif usuario.rol != Rol.ADMINISTRADOR:
+        return "Solo los Administradores pueden ver los reportes", 401
+    return None
+
+
+class VistaReporteRestaurante(Resource):
+    # Costo promedio por porción, calorías, ingredientes más usados y la
+    # tendencia de costos de las últimas semanas de un restaurante. Son tres
+    # consultas a las tablas de resumen, sin importar cuántos menús tenga
+    @jwt_required()
+    def get(self, id_usuario, id_restaurante):
+        error = validar_administrador_util(id_usuario)
+        if error is not None:
+            return error
+        try:
+            semanas = leer_semanas_util()
+        except ValueError as e:
+            return str(e), 400
+
+        fila = (
+            db.session.query(Restaurante.id, Restaurante.nombre, ResumenRestaurante)
+            .outerjoin(
+                ResumenRestaurante, ResumenRestaurante.restaurante == Restaurante.id
+            )
+            .filter(
+                Restaurante.id == id_restaurante,
+                Restaurante.administrador_id == id_usuario,
+            )
+            .first()
+        )
+        if fila is None:
+            return "El restaurante no existe", 404
+        _, nombre, resumen = fila
+        resumen = resumen or ResumenRestaurante()
+
+        tendencia = (
+            db.session.query(ResumenMenu, MenuSemana.nombre)
+            .outerjoin(MenuSemana, MenuSemana.id == ResumenMenu.menu)
+            .filter(ResumenMenu.restaurante == id_restaurante)
+            .order_by(ResumenMenu.fecha_inicial.desc(), ResumenMenu.menu.desc())
+            .limit(semanas)
+            .all()
+        )
+
+        return {
+            "restaurante": {"id": id_restaurante, "nombre": nombre},
+            "menus": resumen.menus or 0,
+            "recetas": resumen.recetas or 0,
+            "costo_total": decimal_float_util(resumen.costo_total),
+            "costo_promedio_porcion": promedio_util(
+                resumen.suma_costo_porcion or 0, resumen.recetas
+            ),
+            "calorias_total": decimal_float_util(resumen.calorias_total),
+            "ingredientes_mas_usados": ingredientes_mas_usados_util(
+                ResumenRestauranteIngrediente,
+                ResumenRestauranteIngrediente.restaurante,
+                id_restaurante,
+            ),
+            "tendencia_costos": [
+                {
+                    "menu": resumen_menu.menu,
+                    "nombre": nombre_menu,
+                    "fecha_inicial": resumen_menu.fecha_inicial.isoformat(),
+                    "costo_total": decimal_float_util(resumen_menu.costo_total),
+                    "costo_promedio_porcion": promedio_util(
+                        resumen_menu.suma_costo_porcion, resumen_menu.recetas
+                    ),
+                }
+                for resumen_menu, nombre_menu in reversed(tendencia)
+            ],
+        }
+
+
+class VistaReporteMenu(Resource):
+    @jwt_required()
+    def get(self, id_usuario, id_menu):
+        error = validar_administrador_util(id_usuario)
+        if error is not None:
+            return error
+
+        fila = (
+            db.session.query(MenuSemana.nombre, MenuSemana.id_restaurante, ResumenMenu)
+            .join(Restaurante, Restaurante.id == MenuSemana.id_restaurante)
+            .outerjoin(ResumenMenu, ResumenMenu.menu == MenuSemana.id)
+            .filter(
+                MenuSemana.id == id_menu, Restaurante.administrador_id == id_usuario
+            )
+            .first()
+        )
+        if fila is None:
+            return "El menu no existe", 404
+        nombre, id_restaurante, resumen = fila
+        resumen = resumen or ResumenMenu()
+
+        return {
+            "menu": {"id": id_menu, "nombre": nombre, "restaurante": id_restaurante},
+            "recetas": resumen.recetas or 0,
+            "costo_total": decimal_float_util(resumen.costo_total),
+            "costo_promedio_porcion": promedio_util(
+                resumen.suma_costo_porcion or 0, resumen.recetas
+            ),
+            "calorias_total": decimal_float_util(resumen.calorias_total),
+            "ingredientes_mas_usados": ingredientes_mas_usados_util(
+                ResumenMenuIngrediente, ResumenMenuIngrediente.menu, id_menu
+            ),
+        }
@@ -0,0 +1,339 @@
+import importlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context, request
+from flask_jwt_extended import jwt_required
+from flask_restful import Resource
+from sqlalchemy import and_, event, or_, update
+from sqlalchemy.orm import Session
+
+from modelos import db, EstadoTrabajo, Trabajo
+from .autorizacion import hechos_usuario_util
+from .paginacion import Paginacion
+
+MODOS_EJECUTOR = ("hilos", "procesos", "manual")
+
+
+class ColaTrabajos:
+    # Cola de trabajos en segundo plano guardada en la tabla trabajo de la misma
+    # base. Las vistas encolan dentro de su transacción y responden 202; al
+    # confirmarse, cada trabajo se envía al ThreadPoolExecutor (o
+    # ProcessPoolExecutor) del proceso. Un trabajo se toma con un UPDATE
+    # condicional, así corre una sola vez aunque haya varios workers, y si falla
+    # se reintenta con espera exponencial hasta COLA_MAX_INTENTOS. Mientras
+    # corre, disponible_en es el vencimiento del intento (COLA_TIEMPO_LIMITE):
+    # si el proceso muere a mitad del trabajo, al vencer se vuelve a tomar como
+    # un intento más. Con COLA_EJECUTOR=manual nada corre solo: las pruebas
+    # vacían la cola con drenar() y en producción lo hace python -m trabajador
+    def __init__(self):
+        self.tareas = {}
+        self.app = None
+        self.modo = "hilos"
+        self.trabajadores = 2
+        self.max_intentos = 3
+        self.espera_reintento = 1.0
+        self.tiempo_limite = 300.0
+        self.ejecutor = None
+        self.candado = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault("COLA_EJECUTOR", os.environ.get("COLA_EJECUTOR", "hilos"))
+        app.config.setdefault("COLA_TRABAJADORES", 2)
+        app.config.setdefault("COLA_MAX_INTENTOS", 3)
+        app.config.setdefault("COLA_ESPERA_REINTENTO", 1.0)
+        app.config.setdefault("COLA_TIEMPO_LIMITE", 300.0)
+        if app.config["COLA_EJECUTOR"] not in MODOS_EJECUTOR:
+            raise ValueError("COLA_EJECUTOR inválido")
+
+        self.cerrar()
+        self.app = app
+        self.modo = app.config["COLA_EJECUTOR"]
+        self.trabajadores = app.config["COLA_TRABAJADORES"]
+        self.max_intentos = app.config["COLA_MAX_INTENTOS"]
+        self.espera_reintento = app.config["COLA_ESPERA_REINTENTO"]
+        self.tiempo_limite = app.config["COLA_TIEMPO_LIMITE"]
+
+    def tarea(self, tipo):
+        # Registra la función que ejecuta los trabajos de un tipo. Recibe los
+        # parámetros encolados y no confirma la sesión: sus cambios se
+        # confirman junto con el estado del trabajo
+        def decorador(funcion):
+            self.tareas[tipo] = funcion
+            return funcion
+
+        return decorador
+
+    def encolar(self, tipo, id_usuario=None, **parametros):
+        if tipo not in self.tareas:
+            raise KeyError("Tipo de trabajo desconocido: {}".format(tipo))
+        trabajo = Trabajo(
+            tipo=tipo,
+            parametros=json.dumps(parametros),
+            max_intentos=self.max_intentos,
+            id_usuario=id_usuario,
+        )
+        db.session.add(trabajo)
+        db.session.flush()
+        db.session.info.setdefault("trabajos_nuevos", []).append(trabajo.id)
+        return trabajo
+
+    def despachar(self, ids_trabajos):
+        if self.modo == "manual" or not ids_trabajos:
+            return
+        # Los hilos usan la aplicación que confirmó los trabajos
+        app = current_app._get_current_object() if has_app_context() else self.app
+        ejecutor = self.obtener_ejecutor_util()
+        for id_trabajo in ids_trabajos:
+            if self.modo == "procesos":
+                ejecutor.submit(ejecutar_en_proceso_util, id_trabajo)
+            else:
+                ejecutor.submit(self.ejecutar, id_trabajo, app)
+
+    def obtener_ejecutor_util(self):
+        # Se crea con el primer trabajo, ya dentro del worker: crear_app no
+        # arranca hilos ni procesos y con preload_app cada worker tiene el suyo
+        with self.candado:
+            if self.ejecutor is None:
+                if self.modo == "procesos":
+                    self.ejecutor = ProcessPoolExecutor(
+                        self.trabajadores, initializer=iniciar_proceso_util
+                    )
+                else:
+                    self.ejecutor = ThreadPoolExecutor(
+                        self.trabajadores, thread_name_prefix="trabajos"
+                    )
+            return self.ejecutor
+
+    def cerrar(self, esperar=True):
+        with self.candado:
+            ejecutor, self.ejecutor = self.ejecutor, None
+        if ejecutor is not None:
+            ejecutor.shutdown(wait=esperar)
+
+    def ejecutar(self, id_trabajo, app=None):
+        # En el ejecutor cada trabajo tiene su propio contexto y su sesión, que
+        # se cierra al salir del contexto
+        with (app or self.app).app_context():
+            return self.ejecutar_util(id_trabajo)
+
+    def drenar(self, ignorar_espera=True):
+        # Ejecuta en este hilo los trabajos pendientes, incluidos los que
+        # encolen ellos mismos, hasta vaciar la cola, y retoma los intentos
+        # abandonados. Para las pruebas los reintentos no esperan; el worker
+        # dedicado solo toma los ya vencidos
+        if not has_app_context():
+            with self.app.app_context():
+                return self.drenar(ignorar_espera)
+
+        ejecutados = []
+        while True:
+            self.vencer_util()
+            ids = [
+                id_trabajo
+                for id_trabajo, in db.session.query(Trabajo.id)
+                .filter(condicion_disponible_util(ignorar_espera))
+                .order_by(Trabajo.id)
+            ]
+            db.session.commit()
+            ids = [
+                id_trabajo
+                for id_trabajo in ids
+                if self.ejecutar_util(id_trabajo, ignorar_espera)
+            ]
+            if not ids:
+                return ejecutados
+            ejecutados.extend(ids)
+
+    def trabajar(self, intervalo=1.0):
+        # Worker dedicado (python -m trabajador): también recoge los
+        # trabajos que quedaron pendientes si un proceso web se reinició, y los
+        # que quedaron en ejecución si murió a mitad de uno
+        with self.app.app_context():
+            while True:
+                if not self.drenar(ignorar_espera=False):
+                    time.sleep(intervalo)
+
+    def vencer_util(self):
+        # Un intento abandonado que era el último deja el trabajo fallido
+        db.session.execute(
+            update(Trabajo)
+            .where(
+                Trabajo.estado == EstadoTrabajo.EJECUTANDO,
+                Trabajo.disponible_en <= datetime.utcnow(),
+                Trabajo.intentos >= Trabajo.max_intentos,
+            )
+            .values(
+                estado=EstadoTrabajo.FALLIDO,
+                error=ERROR_TIEMPO_LIMITE,
+                actualizado=datetime.utcnow(),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def ejecutar_util(self, id_trabajo, ignorar_espera=False):
+        # Retorna True si este proceso tomó el trabajo. El intento vence a los
+        # COLA_TIEMPO_LIMITE segundos; un trabajo lento puede entonces correr
+        # dos veces, así que las tareas deben poder repetirse
+        ahora = datetime.utcnow()
+        tomado = db.session.execute(
+            update(Trabajo)
+            .where(Trabajo.id == id_trabajo, condicion_disponible_util(ignorar_espera))
+            .values(
+                estado=EstadoTrabajo.EJECUTANDO,
+                intentos=Trabajo.intentos + 1,
+                disponible_en=ahora + timedelta(seconds=self.tiempo_limite),
+                actualizado=ahora,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if tomado.rowcount != 1:
+            return False
+
+        trabajo = Trabajo.query.get(id_trabajo)
+        try:
+            resultado = self.tareas[trabajo.tipo](**json.loads(trabajo.parametros))
+            trabajo.resultado = json.dumps(resultado)
+            trabajo.estado = EstadoTrabajo.COMPLETADO
+            trabajo.error = None
+            trabajo.actualizado = datetime.utcnow()
+            db.session.commit()
+            return True
+        except Exception as e:
+            db.session.rollback()
+            error = "{}: {}".format(type(e).__name__, e)
+
+        # Los cambios del intento fallido se revirtieron; solo se guarda el error
+        trabajo = Trabajo.query.get(id_trabajo)
+        trabajo.error = error
+        trabajo.actualizado = datetime.utcnow()
+        espera = None
+        if trabajo.intentos < trabajo.max_intentos:
+            espera = self.espera_reintento * 2 ** (trabajo.intentos - 1)
+            trabajo.estado = EstadoTrabajo.PENDIENTE
+            trabajo.disponible_en = datetime.utcnow() + timedelta(seconds=espera)
+        else:
+            trabajo.estado = EstadoTrabajo.FALLIDO
+        db.session.commit()
+
+        if espera is not None and self.modo != "manual":
+            temporizador = threading.Timer(espera, self.despachar, [[id_trabajo]])
+            temporizador.daemon = True
+            temporizador.start()
+        return True
+
+
+cola_trabajos = ColaTrabajos()
+
+ERROR_TIEMPO_LIMITE = "El intento excedió el tiempo límite"
+
+
+def condicion_disponible_util(ignorar_espera):
+    # Pendientes (con su espera cumplida, salvo ignorar_espera) o en ejecución
+    # con el intento vencido y todavía con intentos disponibles
+    ahora = datetime.utcnow()
+    pendiente = Trabajo.estado == EstadoTrabajo.PENDIENTE
+    if not ignorar_espera:
+        pendiente = and_(pendiente, Trabajo.disponible_en <= ahora)
+    return or_(
+        pendiente,
+        and_(
+            Trabajo.estado == EstadoTrabajo.EJECUTANDO,
+            Trabajo.disponible_en <= ahora,
+            Trabajo.intentos < Trabajo.max_intentos,
+        ),
+    )
+
+
+def iniciar_proceso_util():
+    # Con spawn el proceso no hereda la aplicación y se importa, lo que registra
+    # las tareas. Con fork se descartan el ejecutor y las conexiones del padre
+    if cola_trabajos.app is None:
+        importlib.import_module("app")
+    cola_trabajos.ejecutor = None
+    cola_trabajos.candado = threading.Lock()
+    with cola_trabajos.app.app_context():
+        db.engine.dispose()
+
+
+def ejecutar_en_proceso_util(id_trabajo):
+    return cola_trabajos.ejecutar(id_trabajo)
+
+
+# Los trabajos encolados se envían al ejecutor solo cuando su transacción se
+# confirma, y se descartan si se revierte
+@event.listens_for(Session, "after_commit")
+def despachar_trabajos(session):
+    cola_trabajos.despachar(session.info.pop("trabajos_nuevos", []))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def descartar_trabajos(session, previous_transaction):
+    session.info.pop("trabajos_nuevos", None)
+
+
+def fecha_util(valor):
+    return None if valor is None else valor.isoformat()
+
+
+def trabajo_serializado_util(trabajo):
+    return {
+        "id": trabajo.id,
+        "tipo": trabajo.tipo,
+        "estado": trabajo.estado.name,
+        "intentos": trabajo.intentos,
+        "max_intentos": trabajo.max_intentos,
+        "resultado": None
+        if trabajo.resultado is None
+        else json.loads(trabajo.resultado),
+        "error": trabajo.error,
+        "creado": fecha_util(trabajo.creado),
+        "actualizado": fecha_util(trabajo.actualizado),
+        "url": "/trabajos/{}/{}".format(trabajo.id_usuario, trabajo.id),
+    }
+
+
+def respuesta_aceptada_util(trabajo, cuerpo=None):
+    # 202 con la dirección donde consultar el estado del trabajo
+    if cuerpo is None:
+        cuerpo = trabajo
+    return cuerpo, 202, {"Location": trabajo["url"]}
+
+
+class VistaTrabajos(Resource):
+    @jwt_required()
+    def get(self, id_usuario):
+        if hechos_usuario_util(id_usuario) is None:
+            return "El usuario no existe", 404
+        try:
+            paginacion = Paginacion.desde_solicitud()
+        except ValueError as e:
+            return str(e), 400
+
+        consulta = Trabajo.query.filter(Trabajo.id_usuario == id_usuario)
+        estado = request.args.get("estado")
+        if estado is not None:
+            if estado not in EstadoTrabajo.__members__:
+                return "Estado de trabajo inválido", 400
+            consulta = consulta.filter(Trabajo.estado == EstadoTrabajo[estado])
+        trabajos = paginacion.aplicar(consulta, Trabajo.id)
+        return paginacion.respuesta(
+            [trabajo_serializado_util(trabajo) for trabajo in trabajos]
+        )
+
+
+class VistaTrabajo(Resource):
+    @jwt_required()
+    def get(self, id_usuario, id_trabajo):
+        trabajo = Trabajo.query.filter(
+            Trabajo.id == id_trabajo, Trabajo.id_usuario == id_usuario
+        ).first()
+        if trabajo is None:
+            return "El trabajo no existe", 404
+        return trabajo_serializado_util(trabajo)
@@ -1,37 +1,320 @@
+import csv
+import io
+import itertools
 import json
+import re
 
-from flask import request
+from flask import Response, request, stream_with_context
 from sqlalchemy.exc import SQLAlchemyError
 from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity
 from flask_restful import Resource
 import hashlib
 from datetime import datetime
-from sqlalchemy.orm import joinedload
+from decimal import Decimal
+from sqlalchemy import and_, bindparam, column, exists, func, select, table, text
+from sqlalchemy.orm import joinedload, selectinload
 
+import modelos
 from modelos import (
     db,
     Ingrediente,
-    IngredienteSchema,
     RecetaIngrediente,
-    RecetaIngredienteSchema,
     Receta,
-    RecetaSchema,
     Usuario,
-    UsuarioSchema,
     Restaurante,
-    RestauranteSchema,
     Rol,
     MenuSemana,
-    MenuSemanaSchema,
     MenuReceta,
+    serializador_para,
 )
+from .autorizacion import (
+    cache_autorizacion,
+    claims_usuario_util,
+    hechos_usuario_util,
+    version_usuario_util,
+)
+from .cache import cache_respuestas, registrar_tablas_util
+from .catalogo import PRIMERA, catalogo_ingredientes
+from .flujos import (
+    lotes_util,
+    respuesta_ndjson_util,
+    solicita_ndjson_util,
+    validar_paginacion_flujo_util,
+)
+from .paginacion import (
+    Paginacion,
+    incluir_campo_util,
+    leer_campos_util,
+    schema_proyectado_util,
+)
+from .reportes import registrar_reportes_util
+from .trabajos import (
+    cola_trabajos,
+    respuesta_aceptada_util,
+    trabajo_serializado_util,
+)
+
+
+class Schemas:
+    # Instancias compartidas de los schemas. Se crean en el primer uso, así
+    # importar las vistas no importa marshmallow
+    fabricas = {
+        "ingrediente": lambda: modelos.IngredienteSchema(),
+        "receta_ingrediente": lambda: modelos.RecetaIngredienteSchema(),
+        "receta": lambda: modelos.RecetaSchema(),
+        "usuario": lambda: modelos.UsuarioSchema(),
+        "restaurante": lambda: modelos.RestauranteSchema(),
+        "menu_semana": lambda: modelos.MenuSemanaSchema(),
+        "usuario_menu": lambda: modelos.UsuarioSchema(only=["usuario", "rol"]),
+        "restaurante_resumen": lambda: modelos.RestauranteSchema(
+            only=["id", "nombre", "direccion", "telefono", "tipo_comida"]
+        ),
+    }
+
+    def __getattr__(self, nombre):
+        if nombre not in self.fabricas:
+            raise AttributeError(nombre)
+        instancia = self.fabricas[nombre]()
+        setattr(self, nombre, instancia)
+        return instancia
+
+    def precargar(self):
+        # Para el master de gunicorn con preload_app: los workers heredan los
+        # schemas ya construidos al hacer fork
+        for nombre in self.fabricas:
+            serializador_para(getattr(self, nombre))
+
+
+schemas = Schemas()
+
+TAMANO_LOTE_IN = 500
+TAMANO_LOTE_IMPORTACION = 500
+MAXIMO_RECETAS_LOTE = 5000
+LIMITE_BUSQUEDA = 20
+
+PATRON_PALABRAS = re.compile(r"\w+")
+
+# Tablas de las que depende la serialización completa de un restaurante
+TABLAS_RESTAURANTE = ("restaurante", "usuario", "receta", "menu_semana", "menu_receta")
+
+
+def resolver_ingredientes_util(recetas):
+    # Reemplaza el id de ingrediente de cada línea de receta por el ingrediente
+    # serializado. Se buscan solo los ids referenciados en el catálogo
+    # compartido, sin consultar la base, una sola vez por solicitud. Si una
+    # escritura lo desactualizó, hasta que su trabajo lo reconstruya se
+    # consultan con una consulta IN por lote de ids
+    ids_ordenados = ids_ingredientes_util(recetas)
+    instantanea = catalogo_ingredientes.instantanea(reconstruir=PRIMERA)
+    if instantanea is not None:
+        return reemplazar_ingredientes_util(
+            recetas, instantanea.ingredientes(ids_ordenados)
+        )
+    ingredientes_por_id = {}
+    for inicio in range(0, len(ids_ordenados), TAMANO_LOTE_IN):
+        lote = ids_ordenados[inicio : inicio + TAMANO_LOTE_IN]
+        ingredientes = Ingrediente.query.filter(Ingrediente.id.in_(lote)).all()
+        ingredientes_por_id.update(serializar_ingredientes_util(ingredientes))
+    return reemplazar_ingredientes_util(recetas, ingredientes_por_id)
+
+
+def ids_ingredientes_util(recetas):
+    return sorted(
+        {
+            int(receta_ingrediente["ingrediente"])
+            for receta in recetas
+            for receta_ingrediente in receta.get("ingredientes", [])
+            if receta_ingrediente.get("ingrediente") is not None
+        }
+    )
+
 
-ingrediente_schema = IngredienteSchema()
-receta_ingrediente_schema = RecetaIngredienteSchema()
-receta_schema = RecetaSchema()
-usuario_schema = UsuarioSchema()
-restaurante_schema = RestauranteSchema()
-menu_semana_schema = MenuSemanaSchema()
+def serializar_ingredientes_util(ingredientes):
+    ingredientes_por_id = {}
+    for ingrediente_serializado in serializador_para(schemas.ingrediente).serializar(
+        ingredientes
+    ):
+        ingrediente_serializado["costo"] = float(ingrediente_serializado["costo"])
+        ingredientes_por_id[ingrediente_serializado["id"]] = ingrediente_serializado
+    return ingredientes_por_id
+
+
+def reemplazar_ingredientes_util(recetas, ingredientes_por_id):
+    for receta in recetas:
+        for receta_ingrediente in receta.get("ingredientes", []):
+            ingrediente = ingredientes_por_id.get(receta_ingrediente.get("ingrediente"))
+            if ingrediente is not None:
+                receta_ingrediente["ingrediente"] = ingrediente
+    return recetas
+
+
+def decimal_util(valor):
+    if valor is None or valor == "":
+        return Decimal(0)
+    return Decimal(str(valor))
+
+
+def totales_util(costo_total, calorias_total, porcion):
+    # Columnas de totales de una receta; las comparten el ORM y las inserciones
+    # por lote para que el cálculo sea uno solo
+    porcion = decimal_util(porcion)
+    return {
+        "costo_total": costo_total,
+        "calorias_total": calorias_total,
+        "costo_porcion": costo_total / porcion if porcion else Decimal(0),
+    }
+
+
+def asignar_totales_util(receta, costo_total, calorias_total):
+    for columna, valor in totales_util(
+        costo_total, calorias_total, receta.porcion
+    ).items():
+        setattr(receta, columna, valor)
+
+
+def actualizar_totales_receta_util(receta):
+    # Recalcula los totales de una receta a partir de sus líneas en memoria
+    ids_ingredientes = {
+        int(receta_ingrediente.ingrediente)
+        for receta_ingrediente in receta.ingredientes
+        if receta_ingrediente.ingrediente is not None
+    }
+    ingredientes_por_id = {}
+    if ids_ingredientes:
+        ingredientes_por_id = {
+            ingrediente.id: ingrediente
+            for ingrediente in Ingrediente.query.filter(
+                Ingrediente.id.in_(ids_ingredientes)
+            )
+        }
+
+    costo_total = Decimal(0)
+    calorias_total = Decimal(0)
+    for receta_ingrediente in receta.ingredientes:
+        if receta_ingrediente.ingrediente is None:
+            continue
+        ingrediente = ingredientes_por_id.get(int(receta_ingrediente.ingrediente))
+        if ingrediente is None:
+            continue
+        cantidad = decimal_util(receta_ingrediente.cantidad)
+        costo_total += cantidad * decimal_util(ingrediente.costo)
+        calorias_total += cantidad * decimal_util(ingrediente.calorias)
+
+    asignar_totales_util(receta, costo_total, calorias_total)
+
+
+def totales_por_recetas_util(ids_recetas):
+    # Costo y calorías de cada receta en una consulta agrupada. Las recetas sin
+    # líneas no aparecen en el resultado
+    totales = (
+        db.session.query(
+            RecetaIngrediente.receta,
+            func.sum(RecetaIngrediente.cantidad * Ingrediente.costo),
+            func.sum(RecetaIngrediente.cantidad * Ingrediente.calorias),
+        )
+        .join(Ingrediente, Ingrediente.id == RecetaIngrediente.ingrediente)
+        .filter(RecetaIngrediente.receta.in_(ids_recetas))
+        .group_by(RecetaIngrediente.receta)
+    )
+    return {
+        id_receta: (decimal_util(costo), decimal_util(calorias))
+        for id_receta, costo, calorias in totales
+    }
+
+
+def actualizar_totales_por_ingredientes_util(ids_ingredientes):
+    # Usa el índice de receta_ingrediente.ingrediente para recalcular solo las
+    # recetas que contienen los ingredientes modificados
+    ids_recetas = (
+        select(RecetaIngrediente.receta)
+        .where(RecetaIngrediente.ingrediente.in_(list(ids_ingredientes)))
+        .distinct()
+    )
+    totales_por_receta = totales_por_recetas_util(ids_recetas)
+    if not totales_por_receta:
+        return 0
+
+    for receta in Receta.query.filter(Receta.id.in_(totales_por_receta.keys())):
+        asignar_totales_util(receta, *totales_por_receta[receta.id])
+    return len(totales_por_receta)
+
+
+# Trabajos en segundo plano. Sus cambios se confirman junto con el estado del
+# trabajo, y los reportes y la caché se actualizan como en cualquier commit
+@cola_trabajos.tarea("recalcular_totales_ingredientes")
+def recalcular_totales_ingredientes(ingredientes):
+    recetas = 0
+    for inicio in range(0, len(ingredientes), TAMANO_LOTE_IN):
+        recetas += actualizar_totales_por_ingredientes_util(
+            ingredientes[inicio : inicio + TAMANO_LOTE_IN]
+        )
+    return {"recetas": recetas}
+
+
+@cola_trabajos.tarea("borrar_restaurante")
+def borrar_restaurante(restaurante):
+    # El borrado en cascada recorre los menús del restaurante y sus recetas
+    restaurante = Restaurante.query.get(restaurante)
+    if restaurante is None:
+        return {"menus": 0}
+    menus = len(restaurante.menu_semana)
+    db.session.delete(restaurante)
+    return {"menus": menus}
+
+
+def ingrediente_en_uso_util(id_ingrediente):
+    # EXISTS sobre el índice de receta_ingrediente.ingrediente: se detiene en la
+    # primera línea de receta, sin importar cuántas usen el ingrediente
+    return db.session.query(
+        exists().where(RecetaIngrediente.ingrediente == id_ingrediente)
+    ).scalar()
+
+
+def filtro_menus_usuario_util(usuario):
+    # Un chef ve los menús de su restaurante y un administrador los de todos
+    # los restaurantes que administra
+    if usuario.rol is Rol.CHEF:
+        return MenuSemana.id_restaurante == usuario.restaurante_id
+    return MenuSemana.id_restaurante.in_(
+        select(Restaurante.id).where(Restaurante.administrador_id == usuario.id)
+    )
+
+
+def consulta_fts_util(texto):
+    # Cada palabra se busca como prefijo y entre comillas, para que el texto
+    # del usuario no se interprete como sintaxis de FTS5. Las palabras se
+    # combinan con AND
+    palabras = PATRON_PALABRAS.findall(texto or "")
+    if not palabras:
+        raise ValueError("La búsqueda debe tener al menos una palabra")
+    return " ".join('"{}"*'.format(palabra) for palabra in palabras)
+
+
+def buscar_util(tabla_fts, modelo, schema, filtro=None, opciones=()):
+    # Busca en la tabla FTS5 los ids ordenados por relevancia (bm25), pagina
+    # sobre (relevancia, id) y carga las filas de la página en una consulta
+    paginacion = Paginacion.desde_solicitud(ordenes=("relevancia",))
+    if paginacion.limite is None:
+        paginacion.limite = LIMITE_BUSQUEDA
+    schema = schema_proyectado_util(schema, leer_campos_util())
+    fts = table(tabla_fts, column("rowid"), column("rank"))
+    consulta = db.session.query(fts.c.rowid, fts.c.rank).filter(
+        text("{} MATCH :consulta".format(tabla_fts)).bindparams(
+            consulta=consulta_fts_util(request.args.get("q"))
+        )
+    )
+    if filtro is not None:
+        consulta = consulta.join(modelo, modelo.id == fts.c.rowid).filter(filtro)
+
+    ids = [fila.rowid for fila in paginacion.aplicar(consulta, fts.c.rowid, fts.c.rank)]
+    por_id = {}
+    if ids:
+        por_id = {
+            elemento.id: elemento
+            for elemento in modelo.query.options(*opciones).filter(modelo.id.in_(ids))
+        }
+    elementos = [por_id[id_elemento] for id_elemento in ids if id_elemento in por_id]
+    return paginacion, serializador_para(schema).serializar(elementos)
 
 
 class VistaSignIn(Resource):
@@ -59,7 +342,7 @@ class VistaSignIn(Resource):
         usuario = Usuario.query.get_or_404(id_usuario)
         usuario.contrasena = request.json.get("contrasena", usuario.contrasena)
         db.session.commit()
-        return usuario_schema.dump(usuario)
+        return schemas.usuario.dump(usuario)
 
     def delete(self, id_usuario):
         usuario = Usuario.query.get_or_404(id_usuario)
@@ -73,16 +356,27 @@ class VistaLogIn(Resource):
         contrasena_encriptada = hashlib.md5(
             request.json["contrasena"].encode("utf-8")
         ).hexdigest()
-        usuario = Usuario.query.filter(
-            Usuario.usuario == request.json["usuario"],
-            Usuario.contrasena == contrasena_encriptada,
-        ).first()
+        fila = (
+            db.session.query(Usuario, version_usuario_util(Usuario.id))
+            .filter(
+                Usuario.usuario == request.json["usuario"],
+                Usuario.contrasena == contrasena_encriptada,
+            )
+            .first()
+        )
         db.session.commit()
         print(str(hashlib.md5("admin".encode("utf-8")).hexdigest()))
-        if usuario is None:
+        if fila is None:
             return "El usuario no existe", 404
         else:
-            token_de_acceso = create_access_token(identity=usuario.id)
+            # El rol y el restaurante viajan en el token para autorizar sin
+            # consultar al usuario en cada solicitud, mientras su versión no
+            # cambie
+            usuario, version = fila
+            token_de_acceso = create_access_token(
+                identity=usuario.id,
+                additional_claims=claims_usuario_util(usuario, version),
+            )
             return {
                 "mensaje": "Inicio de sesión exitoso",
                 "token": token_de_acceso,
@@ -93,9 +387,30 @@ class VistaLogIn(Resource):
 
 class VistaIngredientes(Resource):
     @jwt_required()
+    @cache_respuestas.cacheada("ingrediente")
     def get(self):
-        ingredientes = Ingrediente.query.all()
-        return [ingrediente_schema.dump(ingrediente) for ingrediente in ingredientes]
+        try:
+            paginacion = Paginacion.desde_solicitud(ordenes=("id", "nombre"))
+            schema = schema_proyectado_util(schemas.ingrediente, leer_campos_util())
+            flujo = solicita_ndjson_util()
+            if flujo:
+                validar_paginacion_flujo_util(paginacion)
+        except ValueError as e:
+            return str(e), 400
+
+        serializador = serializador_para(schema)
+        if flujo:
+            consulta = paginacion.preparar(
+                Ingrediente.query, Ingrediente.id, Ingrediente.nombre
+            )
+            return respuesta_ndjson_util(
+                serializador.serializar(lote) for lote in lotes_util(consulta)
+            )
+
+        ingredientes = paginacion.aplicar(
+            Ingrediente.query, Ingrediente.id, Ingrediente.nombre
+        )
+        return paginacion.respuesta(serializador.serializar(ingredientes))
 
     @jwt_required()
     def post(self):
@@ -109,13 +424,282 @@ class VistaIngredientes(Resource):
 
         db.session.add(nuevo_ingrediente)
         db.session.commit()
-        return ingrediente_schema.dump(nuevo_ingrediente)
+        return schemas.ingrediente.dump(nuevo_ingrediente)
+
+
+class VistaIngredientesLote(Resource):
+    campos = ["nombre", "unidad", "costo", "calorias", "sitio"]
+
+    @jwt_required()
+    def post(self):
+        if request.mimetype == "application/json":
+            filas = request.get_json()
+            if not isinstance(filas, list):
+                return "Se esperaba un arreglo de ingredientes", 400
+        elif request.mimetype == "text/csv":
+            filas = csv.DictReader(io.TextIOWrapper(request.stream, encoding="utf-8"))
+        elif request.mimetype == "application/x-ndjson":
+            filas = self.leer_ndjson_util(request.stream)
+        else:
+            return "Formato no soportado", 415
+
+        reporte = {"insertados": 0, "actualizados": 0, "errores": []}
+        actualizados = set()
+        lote = []
+        try:
+            for numero, fila in enumerate(filas, start=1):
+                lote.append((numero, fila))
+                if len(lote) == TAMANO_LOTE_IMPORTACION:
+                    self.importar_lote_util(lote, reporte, actualizados)
+                    lote = []
+        except ValueError as e:
+            db.session.rollback()
+            reporte["errores"].append({"fila": None, "errores": str(e)})
+            # Los lotes ya confirmados igual necesitan sus recetas recalculadas
+            self.recalcular_recetas_util(actualizados, reporte)
+            return reporte, 400
+        if lote:
+            self.importar_lote_util(lote, reporte, actualizados)
+
+        trabajo = self.recalcular_recetas_util(actualizados, reporte)
+        if trabajo is None:
+            return reporte, 200
+        return respuesta_aceptada_util(trabajo, reporte)
+
+    @jwt_required()
+    def get(self):
+        formato = request.args.get("formato", "ndjson")
+        if formato == "csv":
+            return Response(
+                stream_with_context(self.exportar_csv_util()),
+                mimetype="text/csv",
+                headers={
+                    "Content-Disposition": "attachment; filename=ingredientes.csv"
+                },
+            )
+        elif formato == "ndjson":
+            return Response(
+                stream_with_context(self.exportar_ndjson_util()),
+                mimetype="application/x-ndjson",
+            )
+        return "Formato no soportado", 400
+
+    @jwt_required()
+    def delete(self):
+        ids = request.get_json(silent=True)
+        if isinstance(ids, dict):
+            ids = ids.get("ids")
+        if not isinstance(ids, list):
+            return "Se esperaba un arreglo de ids de ingredientes", 400
+        try:
+            ids = sorted({int(id_ingrediente) for id_ingrediente in ids})
+        except (TypeError, ValueError):
+            return "Los ids de los ingredientes deben ser números enteros", 400
+
+        # Una consulta agrupada por lote de ids cuenta las recetas que usan cada
+        # ingrediente; los que no tienen recetas se borran con un DELETE masivo
+        bloqueados = []
+        borrados = []
+        no_encontrados = []
+        for inicio in range(0, len(ids), TAMANO_LOTE_IN):
+            lote = ids[inicio : inicio + TAMANO_LOTE_IN]
+            recetas_por_ingrediente = dict(
+                db.session.query(
+                    RecetaIngrediente.ingrediente,
+                    func.count(RecetaIngrediente.receta.distinct()),
+                )
+                .filter(RecetaIngrediente.ingrediente.in_(lote))
+                .group_by(RecetaIngrediente.ingrediente)
+            )
+            existentes = {
+                id_ingrediente
+                for id_ingrediente, in db.session.query(Ingrediente.id).filter(
+                    Ingrediente.id.in_(lote)
+                )
+            }
+            libres = []
+            for id_ingrediente in lote:
+                if id_ingrediente not in existentes:
+                    no_encontrados.append(id_ingrediente)
+                elif id_ingrediente in recetas_por_ingrediente:
+                    bloqueados.append(
+                        {
+                            "id": id_ingrediente,
+                            "recetas": recetas_por_ingrediente[id_ingrediente],
+                        }
+                    )
+                else:
+                    libres.append(id_ingrediente)
+            if libres:
+                Ingrediente.query.filter(Ingrediente.id.in_(libres)).delete(
+                    synchronize_session=False
+                )
+                borrados.extend(libres)
+
+        db.session.commit()
+        return {
+            "borrados": borrados,
+            "bloqueados": bloqueados,
+            "no_encontrados": no_encontrados,
+        }, 200
+
+    def leer_ndjson_util(self, flujo):
+        for numero, linea in enumerate(flujo, start=1):
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                yield json.loads(linea)
+            except ValueError:
+                raise ValueError("La línea {} no es JSON válido".format(numero))
+
+    def validar_fila_util(self, fila):
+        if not isinstance(fila, dict):
+            return None, {"_schema": ["La fila debe ser un objeto"]}
+        fila = {
+            campo: valor for campo, valor in fila.items() if valor not in ("", None)
+        }
+        # Los campos numéricos del schema son String, se validan como texto y se
+        # convierten después
+        errores = schemas.ingrediente.validate(
+            {
+                campo: str(valor) if campo in ("id", "costo", "calorias") else valor
+                for campo, valor in fila.items()
+            },
+            session=db.session,
+        )
+        for campo in self.campos:
+            if campo not in fila:
+                errores.setdefault(campo, []).append("Campo requerido.")
+        for campo in ("costo", "calorias"):
+            if campo in fila and campo not in errores:
+                try:
+                    fila[campo] = float(fila[campo])
+                except (TypeError, ValueError):
+                    errores[campo] = ["Debe ser un número."]
+        if "id" in fila and "id" not in errores:
+            try:
+                fila["id"] = int(fila["id"])
+            except (TypeError, ValueError):
+                errores["id"] = ["Debe ser un entero."]
+        if errores:
+            return None, errores
+        return fila, None
+
+    def recalcular_recetas_util(self, actualizados, reporte):
+        # Un solo trabajo recalcula las recetas de todos los ingredientes
+        # actualizados en la importación
+        if not actualizados:
+            return None
+        trabajo = trabajo_serializado_util(
+            cola_trabajos.encolar(
+                "recalcular_totales_ingredientes",
+                id_usuario=get_jwt_identity(),
+                ingredientes=sorted(actualizados),
+            )
+        )
+        db.session.commit()
+        reporte["trabajo"] = trabajo
+        return trabajo
+
+    def importar_lote_util(self, lote, reporte, actualizados):
+        # Un lote es una transacción: se valida cada fila, se identifican las
+        # existentes (por id o por nombre) con dos consultas IN y luego se hace
+        # un executemany para las inserciones y otro para las actualizaciones
+        validas = []
+        for numero, fila in lote:
+            valores, errores = self.validar_fila_util(fila)
+            if errores:
+                reporte["errores"].append({"fila": numero, "errores": errores})
+            else:
+                validas.append((numero, valores))
+
+        ids = [valores["id"] for _, valores in validas if "id" in valores]
+        nombres = [valores["nombre"] for _, valores in validas if "id" not in valores]
+        ids_existentes = set()
+        if ids:
+            ids_existentes = {
+                id_ingrediente
+                for id_ingrediente, in db.session.query(Ingrediente.id).filter(
+                    Ingrediente.id.in_(ids)
+                )
+            }
+        ids_por_nombre = {}
+        if nombres:
+            ids_por_nombre = dict(
+                db.session.query(Ingrediente.nombre, func.min(Ingrediente.id))
+                .filter(Ingrediente.nombre.in_(nombres))
+                .group_by(Ingrediente.nombre)
+            )
+
+        inserciones = {}
+        actualizaciones = {}
+        for numero, valores in validas:
+            id_ingrediente = valores.pop("id", None)
+            if id_ingrediente is None:
+                id_ingrediente = ids_por_nombre.get(valores["nombre"])
+                if id_ingrediente is None:
+                    inserciones[valores["nombre"]] = valores
+                    continue
+            elif id_ingrediente not in ids_existentes:
+                reporte["errores"].append(
+                    {"fila": numero, "errores": {"id": ["El ingrediente no existe."]}}
+                )
+                continue
+            actualizaciones[id_ingrediente] = dict(valores, b_id=id_ingrediente)
+
+        tabla = Ingrediente.__table__
+        if inserciones:
+            db.session.execute(tabla.insert(), list(inserciones.values()))
+        if actualizaciones:
+            db.session.execute(
+                tabla.update().where(tabla.c.id == bindparam("b_id")),
+                list(actualizaciones.values()),
+            )
+            actualizados.update(actualizaciones.keys())
+        registrar_tablas_util(db.session, {"ingrediente"})
+        db.session.commit()
+
+        reporte["insertados"] += len(inserciones)
+        reporte["actualizados"] += len(actualizaciones)
+
+    def filas_exportacion_util(self):
+        resultado = db.session.execute(
+            select(Ingrediente.__table__).order_by(Ingrediente.id)
+        )
+        for filas in resultado.partitions(TAMANO_LOTE_IMPORTACION):
+            for fila in filas:
+                yield {
+                    "id": str(fila.id),
+                    "nombre": fila.nombre,
+                    "unidad": fila.unidad,
+                    "costo": None if fila.costo is None else str(fila.costo),
+                    "calorias": None if fila.calorias is None else str(fila.calorias),
+                    "sitio": fila.sitio,
+                }
+
+    def exportar_ndjson_util(self):
+        for fila in self.filas_exportacion_util():
+            yield json.dumps(fila) + "\n"
+
+    def exportar_csv_util(self):
+        salida = io.StringIO()
+        escritor = csv.DictWriter(salida, fieldnames=["id"] + self.campos)
+        escritor.writeheader()
+        for fila in self.filas_exportacion_util():
+            escritor.writerow(fila)
+            if salida.tell() > 64 * 1024:
+                yield salida.getvalue()
+                salida.seek(0)
+                salida.truncate(0)
+        yield salida.getvalue()
 
 
 class VistaIngrediente(Resource):
     @jwt_required()
+    @cache_respuestas.cacheada("ingrediente")
     def get(self, id_ingrediente):
-        return ingrediente_schema.dump(Ingrediente.query.get_or_404(id_ingrediente))
+        return schemas.ingrediente.dump(Ingrediente.query.get_or_404(id_ingrediente))
 
     @jwt_required()
     def put(self, id_ingrediente):
@@ -125,16 +709,26 @@ class VistaIngrediente(Resource):
         ingrediente.costo = float(request.json["costo"])
         ingrediente.calorias = float(request.json["calorias"])
         ingrediente.sitio = request.json["sitio"]
+        if not ingrediente_en_uso_util(id_ingrediente):
+            db.session.commit()
+            return schemas.ingrediente.dump(ingrediente)
+
+        # Los totales de las recetas que lo usan, y los reportes de sus menús,
+        # se recalculan en segundo plano
+        trabajo = trabajo_serializado_util(
+            cola_trabajos.encolar(
+                "recalcular_totales_ingredientes",
+                id_usuario=get_jwt_identity(),
+                ingredientes=[id_ingrediente],
+            )
+        )
         db.session.commit()
-        return ingrediente_schema.dump(ingrediente)
+        return respuesta_aceptada_util(trabajo, schemas.ingrediente.dump(ingrediente))
 
     @jwt_required()
     def delete(self, id_ingrediente):
         ingrediente = Ingrediente.query.get_or_404(id_ingrediente)
-        recetasIngrediente = RecetaIngrediente.query.filter_by(
-            ingrediente=id_ingrediente
-        ).all()
-        if not recetasIngrediente:
+        if not ingrediente_en_uso_util(id_ingrediente):
             db.session.delete(ingrediente)
             db.session.commit()
             return "", 204
@@ -142,17 +736,46 @@ class VistaIngrediente(Resource):
             return "El ingrediente se está usando en diferentes recetas", 409
 
 
+class VistaBusquedaIngredientes(Resource):
+    @jwt_required()
+    @cache_respuestas.cacheada("ingrediente")
+    def get(self):
+        try:
+            paginacion, resultados = buscar_util(
+                "ingrediente_fts", Ingrediente, schemas.ingrediente
+            )
+        except ValueError as e:
+            return str(e), 400
+        return paginacion.respuesta(resultados)
+
+
 class VistaRecetas(Resource):
     @jwt_required()
     def get(self, id_usuario):
-        recetas = Receta.query.filter_by(usuario=str(id_usuario)).all()
-        resultados = [receta_schema.dump(receta) for receta in recetas]
-        ingredientes = Ingrediente.query.all()
-        for receta in resultados:
-            for receta_ingrediente in receta["ingredientes"]:
-                self.actualizar_ingredientes_util(receta_ingrediente, ingredientes)
+        try:
+            paginacion = Paginacion.desde_solicitud(ordenes=("id", "nombre"))
+            schema = schema_proyectado_util(schemas.receta, leer_campos_util())
+            flujo = solicita_ndjson_util()
+            if flujo:
+                validar_paginacion_flujo_util(paginacion)
+        except ValueError as e:
+            return str(e), 400
 
-        return resultados
+        consulta = Receta.query.filter_by(usuario=str(id_usuario)).options(
+            selectinload(Receta.ingredientes)
+        )
+        serializador = serializador_para(schema)
+        if flujo:
+            # Cada lote resuelve sus ingredientes en el catálogo compartido
+            consulta = paginacion.preparar(consulta, Receta.id, Receta.nombre)
+            return respuesta_ndjson_util(
+                resolver_ingredientes_util(serializador.serializar(lote))
+                for lote in lotes_util(consulta)
+            )
+
+        recetas = paginacion.aplicar(consulta, Receta.id, Receta.nombre)
+        resultados = serializador.serializar(recetas)
+        return paginacion.respuesta(resolver_ingredientes_util(resultados))
 
     @jwt_required()
     def post(self, id_usuario):
@@ -171,75 +794,245 @@ class VistaRecetas(Resource):
             )
             nueva_receta.ingredientes.append(nueva_receta_ingrediente)
 
+        actualizar_totales_receta_util(nueva_receta)
         db.session.add(nueva_receta)
         db.session.commit()
-        return ingrediente_schema.dump(nueva_receta)
-
-    def actualizar_ingredientes_util(self, receta_ingrediente, ingredientes):
-        for ingrediente in ingredientes:
-            if str(ingrediente.id) == receta_ingrediente["ingrediente"]:
-                receta_ingrediente["ingrediente"] = ingrediente_schema.dump(ingrediente)
-                receta_ingrediente["ingrediente"]["costo"] = float(
-                    receta_ingrediente["ingrediente"]["costo"]
+        return schemas.ingrediente.dump(nueva_receta)
+
+
+class VistaRecetasLote(Resource):
+    # Crea recetas nuevas ("recetas", con el formato de VistaRecetas.post) y
+    # clona recetas existentes ("clonar" por id, o todas las de
+    # "clonar_usuario") para el usuario, con sus líneas, en una sola
+    # transacción. Retorna los ids creados en el mismo orden
+    @jwt_required()
+    def post(self, id_usuario):
+        if hechos_usuario_util(id_usuario) is None:
+            return "El usuario no existe", 404
+        datos = request.get_json(silent=True)
+        if isinstance(datos, list):
+            datos = {"recetas": datos}
+        if not isinstance(datos, dict):
+            return "Se esperaba un objeto con recetas o recetas a clonar", 400
+        definiciones = datos.get("recetas", [])
+        clonar = datos.get("clonar", [])
+        if not isinstance(definiciones, list) or not isinstance(clonar, list):
+            return "recetas y clonar deben ser arreglos", 400
+        if len(definiciones) + len(clonar) > MAXIMO_RECETAS_LOTE:
+            return "Máximo {} recetas por solicitud".format(MAXIMO_RECETAS_LOTE), 400
+
+        nuevas, errores = self.validar_recetas_util(definiciones, id_usuario)
+        if errores:
+            return {"errores": errores}, 400
+        try:
+            clonadas = self.recetas_a_clonar_util(
+                clonar,
+                datos.get("clonar_usuario"),
+                id_usuario,
+                MAXIMO_RECETAS_LOTE - len(nuevas),
+            )
+        except (TypeError, ValueError) as e:
+            return str(e), 400
+        if not nuevas and not clonadas:
+            return "No hay recetas para crear", 400
+
+        ids = self.insertar_recetas_util(nuevas + clonadas)
+        db.session.commit()
+        return {
+            "ids": ids[: len(nuevas)],
+            "clonadas": [
+                {"origen": fila["id"], "id": id_receta}
+                for (fila, _), id_receta in zip(clonadas, ids[len(nuevas) :])
+            ],
+        }
+
+    def validar_recetas_util(self, definiciones, id_usuario):
+        # Valida cada receta y sus líneas, y luego todos los ingredientes
+        # referenciados con una consulta IN por lote de ids, que trae también
+        # el costo y las calorías para calcular los totales
+        recetas = []
+        errores = []
+        for posicion, definicion in enumerate(definiciones):
+            try:
+                fila = {
+                    "nombre": definicion["nombre"],
+                    "preparacion": definicion["preparacion"],
+                    "duracion": float(definicion["duracion"]),
+                    "porcion": float(definicion["porcion"]),
+                    "usuario": id_usuario,
+                }
+                lineas = [
+                    {
+                        "cantidad": decimal_util(linea["cantidad"]),
+                        "ingrediente": int(linea["idIngrediente"]),
+                    }
+                    for linea in definicion["ingredientes"]
+                ]
+            except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+                errores.append(
+                    {"receta": posicion, "errores": "Datos inválidos: {}".format(e)}
+                )
+                continue
+            recetas.append((posicion, fila, lineas))
+
+        ids_ingredientes = sorted(
+            {linea["ingrediente"] for _, _, lineas in recetas for linea in lineas}
+        )
+        ingredientes = {}
+        for inicio in range(0, len(ids_ingredientes), TAMANO_LOTE_IN):
+            lote = ids_ingredientes[inicio : inicio + TAMANO_LOTE_IN]
+            ingredientes.update(
+                (id_ingrediente, (decimal_util(costo), decimal_util(calorias)))
+                for id_ingrediente, costo, calorias in db.session.query(
+                    Ingrediente.id, Ingrediente.costo, Ingrediente.calorias
+                ).filter(Ingrediente.id.in_(lote))
+            )
+
+        validas = []
+        for posicion, fila, lineas in recetas:
+            faltantes = sorted(
+                {
+                    linea["ingrediente"]
+                    for linea in lineas
+                    if linea["ingrediente"] not in ingredientes
+                }
+            )
+            if faltantes:
+                errores.append(
+                    {
+                        "receta": posicion,
+                        "errores": "Los ingredientes {} no existen".format(
+                            ", ".join(
+                                str(id_ingrediente) for id_ingrediente in faltantes
+                            )
+                        ),
+                    }
+                )
+                continue
+            costo_total = Decimal(0)
+            calorias_total = Decimal(0)
+            for linea in lineas:
+                costo, calorias = ingredientes[linea["ingrediente"]]
+                costo_total += linea["cantidad"] * costo
+                calorias_total += linea["cantidad"] * calorias
+            fila.update(totales_util(costo_total, calorias_total, fila["porcion"]))
+            validas.append((fila, lineas))
+        errores.sort(key=lambda error: error["receta"])
+        return validas, errores
+
+    def recetas_a_clonar_util(self, ids_recetas, id_usuario_origen, id_usuario, maximo):
+        # Lee las recetas a clonar y sus líneas por lotes de ids. Los totales se
+        # copian: las líneas y los ingredientes son los mismos. Las recetas de
+        # id_usuario_origen se leen con un LIMIT de una más que las que caben en
+        # la solicitud, así un lote que excede el máximo se rechaza sin cargar
+        # todas las recetas ni sus líneas
+        tabla = Receta.__table__
+        columnas = [
+            tabla.c.id,
+            tabla.c.nombre,
+            tabla.c.preparacion,
+            tabla.c.duracion,
+            tabla.c.porcion,
+            tabla.c.costo_total,
+            tabla.c.calorias_total,
+            tabla.c.costo_porcion,
+        ]
+        ids_recetas = [int(id_receta) for id_receta in ids_recetas]
+        por_id = {}
+        for inicio in range(0, len(ids_recetas), TAMANO_LOTE_IN):
+            lote = ids_recetas[inicio : inicio + TAMANO_LOTE_IN]
+            por_id.update(
+                (fila.id, dict(fila._mapping))
+                for fila in db.session.execute(
+                    select(*columnas).where(tabla.c.id.in_(lote))
+                )
+            )
+        faltantes = sorted(set(ids_recetas) - set(por_id))
+        if faltantes:
+            raise ValueError(
+                "Las recetas a clonar {} no existen".format(
+                    ", ".join(str(id_receta) for id_receta in faltantes)
                 )
+            )
+        filas = [por_id[id_receta] for id_receta in ids_recetas]
+        if id_usuario_origen is not None and len(filas) <= maximo:
+            filas.extend(
+                dict(fila._mapping)
+                for fila in db.session.execute(
+                    select(*columnas)
+                    .where(tabla.c.usuario == int(id_usuario_origen))
+                    .order_by(tabla.c.id)
+                    .limit(maximo - len(filas) + 1)
+                )
+            )
+        if len(filas) > maximo:
+            raise ValueError(
+                "Máximo {} recetas por solicitud".format(MAXIMO_RECETAS_LOTE)
+            )
+
+        lineas_por_receta = {}
+        ids_origen = sorted({fila["id"] for fila in filas})
+        for inicio in range(0, len(ids_origen), TAMANO_LOTE_IN):
+            lote = ids_origen[inicio : inicio + TAMANO_LOTE_IN]
+            for id_receta, cantidad, ingrediente in db.session.query(
+                RecetaIngrediente.receta,
+                RecetaIngrediente.cantidad,
+                RecetaIngrediente.ingrediente,
+            ).filter(RecetaIngrediente.receta.in_(lote)):
+                lineas_por_receta.setdefault(id_receta, []).append(
+                    {"cantidad": cantidad, "ingrediente": ingrediente}
+                )
+        return [
+            (
+                dict(fila, usuario=id_usuario),
+                lineas_por_receta.get(fila["id"], []),
+            )
+            for fila in filas
+        ]
+
+    def insertar_recetas_util(self, recetas):
+        # Un executemany para las recetas y otro para sus líneas. La
+        # transacción tiene el candado de escritura de SQLite desde la primera
+        # inserción, así que los rowid asignados son consecutivos y terminan
+        # en el máximo: se obtienen sin consultar receta por receta
+        tabla = Receta.__table__
+        filas = [
+            {columna: valor for columna, valor in fila.items() if columna != "id"}
+            for fila, _ in recetas
+        ]
+        db.session.execute(tabla.insert(), filas)
+        ultimo = db.session.query(func.max(Receta.id)).scalar()
+        ids = list(range(ultimo - len(filas) + 1, ultimo + 1))
+
+        lineas = [
+            dict(linea, receta=id_receta)
+            for id_receta, (_, lineas_receta) in zip(ids, recetas)
+            for linea in lineas_receta
+        ]
+        if lineas:
+            db.session.execute(RecetaIngrediente.__table__.insert(), lineas)
+        # Las inserciones directas no pasan por after_flush
+        registrar_tablas_util(db.session, {"receta", "receta_ingrediente"})
+        return ids
 
 
 class VistaReceta(Resource):
     @jwt_required()
     def get(self, id_receta):
         receta = Receta.query.get_or_404(id_receta)
-        ingredientes = Ingrediente.query.all()
-        resultados = receta_schema.dump(Receta.query.get_or_404(id_receta))
-        recetaIngredientes = resultados["ingredientes"]
-        for recetaIngrediente in recetaIngredientes:
-            for ingrediente in ingredientes:
-                if str(ingrediente.id) == recetaIngrediente["ingrediente"]:
-                    recetaIngrediente["ingrediente"] = ingrediente_schema.dump(
-                        ingrediente
-                    )
-                    recetaIngrediente["ingrediente"]["costo"] = float(
-                        recetaIngrediente["ingrediente"]["costo"]
-                    )
-
+        resultados = schemas.receta.dump(receta)
+        resolver_ingredientes_util([resultados])
         return resultados
 
     @jwt_required()
     def put(self, id_receta):
-        receta = Receta.query.get_or_404(id_receta)
-        receta.nombre = request.json["nombre"]
-        receta.preparacion = request.json["preparacion"]
-        receta.duracion = float(request.json["duracion"])
-        receta.porcion = float(request.json["porcion"])
-
-        # Verificar los ingredientes que se borraron
-        for receta_ingrediente in receta.ingredientes:
-            borrar = self.borrar_ingrediente_util(
-                request.json["ingredientes"], receta_ingrediente
-            )
-
-            if borrar == True:
-                db.session.delete(receta_ingrediente)
+        return self.actualizar_receta_util(id_receta, parcial=False)
 
-        db.session.commit()
-
-        for receta_ingrediente_editar in request.json["ingredientes"]:
-            if receta_ingrediente_editar["id"] == "":
-                # Es un nuevo ingrediente de la receta porque no tiene código
-                nueva_receta_ingrediente = RecetaIngrediente(
-                    cantidad=receta_ingrediente_editar["cantidad"],
-                    ingrediente=int(receta_ingrediente_editar["idIngrediente"]),
-                )
-                receta.ingredientes.append(nueva_receta_ingrediente)
-            else:
-                # Se actualiza el ingrediente de la receta
-                receta_ingrediente = self.actualizar_ingrediente_util(
-                    receta.ingredientes, receta_ingrediente_editar
-                )
-                db.session.add(receta_ingrediente)
-
-        db.session.add(receta)
-        db.session.commit()
-        return ingrediente_schema.dump(receta)
+    @jwt_required()
+    def patch(self, id_receta):
+        # Solo cambia los campos enviados; en "ingredientes" van únicamente las
+        # líneas nuevas (id vacío), las editadas y las que se borran ("borrar")
+        return self.actualizar_receta_util(id_receta, parcial=True)
 
     @jwt_required()
     def delete(self, id_receta):
@@ -248,34 +1041,132 @@ class VistaReceta(Resource):
         db.session.commit()
         return "", 204
 
-    def borrar_ingrediente_util(self, receta_ingredientes, receta_ingrediente):
-        borrar = True
-        for receta_ingrediente_editar in receta_ingredientes:
-            if receta_ingrediente_editar["id"] != "":
-                if int(receta_ingrediente_editar["id"]) == receta_ingrediente.id:
-                    borrar = False
+    def actualizar_receta_util(self, id_receta, parcial):
+        receta = Receta.query.get_or_404(id_receta)
+        datos = request.json
+        try:
+            if not parcial or "nombre" in datos:
+                receta.nombre = datos["nombre"]
+            if not parcial or "preparacion" in datos:
+                receta.preparacion = datos["preparacion"]
+            if not parcial or "duracion" in datos:
+                receta.duracion = float(datos["duracion"])
+            if not parcial or "porcion" in datos:
+                receta.porcion = float(datos["porcion"])
+            if not parcial or "ingredientes" in datos:
+                self.aplicar_lineas_util(receta.id, datos["ingredientes"], parcial)
+        except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+            db.session.rollback()
+            return "Datos de la receta inválidos: {}".format(e), 400
+
+        costo, calorias = totales_por_recetas_util([receta.id]).get(
+            receta.id, (Decimal(0), Decimal(0))
+        )
+        asignar_totales_util(receta, costo, calorias)
+        db.session.commit()
+        return schemas.ingrediente.dump(receta)
+
+    def aplicar_lineas_util(self, id_receta, lineas, parcial):
+        # Diferencia por id entre las líneas enviadas y las guardadas, aplicada
+        # con inserciones, actualizaciones y borrados masivos. En el PUT las
+        # líneas guardadas que no vienen en la solicitud se borran; en el PATCH
+        # solo se consultan las líneas mencionadas
+        nuevas = []
+        enviadas = {}
+        ids_borrar = set()
+        for linea in lineas:
+            id_linea = linea.get("id", "")
+            if id_linea in ("", None):
+                nuevas.append(
+                    {
+                        "receta": id_receta,
+                        "cantidad": decimal_util(linea["cantidad"]),
+                        "ingrediente": int(linea["idIngrediente"]),
+                    }
+                )
+            elif parcial and linea.get("borrar"):
+                ids_borrar.add(int(id_linea))
+            else:
+                enviadas[int(id_linea)] = (
+                    decimal_util(linea["cantidad"]),
+                    int(linea["idIngrediente"]),
+                )
 
-        return borrar
+        consulta = db.session.query(
+            RecetaIngrediente.id,
+            RecetaIngrediente.cantidad,
+            RecetaIngrediente.ingrediente,
+        ).filter(RecetaIngrediente.receta == id_receta)
+        guardadas = {}
+        if parcial:
+            ids_mencionados = sorted(set(enviadas) | ids_borrar)
+            for inicio in range(0, len(ids_mencionados), TAMANO_LOTE_IN):
+                lote = ids_mencionados[inicio : inicio + TAMANO_LOTE_IN]
+                guardadas.update(
+                    (id_linea, (cantidad, ingrediente))
+                    for id_linea, cantidad, ingrediente in consulta.filter(
+                        RecetaIngrediente.id.in_(lote)
+                    )
+                )
+        else:
+            guardadas = {
+                id_linea: (cantidad, ingrediente)
+                for id_linea, cantidad, ingrediente in consulta
+            }
+            ids_borrar = set(guardadas) - set(enviadas)
 
-    def actualizar_ingrediente_util(
-        self, receta_ingredientes, receta_ingrediente_editar
-    ):
-        receta_ingrediente_retornar = None
-        for receta_ingrediente in receta_ingredientes:
-            if int(receta_ingrediente_editar["id"]) == receta_ingrediente.id:
-                receta_ingrediente.cantidad = receta_ingrediente_editar["cantidad"]
-                receta_ingrediente.ingrediente = receta_ingrediente_editar[
-                    "idIngrediente"
-                ]
-                receta_ingrediente_retornar = receta_ingrediente
+        ajenas = (set(enviadas) | ids_borrar) - set(guardadas)
+        if ajenas:
+            raise ValueError(
+                "las líneas {} no pertenecen a la receta".format(
+                    ", ".join(str(id_linea) for id_linea in sorted(ajenas))
+                )
+            )
 
-        return receta_ingrediente_retornar
+        cambios = [
+            {"id": id_linea, "cantidad": cantidad, "ingrediente": ingrediente}
+            for id_linea, (cantidad, ingrediente) in enviadas.items()
+            if (decimal_util(guardadas[id_linea][0]), guardadas[id_linea][1])
+            != (cantidad, ingrediente)
+        ]
+
+        ids_borrar = sorted(ids_borrar)
+        for inicio in range(0, len(ids_borrar), TAMANO_LOTE_IN):
+            RecetaIngrediente.query.filter(
+                RecetaIngrediente.id.in_(ids_borrar[inicio : inicio + TAMANO_LOTE_IN])
+            ).delete(synchronize_session=False)
+        if cambios:
+            db.session.bulk_update_mappings(RecetaIngrediente, cambios)
+        if nuevas:
+            db.session.bulk_insert_mappings(RecetaIngrediente, nuevas)
+        if cambios or nuevas:
+            # Las operaciones masivas no pasan por after_flush
+            registrar_tablas_util(db.session, {"receta_ingrediente"})
+        if cambios or nuevas or ids_borrar:
+            registrar_reportes_util(db.session, lineas={id_receta})
+
+
+class VistaBusquedaRecetas(Resource):
+    @jwt_required()
+    def get(self, id_usuario):
+        # Busca solo entre las recetas del usuario, como VistaRecetas
+        try:
+            paginacion, resultados = buscar_util(
+                "receta_fts",
+                Receta,
+                schemas.receta,
+                Receta.usuario == str(id_usuario),
+                [selectinload(Receta.ingredientes)],
+            )
+        except ValueError as e:
+            return str(e), 400
+        return paginacion.respuesta(resolver_ingredientes_util(resultados))
 
 
 class VistaRestaurantes(Resource):
     @jwt_required()
     def post(self, id_usuario):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
+        usuario = hechos_usuario_util(id_usuario)
         restaurante = (
             Restaurante.query.filter(Restaurante.administrador_id == id_usuario)
             .filter(Restaurante.nombre == request.json["nombre"])
@@ -320,26 +1211,34 @@ class VistaRestaurantes(Resource):
         }
 
     @jwt_required()
+    @cache_respuestas.cacheada(*TABLAS_RESTAURANTE)
     def get(self, id_usuario):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
+        usuario = hechos_usuario_util(id_usuario)
         if usuario is None:
             return "El usuario no existe", 404
         elif usuario.rol != Rol.ADMINISTRADOR:
             return "Solo los Administradores pueden ver Restaurantes", 401
 
-        restaurantes = (
-            Restaurante.query.filter_by(administrador_id=id_usuario)
-            .order_by(Restaurante.nombre)
-            .all()
+        try:
+            paginacion = Paginacion.desde_solicitud(ordenes=("nombre", "id"))
+            schema = schema_proyectado_util(schemas.restaurante, leer_campos_util())
+        except ValueError as e:
+            return str(e), 400
+
+        restaurantes = paginacion.aplicar(
+            Restaurante.query.filter_by(administrador_id=id_usuario),
+            Restaurante.id,
+            Restaurante.nombre,
         )
 
-        return [restaurante_schema.dump(restaurante) for restaurante in restaurantes]
+        return paginacion.respuesta(serializador_para(schema).serializar(restaurantes))
 
 
 class VistaDetalleRestaurante(Resource):
     @jwt_required()
+    @cache_respuestas.cacheada(*TABLAS_RESTAURANTE)
     def get(self, id_usuario, id_restaurante):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
+        usuario = hechos_usuario_util(id_usuario)
 
         if usuario is None:
             return "El Administrador no existe", 404
@@ -347,41 +1246,98 @@ class VistaDetalleRestaurante(Resource):
             return "Solo los Administradores pueden ver el detalle del Restaurante", 401
 
         restaurante = Restaurante.query.filter(Restaurante.id == id_restaurante).first()
-        return restaurante_schema.dump(restaurante)
+        return schemas.restaurante.dump(restaurante)
+
+    @jwt_required()
+    def delete(self, id_usuario, id_restaurante):
+        usuario = hechos_usuario_util(id_usuario)
+
+        if usuario is None:
+            return "El Administrador no existe", 404
+        elif usuario.rol != Rol.ADMINISTRADOR:
+            return "Solo los Administradores pueden borrar Restaurantes", 401
+
+        existe = db.session.query(
+            exists().where(
+                and_(
+                    Restaurante.id == id_restaurante,
+                    Restaurante.administrador_id == id_usuario,
+                )
+            )
+        ).scalar()
+        if not existe:
+            return "El restaurante no existe", 404
+
+        # El borrado en cascada de los menús corre en segundo plano
+        trabajo = trabajo_serializado_util(
+            cola_trabajos.encolar(
+                "borrar_restaurante", id_usuario=id_usuario, restaurante=id_restaurante
+            )
+        )
+        db.session.commit()
+        return respuesta_aceptada_util(trabajo)
 
 
 class VistaMenuSemana(Resource):
     @jwt_required()
     def get(self, id_usuario):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
+        usuario = hechos_usuario_util(id_usuario)
         if usuario is None:
             return "El usuario no existe", 404
-        if usuario.rol is Rol.CHEF:
-            menus = MenuSemana.query.filter_by(
-                id_restaurante=usuario.restaurante_id
-            ).all()
-        else:
-            lista_restaurantes_id = [
-                restaurante.id
-                for restaurante in Restaurante.query.filter_by(
-                    administrador_id=id_usuario
-                ).all()
-            ]
-            menus = MenuSemana.query.filter(
-                MenuSemana.id_restaurante.in_(lista_restaurantes_id)
-            ).all()
-        result = []
-        for menu in menus:
-            usuario = Usuario.query.filter_by(id=menu.id_usuario).first()
-            menu_final = menu_semana_schema.dump(menu)
-            menu_final["usuario"] = UsuarioSchema(only=["usuario", "rol"]).dump(usuario)
-            menu_final["usuario"]["rol"] = usuario.rol.name
-            result.append(menu_final)
-        return result, 200
+
+        campos = leer_campos_util()
+        try:
+            paginacion = Paginacion.desde_solicitud()
+            schema = schema_proyectado_util(schemas.menu_semana, campos)
+            flujo = solicita_ndjson_util()
+            if flujo:
+                validar_paginacion_flujo_util(paginacion)
+        except ValueError as e:
+            return str(e), 400
+
+        consulta = MenuSemana.query.filter(filtro_menus_usuario_util(usuario)).options(
+            selectinload(MenuSemana.recetas)
+        )
+        incluir_usuario = incluir_campo_util(campos, "usuario")
+        if flujo:
+            consulta = paginacion.preparar(consulta, MenuSemana.id)
+            return respuesta_ndjson_util(
+                self.serializar_menus_util(lote, schema, incluir_usuario)
+                for lote in lotes_util(consulta)
+            )
+
+        menus = paginacion.aplicar(consulta, MenuSemana.id)
+        result = self.serializar_menus_util(menus, schema, incluir_usuario)
+        return paginacion.respuesta(result), 200
+
+    def serializar_menus_util(self, menus, schema, incluir_usuario):
+        result = serializador_para(schema).serializar(menus)
+        if not incluir_usuario:
+            return result
+
+        ids_usuarios = {menu.id_usuario for menu in menus if menu.id_usuario}
+        usuarios_por_id = {}
+        if ids_usuarios:
+            usuarios_por_id = {
+                usuario_menu.id: usuario_menu
+                for usuario_menu in Usuario.query.filter(Usuario.id.in_(ids_usuarios))
+            }
+
+        serializador_usuario = serializador_para(schemas.usuario_menu)
+        for menu, menu_final in zip(menus, result):
+            usuario_menu = usuarios_por_id.get(menu.id_usuario)
+            if usuario_menu is None:
+                menu_final["usuario"] = None
+            else:
+                menu_final["usuario"] = serializador_usuario.serializar_uno(
+                    usuario_menu
+                )
+                menu_final["usuario"]["rol"] = usuario_menu.rol.name
+        return result
 
     @jwt_required()
     def post(self, id_usuario):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
+        usuario = hechos_usuario_util(id_usuario)
         id_restaurante = None
         if usuario is None:
             return "El usuario no existe", 404
@@ -389,12 +1345,6 @@ class VistaMenuSemana(Resource):
             id_restaurante = usuario.restaurante_id
         else:
             id_restaurante = request.json["id_restaurante"]
-        nombre_menu_repetido = MenuSemana.query.filter_by(
-            nombre=request.json["nombre"]
-        ).first()
-
-        if nombre_menu_repetido is not None:
-            return "El nombre del menu ya existe", 400
         try:
             fecha_inicial = datetime.strptime(
                 request.json["fechaInicial"], "%Y-%m-%d"
@@ -409,12 +1359,23 @@ class VistaMenuSemana(Resource):
         if diff_fecha.days != 6:
             return "Las fechas no tienen la diferencia correcta", 400
 
-        todos_menus = MenuSemana.query.filter_by(id_restaurante=id_restaurante).all()
-        for menu in todos_menus:
-            if (fecha_final >= menu.fecha_final >= fecha_inicial) or (
-                fecha_final >= menu.fecha_inicial >= fecha_inicial
-            ):
-                return "Las fechas tienen conflicto con las de otro menu", 400
+        # Bloquea la fila del restaurante antes de validar para que dos solicitudes
+        # concurrentes no creen menús traslapados (en SQLite toma el candado de
+        # escritura de la base de datos hasta el commit)
+        Restaurante.query.filter(Restaurante.id == id_restaurante).update(
+            {Restaurante.id: Restaurante.id}, synchronize_session=False
+        )
+
+        nombre_menu_repetido = MenuSemana.query.filter_by(
+            nombre=request.json["nombre"]
+        ).first()
+        if nombre_menu_repetido is not None:
+            db.session.rollback()
+            return "El nombre del menu ya existe", 400
+
+        if self.buscar_menu_traslapado_util(id_restaurante, fecha_inicial, fecha_final):
+            db.session.rollback()
+            return "Las fechas tienen conflicto con las de otro menu", 400
 
         nuevo_menu_semana = MenuSemana(
             nombre=request.json["nombre"],
@@ -428,13 +1389,133 @@ class VistaMenuSemana(Resource):
             nuevo_menu_semana.recetas.append(receta_menu)
         db.session.add(nuevo_menu_semana)
         db.session.commit()
-        return menu_semana_schema.dump(nuevo_menu_semana), 200
+        return schemas.menu_semana.dump(nuevo_menu_semana), 200
+
+    def buscar_menu_traslapado_util(self, id_restaurante, fecha_inicial, fecha_final):
+        # Los menús de un restaurante no se traslapan entre sí, así que basta con
+        # revisar el último que empieza antes del fin del nuevo rango: es el que
+        # termina más tarde. La consulta es una búsqueda en el índice compuesto
+        # (id_restaurante, fecha_inicial, fecha_final)
+        menu_anterior = (
+            MenuSemana.query.filter(
+                MenuSemana.id_restaurante == id_restaurante,
+                MenuSemana.fecha_inicial <= fecha_final,
+            )
+            .order_by(MenuSemana.fecha_inicial.desc())
+            .first()
+        )
+        if menu_anterior is not None and menu_anterior.fecha_final >= fecha_inicial:
+            return menu_anterior
+        return None
+
+
+class VistaListaCompras(Resource):
+    columnas_csv = [
+        "id_ingrediente",
+        "nombre",
+        "unidad",
+        "sitio",
+        "cantidad",
+        "costo",
+        "calorias",
+    ]
+
+    @jwt_required()
+    def get(self, id_usuario):
+        usuario = hechos_usuario_util(id_usuario)
+        if usuario is None:
+            return "El usuario no existe", 404
+
+        try:
+            filtro_menus = self.filtro_solicitud_util()
+        except ValueError as e:
+            return str(e), 400
+
+        cantidad = func.sum(RecetaIngrediente.cantidad)
+        consulta = (
+            db.session.query(
+                Ingrediente.id,
+                Ingrediente.nombre,
+                Ingrediente.unidad,
+                Ingrediente.sitio,
+                cantidad,
+                func.sum(RecetaIngrediente.cantidad * Ingrediente.costo),
+                func.sum(RecetaIngrediente.cantidad * Ingrediente.calorias),
+            )
+            .select_from(MenuSemana)
+            .join(MenuReceta, MenuReceta.menu == MenuSemana.id)
+            .join(RecetaIngrediente, RecetaIngrediente.receta == MenuReceta.receta)
+            .join(Ingrediente, Ingrediente.id == RecetaIngrediente.ingrediente)
+            .filter(filtro_menus_usuario_util(usuario), filtro_menus)
+            .group_by(Ingrediente.id, Ingrediente.unidad)
+            .order_by(Ingrediente.nombre, Ingrediente.id)
+        )
+
+        if request.args.get("formato") == "csv":
+            return Response(
+                stream_with_context(self.generar_csv_util(consulta)),
+                mimetype="text/csv",
+                headers={
+                    "Content-Disposition": "attachment; filename=lista-compras.csv"
+                },
+            )
+
+        return [
+            dict(zip(self.columnas_csv, self.convertir_fila_util(fila)))
+            for fila in consulta
+        ]
+
+    def filtro_solicitud_util(self):
+        # Se puede pedir la lista de varios menús (?menus=1,2) o de los menús que
+        # se cruzan con un rango de fechas (?fecha_inicial=...&fecha_final=...)
+        menus = request.args.get("menus")
+        fecha_inicial = request.args.get("fecha_inicial")
+        fecha_final = request.args.get("fecha_final")
+        if menus:
+            try:
+                ids_menus = [int(id_menu) for id_menu in menus.split(",")]
+            except ValueError:
+                raise ValueError("Los menus deben ser ids separados por coma")
+            return MenuSemana.id.in_(ids_menus)
+        if fecha_inicial and fecha_final:
+            fecha_inicial = datetime.strptime(fecha_inicial, "%Y-%m-%d").date()
+            fecha_final = datetime.strptime(fecha_final, "%Y-%m-%d").date()
+            return and_(
+                MenuSemana.fecha_inicial <= fecha_final,
+                MenuSemana.fecha_final >= fecha_inicial,
+            )
+        raise ValueError("Se deben indicar los menus o un rango de fechas")
+
+    def convertir_fila_util(self, fila):
+        id_ingrediente, nombre, unidad, sitio, cantidad, costo, calorias = fila
+        return [
+            id_ingrediente,
+            nombre,
+            unidad,
+            sitio,
+            float(cantidad or 0),
+            float(costo or 0),
+            float(calorias or 0),
+        ]
+
+    def generar_csv_util(self, consulta):
+        salida = io.StringIO()
+        escritor = csv.writer(salida)
+        filas = itertools.chain(
+            [self.columnas_csv],
+            (self.convertir_fila_util(fila) for fila in consulta.yield_per(500)),
+        )
+        for fila in filas:
+            escritor.writerow(fila)
+            yield salida.getvalue()
+            salida.seek(0)
+            salida.truncate(0)
 
 
 class VistaChef(Resource):
     @jwt_required()
     def post(self, id_usuario):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
+        usuario = hechos_usuario_util(id_usuario)
 
         if usuario is None:
             return "El Administrador no existe", 404
@@ -465,7 +1546,7 @@ class VistaChef(Resource):
 class VistaDetalleChef(Resource):
     @jwt_required()
     def get(self, id_usuario, id_chef):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
+        usuario = hechos_usuario_util(id_usuario)
 
         if usuario is None:
             return "El Administrador no existe", 404
@@ -473,37 +1554,64 @@ class VistaDetalleChef(Resource):
             return "Solo los Administradores pueden ver el detalle del Chef", 401
 
         chef = Usuario.query.filter(Usuario.id == id_chef).first()
-        return usuario_schema.dump(chef)
+        return schemas.usuario.dump(chef)
 
 
 class VistaChefs(Resource):
     @jwt_required()
     def get(self, id_usuario):
-        usuario = Usuario.query.filter(Usuario.id == id_usuario).first()
+        usuario = hechos_usuario_util(id_usuario)
         if usuario is None:
             return "El usuario no existe", 404
         elif usuario.rol != Rol.ADMINISTRADOR:
             return "Solo los Administradores pueden ver Chefs", 401
 
-        restaurantes_usuario = Restaurante.query.filter_by(
-            administrador_id=id_usuario
-        ).all()
+        campos = leer_campos_util()
+        try:
+            paginacion = Paginacion.desde_solicitud(ordenes=("nombre", "id"))
+            schema_chef = schema_proyectado_util(
+                schemas.usuario, campos, campos_extra=("restaurante",)
+            )
+        except ValueError as e:
+            return str(e), 400
+
+        resumen = request.args.get("restaurante") == "resumen"
+        consulta_restaurantes = Restaurante.query.filter_by(administrador_id=id_usuario)
+        if not resumen:
+            consulta_restaurantes = consulta_restaurantes.options(
+                selectinload(Restaurante.chefs).selectinload(Usuario.recetas),
+                selectinload(Restaurante.chefs).selectinload(Usuario.menu_semana),
+                selectinload(Restaurante.menu_semana).selectinload(MenuSemana.recetas),
+            )
+        restaurantes_usuario = consulta_restaurantes.all()
 
-        chefs = (
+        chefs = paginacion.aplicar(
             Usuario.query.filter(
                 Usuario.restaurante_id.in_(
                     [restaurante.id for restaurante in restaurantes_usuario]
                 ),
                 Usuario.rol == Rol.CHEF,
-            )
-            .order_by(Usuario.nombre)
-            .all()
+            ).options(selectinload(Usuario.recetas), selectinload(Usuario.menu_semana)),
+            Usuario.id,
+            Usuario.nombre,
         )
 
-        resultados = [usuario_schema.dump(chef) for chef in chefs]
+        # Cada restaurante se serializa una sola vez y se comparte entre sus chefs
+        schema = schemas.restaurante_resumen if resumen else schemas.restaurante
+        incluir_restaurante = incluir_campo_util(campos, "restaurante")
+        restaurantes_por_id = {}
+        if incluir_restaurante:
+            ids_restaurantes_chefs = {chef.restaurante_id for chef in chefs}
+            serializador_restaurante = serializador_para(schema)
+            restaurantes_por_id = {
+                restaurante.id: serializador_restaurante.serializar_uno(restaurante)
+                for restaurante in restaurantes_usuario
+                if restaurante.id in ids_restaurantes_chefs
+            }
 
-        for chef in resultados:
-            restaurante = Restaurante.query.filter_by(id=chef["restaurantes"]).first()
-            chef["restaurante"] = restaurante_schema.dump(restaurante)
+        resultados = serializador_para(schema_chef).serializar(chefs)
+        if incluir_restaurante:
+            for chef, chef_final in zip(chefs, resultados):
+                chef_final["restaurante"] = restaurantes_por_id.get(chef.restaurante_id)
 
-        return resultados
+        return paginacion.respuesta(resultados)